@@ -0,0 +1,121 @@
+"""
+Benchmark ModerationDatabase - connessioni persistenti vs open-per-call
+
+Confronta le operazioni/secondo del connection manager (1 writer + pool di reader, WAL)
+con il vecchio comportamento che apriva e chiudeva una connessione ad ogni chiamata.
+
+Uso:
+    python benchmarks/bench_mod_database.py [--ops 2000] [--threads 4]
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plugins.utils.mod_database import ModerationDatabase  # noqa: E402
+
+
+class LegacyDatabase:
+    """Replica del vecchio accesso: una connessione nuova per ogni operazione"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def _get_connection(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def add_warn(self, user_id, moderator_id, guild_id, reason=None):
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "INSERT INTO warns (user_id, moderator_id, guild_id, reason) VALUES (?, ?, ?, ?)",
+            (user_id, moderator_id, guild_id, reason),
+        )
+        warn_id = cursor.lastrowid
+        cursor.execute(
+            "INSERT INTO mod_log (action_type, user_id, moderator_id, guild_id, details) VALUES (?, ?, ?, ?, ?)",
+            ("WARN", user_id, moderator_id, guild_id, f"Warn #{warn_id}: {reason}"),
+        )
+        conn.commit()
+        conn.close()
+        return warn_id
+
+    def get_warn_count(self, user_id, guild_id):
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COUNT(*) as count FROM warns WHERE user_id = ? AND guild_id = ?",
+            (user_id, guild_id),
+        )
+        count = cursor.fetchone()["count"]
+        conn.close()
+        return count
+
+
+def _run(label: str, db, ops: int, threads: int) -> dict:
+    """Esegue un mix 1 scrittura / 4 letture distribuito su più thread"""
+    per_thread = max(1, ops // threads)
+    errors = []
+
+    def worker(tid: int):
+        try:
+            for i in range(per_thread):
+                user_id = (tid * per_thread + i) % 500
+                if i % 5 == 0:
+                    db.add_warn(user_id, 1, 1, "bench")
+                else:
+                    db.get_warn_count(user_id, 1)
+        except Exception as e:  # pragma: no cover - solo reporting
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+
+    total = per_thread * threads
+    return {
+        "label": label,
+        "ops": total,
+        "seconds": round(elapsed, 4),
+        "ops_per_sec": round(total / elapsed, 1) if elapsed else 0.0,
+        "errors": len(errors),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ModerationDatabase")
+    parser.add_argument("--ops", type=int, default=2000, help="Operazioni totali per scenario")
+    parser.add_argument("--threads", type=int, default=4, help="Thread concorrenti")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Baseline: schema creato da ModerationDatabase, accesso open-per-call
+        legacy_path = os.path.join(tmp, "legacy", "moderation.db")
+        ModerationDatabase(legacy_path).close()
+        legacy = _run("open-per-call", LegacyDatabase(legacy_path), args.ops, args.threads)
+
+        pooled_db = ModerationDatabase(os.path.join(tmp, "pooled", "moderation.db"))
+        pooled = _run("pooled", pooled_db, args.ops, args.threads)
+        pooled_db.close()
+
+    for result in (legacy, pooled):
+        print(f"{result['label']:<15} {result['ops']:>7} ops  {result['seconds']:>8.3f}s  "
+              f"{result['ops_per_sec']:>10.1f} ops/s  errors={result['errors']}")
+    if legacy["ops_per_sec"]:
+        print(f"speedup: x{pooled['ops_per_sec'] / legacy['ops_per_sec']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
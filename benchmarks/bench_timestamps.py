@@ -0,0 +1,155 @@
+"""
+Benchmark timestamp - DATETIME testuale vs INTEGER in millisecondi epoch
+
+Costruisce due tabelle bans identiche (stessi dati e indici), una con timestamp/expires_at
+testuali come li scriveva l'adapter sqlite3, l'altra con interi in ms (migrazione 3), e confronta:
+dimensione del file, query di scadenza (cleanup) e range "in scadenza a breve".
+
+Uso:
+    python benchmarks/bench_timestamps.py [--rows 200000] [--queries 500]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plugins.utils.epoch import sql_text_to_ms, to_epoch_ms  # noqa: E402
+
+SCHEMA = """
+    CREATE TABLE bans (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        moderator_id INTEGER NOT NULL,
+        guild_id INTEGER NOT NULL,
+        reason TEXT,
+        duration INTEGER,
+        expires_at {type},
+        timestamp {type},
+        active BOOLEAN DEFAULT 1
+    );
+    CREATE INDEX idx_bans_guild_user_ts ON bans (guild_id, user_id, timestamp);
+    CREATE INDEX idx_bans_expiry ON bans (expires_at) WHERE active = 1 AND expires_at IS NOT NULL;
+"""
+
+EXPIRED = "SELECT COUNT(*) FROM bans WHERE active = 1 AND expires_at IS NOT NULL AND expires_at <= ?"
+EXPIRING = ("SELECT id, expires_at FROM bans WHERE active = 1 AND expires_at IS NOT NULL "
+            "AND expires_at > ? AND expires_at <= ? ORDER BY expires_at")
+
+
+def _build(path: str, rows: int, as_text: bool):
+    """Stessi dati (seed fisso) nei due formati"""
+    rng = random.Random(42)
+    base = datetime.now()
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA.format(type="DATETIME" if as_text else "INTEGER"))
+
+    batch = []
+    for i in range(rows):
+        created = base - timedelta(seconds=rng.randint(0, 365 * 86400))
+        duration = rng.choice((None, 3600, 86400, 7 * 86400))
+        expires = created + timedelta(seconds=duration) if duration else None
+        if as_text:
+            # Come prima: expires_at datetime locale, timestamp CURRENT_TIMESTAMP (UTC)
+            stamp = (created - (created.astimezone().utcoffset() or timedelta())).strftime("%Y-%m-%d %H:%M:%S")
+            values = (expires, stamp)
+        else:
+            values = (to_epoch_ms(expires), to_epoch_ms(created))
+        batch.append((rng.randint(1, 50000), 1, rng.randint(1, 50), "bench", duration, *values,
+                      1 if rng.random() < 0.3 else 0))
+        if len(batch) >= 10000:
+            conn.executemany("INSERT INTO bans (user_id, moderator_id, guild_id, reason, duration, "
+                             "expires_at, timestamp, active) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+            batch.clear()
+    if batch:
+        conn.executemany("INSERT INTO bans (user_id, moderator_id, guild_id, reason, duration, "
+                         "expires_at, timestamp, active) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", batch)
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.execute("ANALYZE")
+    return conn
+
+
+def _time_queries(conn: sqlite3.Connection, as_text: bool, queries: int) -> dict:
+    rng = random.Random(7)
+    now = datetime.now()
+
+    def param(dt: datetime):
+        return dt if as_text else to_epoch_ms(dt)
+
+    started = time.perf_counter()
+    for _ in range(queries):
+        conn.execute(EXPIRED, (param(now - timedelta(days=rng.randint(0, 365))),)).fetchone()
+    expired_ms = (time.perf_counter() - started) * 1000 / queries
+
+    started = time.perf_counter()
+    for _ in range(queries):
+        low = now - timedelta(days=rng.randint(0, 365))
+        conn.execute(EXPIRING, (param(low), param(low + timedelta(hours=1)))).fetchall()
+    expiring_ms = (time.perf_counter() - started) * 1000 / queries
+
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {EXPIRED}", (param(now),)).fetchall()
+    return {
+        "bytes": page_size * page_count,
+        "expired_ms": expired_ms,
+        "expiring_ms": expiring_ms,
+        "plan": " | ".join(row[3] for row in plan),
+    }
+
+
+def _time_conversion(path: str) -> float:
+    """Tempo della conversione in place (stessa espressione del backfill della migrazione 3)"""
+    conn = sqlite3.connect(path)
+    started = time.perf_counter()
+    max_rowid = conn.execute("SELECT MAX(rowid) FROM bans").fetchone()[0] or 0
+    for low in range(0, max_rowid, 5000):
+        conn.execute(f"""
+            UPDATE bans SET timestamp = {sql_text_to_ms('timestamp')},
+                            expires_at = {sql_text_to_ms('expires_at', local=True)}
+            WHERE rowid > ? AND rowid <= ? AND typeof(timestamp) = 'text'
+        """, (low, low + 5000))
+        conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark timestamp testuali vs interi")
+    parser.add_argument("--rows", type=int, default=200000, help="Righe nella tabella bans")
+    parser.add_argument("--queries", type=int, default=500, help="Query per scenario")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for label, as_text in (("DATETIME text", True), ("INTEGER ms", False)):
+            path = os.path.join(tmp, f"{'text' if as_text else 'int'}.db")
+            conn = _build(path, args.rows, as_text)
+            results[label] = _time_queries(conn, as_text, args.queries)
+            conn.close()
+        conversion = _time_conversion(os.path.join(tmp, "text.db"))
+
+    for label, result in results.items():
+        print(f"{label:<14} {result['bytes'] / 1024 / 1024:>7.2f} MiB  "
+              f"{result['bytes'] / args.rows:>6.1f} B/riga  "
+              f"scaduti {result['expired_ms']:>7.3f} ms  "
+              f"in scadenza {result['expiring_ms']:>7.3f} ms")
+        print(f"{'':<14} plan: {result['plan']}")
+
+    text, ints = results["DATETIME text"], results["INTEGER ms"]
+    print(f"dimensione: -{(1 - ints['bytes'] / text['bytes']) * 100:.1f}%  "
+          f"scaduti: x{text['expired_ms'] / ints['expired_ms']:.2f}  "
+          f"in scadenza: x{text['expiring_ms'] / ints['expiring_ms']:.2f}")
+    print(f"conversione in place di {args.rows} righe: {conversion:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Benchmark di carico ModerationDatabase - workload misto con latenze p50/p95/p99
+
+Popola un database con guild, utenti e uno storico sintetico di più anni, poi esegue
+un mix configurabile di add_warn / get_warn_count / get_user_history / cleanup_expired
+su più thread e riporta ops/sec e percentili di latenza per operazione.
+Il risultato è JSON, da confrontare tra commit diversi con --compare.
+
+Uso:
+    python benchmarks/bench_workload.py [--ops 20000] [--threads 8] [--json result.json]
+    python benchmarks/bench_workload.py --mix add_warn=20,get_warn_count=70,get_user_history=10
+    python benchmarks/bench_workload.py --json new.json --compare old.json
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plugins.utils.epoch import now_ms  # noqa: E402
+from plugins.utils.mod_database import ModerationDatabase  # noqa: E402
+
+DEFAULT_MIX = "add_warn=15,get_warn_count=60,get_user_history=20,cleanup_expired=5"
+DAY_MS = 86_400_000
+
+
+def _parse_mix(text: str) -> Dict[str, int]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise SystemExit(f"Operazione sconosciuta nel mix: {name} (valide: {', '.join(OPERATIONS)})")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def seed(db: ModerationDatabase, guilds: int, users: int, years: float, rows: int, rng: random.Random):
+    """Storico sintetico: warn, ban, mute, kick e mod_log distribuiti su `years` anni"""
+    now = now_ms()
+    span = int(years * 365 * DAY_MS)
+    per_table = {"warns": rows // 2, "kicks": rows // 6, "bans": rows // 6, "mutes": rows - rows // 2 - 2 * (rows // 6)}
+
+    def actor():
+        return rng.randint(1, users), rng.randint(1, 50), rng.randint(1, guilds), now - rng.randint(0, span)
+
+    with db._pool.write() as conn:
+        for table, count in per_table.items():
+            batch, logs = [], []
+            for _ in range(count):
+                user_id, moderator_id, guild_id, timestamp = actor()
+                reason = f"seed {table} {rng.randint(1, 1000)}"
+                if table in ("bans", "mutes"):
+                    duration = rng.choice((None, 3600, DAY_MS // 1000, 30 * DAY_MS // 1000))
+                    expires_at = timestamp + duration * 1000 if duration else None
+                    # Le punizioni più vecchie sono quasi tutte già revocate
+                    active = 1 if timestamp > now - 30 * DAY_MS or rng.random() < 0.05 else 0
+                    batch.append((user_id, moderator_id, guild_id, reason, duration, expires_at, timestamp, active))
+                else:
+                    batch.append((user_id, moderator_id, guild_id, reason, timestamp))
+                logs.append((table[:-1].upper(), user_id, moderator_id, guild_id, reason, timestamp))
+
+            if table in ("bans", "mutes"):
+                conn.executemany(f"""
+                    INSERT INTO {table} (user_id, moderator_id, guild_id, reason, duration, expires_at, timestamp, active)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, batch)
+            else:
+                conn.executemany(f"""
+                    INSERT INTO {table} (user_id, moderator_id, guild_id, reason, timestamp)
+                    VALUES (?, ?, ?, ?, ?)
+                """, batch)
+            conn.executemany("""
+                INSERT INTO mod_log (action_type, user_id, moderator_id, guild_id, details, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, logs)
+        conn.execute("ANALYZE")
+
+
+# Operazione -> funzione (db, rng, guilds, users)
+OPERATIONS = {
+    "add_warn": lambda db, rng, g, u: db.add_warn(rng.randint(1, u), 1, rng.randint(1, g), "bench"),
+    "get_warn_count": lambda db, rng, g, u: db.get_warn_count(rng.randint(1, u), rng.randint(1, g)),
+    "get_user_history": lambda db, rng, g, u: db.get_user_history(rng.randint(1, u), rng.randint(1, g)),
+    "get_user_history_page": lambda db, rng, g, u: db.get_user_history_page(rng.randint(1, u), rng.randint(1, g)),
+    "cleanup_expired": lambda db, rng, g, u: db.cleanup_expired(),
+}
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    """Percentile nearest-rank su una lista già ordinata"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def run_workload(db: ModerationDatabase, mix: Dict[str, int], ops: int, threads: int,
+                 guilds: int, users: int, seed_value: int) -> Dict:
+    """Esegue il mix su `threads` thread e raccoglie le latenze per operazione"""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    per_thread = max(1, ops // threads)
+    latencies: Dict[str, List[float]] = {name: [] for name in names}
+    errors: List[str] = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(threads)
+
+    def worker(tid: int):
+        rng = random.Random(seed_value * 1000 + tid)
+        local: Dict[str, List[float]] = {name: [] for name in names}
+        start_barrier.wait()
+        for name in rng.choices(names, weights, k=per_thread):
+            started = time.perf_counter_ns()
+            try:
+                OPERATIONS[name](db, rng, guilds, users)
+            except Exception as e:  # pragma: no cover - solo reporting
+                with lock:
+                    errors.append(f"{name}: {e}")
+                continue
+            local[name].append((time.perf_counter_ns() - started) / 1e6)
+        with lock:
+            for name, values in local.items():
+                latencies[name] += values
+
+    workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    started = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for name, values in latencies.items():
+        values.sort()
+        results[name] = {
+            "count": len(values),
+            "mean_ms": round(sum(values) / len(values), 4) if values else 0.0,
+            "p50_ms": round(_percentile(values, 50), 4),
+            "p95_ms": round(_percentile(values, 95), 4),
+            "p99_ms": round(_percentile(values, 99), 4),
+            "max_ms": round(values[-1], 4) if values else 0.0,
+        }
+    total = sum(len(values) for values in latencies.values())
+    return {
+        "operations": results,
+        "total": {
+            "ops": total,
+            "seconds": round(elapsed, 4),
+            "ops_per_sec": round(total / elapsed, 1) if elapsed else 0.0,
+            "errors": len(errors),
+            "first_errors": errors[:5],
+        },
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+            cwd=os.path.dirname(os.path.abspath(__file__)), text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _compare(current: Dict, baseline: Dict):
+    """Stampa la variazione percentuale rispetto a un risultato precedente"""
+    def delta(new, old):
+        return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+    print(f"\nconfronto con {baseline['meta'].get('commit', '?')}:")
+    print(f"  ops/sec {delta(current['total']['ops_per_sec'], baseline['total']['ops_per_sec'])}")
+    for name, stats in current["operations"].items():
+        old = baseline["operations"].get(name)
+        if not old:
+            continue
+        print(f"  {name:<22} p50 {delta(stats['p50_ms'], old['p50_ms']):>8}  "
+              f"p95 {delta(stats['p95_ms'], old['p95_ms']):>8}  p99 {delta(stats['p99_ms'], old['p99_ms']):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Workload misto su ModerationDatabase")
+    parser.add_argument("--guilds", type=int, default=20, help="Guild sintetiche")
+    parser.add_argument("--users", type=int, default=5000, help="Utenti sintetici")
+    parser.add_argument("--years", type=float, default=3, help="Anni di storico")
+    parser.add_argument("--rows", type=int, default=200000, help="Righe di storico (tutte le tabelle)")
+    parser.add_argument("--ops", type=int, default=20000, help="Operazioni totali")
+    parser.add_argument("--threads", type=int, default=8, help="Thread concorrenti")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Pesi del mix (default {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=1, help="Seed del generatore")
+    parser.add_argument("--warn-cache", type=int, default=50000, help="Entry della cache warn (0 = off)")
+    parser.add_argument("--write-behind", action="store_true", help="Abilita il write-behind di mod_log")
+    parser.add_argument("--json", help="Scrive il risultato JSON in questo file (default stdout)")
+    parser.add_argument("--compare", help="Risultato JSON precedente da confrontare")
+    args = parser.parse_args()
+
+    mix = _parse_mix(args.mix)
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = ModerationDatabase(os.path.join(tmp, "moderation.db"), max_readers=args.threads,
+                                warn_cache_size=args.warn_cache,
+                                write_behind={} if args.write_behind else None)
+        try:
+            started = time.perf_counter()
+            seed(db, args.guilds, args.users, args.years, args.rows, rng)
+            seed_seconds = time.perf_counter() - started
+            result = run_workload(db, mix, args.ops, args.threads, args.guilds, args.users, args.seed)
+        finally:
+            db.close()
+
+    result["meta"] = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "seed_seconds": round(seed_seconds, 3),
+        "params": {key: value for key, value in vars(args).items() if key not in ("json", "compare")},
+    }
+
+    output = json.dumps(result, indent=2)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        total = result["total"]
+        print(f"{total['ops']} ops in {total['seconds']}s ({total['ops_per_sec']} ops/s, errors={total['errors']})")
+        for name, stats in result["operations"].items():
+            print(f"  {name:<22} n={stats['count']:<6} p50 {stats['p50_ms']:.3f}ms  "
+                  f"p95 {stats['p95_ms']:.3f}ms  p99 {stats['p99_ms']:.3f}ms")
+        print(f"-> {args.json}")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            _compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
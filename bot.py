@@ -12,17 +12,38 @@ import platform
 import psutil
 import asyncio
 from datetime import datetime, timedelta
-from typing import Optional, Dict
-from collections import defaultdict
+from typing import Optional, Dict, Any
 from utils.loader import PluginLoader
 from utils.config_validator import ConfigValidator
+from utils.intents import describe_intents, resolve_bot_options
+from utils.cluster import ClusterClient, ClusterLauncher, parse_cluster_args
+from utils.population import PopulationTracker
+from utils.system_metrics import SystemMetricsSampler
+from utils.latency import CommandLatencyTracker
+from utils.metrics import MetricsExporter
+from utils.loop_monitor import LoopMonitor
 from utils.language_manager import init_language, get_text
 
 
+class LatencyCommandTree(discord.app_commands.CommandTree):
+    """CommandTree che avvia la misura di latenza di ogni interaction (tracker assegnato da DiscordBot)"""
+    
+    latency_tracker: Optional[CommandLatencyTracker] = None
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if self.latency_tracker is not None:
+            self.latency_tracker.start_interaction(interaction)
+        return await super().interaction_check(interaction)
+
+
 class DiscordBot:
     """Bot Discord Super Potente con sistema di plugin modulare e monitoring avanzato"""
     
-    def __init__(self):
+    def __init__(self, cluster: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            cluster: Se avviato dal ClusterLauncher: {"cluster_id", "shard_ids", "shard_count"}
+        """
         # Carica configurazione (prima per ottenere la lingua)
         self.config = self.load_config()
         
@@ -45,27 +66,75 @@ class DiscordBot:
             "guilds_left": 0
         }
         
-        # Performance tracking
-        self.command_timings = defaultdict(list)
-        
-        # Configura intents (TUTTI per massima compatibilità)
-        intents = discord.Intents.all()
+        # Performance tracking: istogrammi di latenza a memoria fissa per comando/plugin
+        self.command_latency = CommandLatencyTracker()
+        
+        # Server/membri/utenti unici aggiornati dagli eventi (niente scansione della cache)
+        self.population = PopulationTracker.from_config(self.config)
+        self._population_rebuild: Optional[asyncio.Task] = None
+        
+        # CPU/RAM/fd/thread campionati su un thread dedicato (mai psutil bloccante nel loop)
+        self.system_metrics = SystemMetricsSampler.from_config(self.config)
+        self.system_metrics.start()
+        
+        # Lag del loop e blocchi attribuiti a coroutine/plugin (avviato in start_background_tasks)
+        self.loop_monitor = LoopMonitor.from_config(self.config)
+        
+        # Endpoint Prometheus (creato in start() se abilitato in config)
+        self.metrics: Optional[MetricsExporter] = None
+        
+        # Inizializza il loader (prima del bot: i plugin dichiarano gli intents che usano)
+        self.loader = PluginLoader()
+        
+        # Intents e cache minimi: profilo in config.json + unione degli intents dei plugin abilitati
+        bot_options = resolve_bot_options(self.config, self.loader.collect_required_intents())
+        enabled_intents = describe_intents(bot_options["intents"])
+        print(f"🔐 {get_text('bot.intents.summary', intents=', '.join(enabled_intents['enabled']))}")
+        if enabled_intents["privileged"]:
+            print(f"   {get_text('bot.intents.privileged', intents=', '.join(enabled_intents['privileged']))}")
+        # Utenti unici ed eventi membri di PopulationTracker: servono members e la lista membri completa
+        if not (bot_options["intents"].members and bot_options["chunk_guilds_at_startup"]):
+            print(f"⚠️  {get_text('bot.intents.population_fallback', mode=self.population.mode)}")
+        
+        # Sharding: AutoShardedBot (un processo) o intervallo di shard assegnato dal launcher
+        self.cluster_info = cluster
+        self.cluster: Optional[ClusterClient] = None
+        bot_class = commands.Bot
+        sharding = self.config.get("sharding", {})
+        if cluster is not None:
+            bot_class = commands.AutoShardedBot
+            bot_options.update(shard_ids=cluster["shard_ids"], shard_count=cluster["shard_count"])
+            print(f"🧩 {get_text('bot.sharding.cluster', id=cluster['cluster_id'], first=cluster['shard_ids'][0], last=cluster['shard_ids'][-1], count=cluster['shard_count'])}")
+        elif sharding.get("mode", "none") == "auto":
+            bot_class = commands.AutoShardedBot
+            shard_count = str(sharding.get("shard_count", "auto"))
+            if shard_count.isdigit() and int(shard_count) > 0:
+                bot_options["shard_count"] = int(shard_count)
+            print(f"🧩 {get_text('bot.sharding.auto', count=bot_options.get('shard_count', 'auto'))}")
         
         # Crea il bot con configurazioni avanzate
-        self.bot = commands.Bot(
+        self.bot = bot_class(
             command_prefix=self._dynamic_prefix,  # Prefix dinamico
-            intents=intents,
             help_command=None,  # Disabled - using custom help in admin plugin
             case_insensitive=True,  # Comandi case-insensitive
             strip_after_prefix=True,
-            owner_id=self._get_owner_id()
+            owner_id=self._get_owner_id(),
+            tree_cls=LatencyCommandTree,  # Latenza di slash command e context menu
+            **bot_options
         )
+        self.bot.tree.latency_tracker = self.command_latency
+        self.loader.bot = self.bot
+        
+        # Canale IPC col launcher (solo se questo processo è un cluster)
+        if cluster is not None:
+            self.cluster = ClusterClient.from_env(
+                cluster["cluster_id"], self._cluster_stats, self.bot.close,
+                stats_interval=float(sharding.get("stats_interval", 30))
+            )
         
-        # Inizializza il loader
-        self.loader = PluginLoader(self.bot)
-        
-        # Registra eventi
+        # Registra eventi e comandi owner del core
         self.setup_events()
+        self.setup_owner_commands()
         
         # I task in background verranno avviati in on_ready per evitare errori di loop
     
@@ -106,6 +175,8 @@ class DiscordBot:
         """Avvia task in background per monitoring"""
         self.status_rotation.start()
         self.stats_logger.start()
+        if self.loop_monitor is not None:
+            self.loop_monitor.start()
     
     @tasks.loop(minutes=5)
     async def status_rotation(self):
@@ -114,7 +185,7 @@ class DiscordBot:
         
         statuses = [
             discord.Game(name=f"{self.config.get('prefix', '!')}help | {len(self.bot.guilds)} servers"),
-            discord.Activity(type=discord.ActivityType.watching, name=f"{len(set(self.bot.get_all_members()))} users"),
+            discord.Activity(type=discord.ActivityType.watching, name=f"{self.population.user_count} users"),
             discord.Activity(type=discord.ActivityType.listening, name="/help"),
             discord.Game(name=f"Uptime: {self._get_uptime()}")
         ]
@@ -132,10 +203,16 @@ class DiscordBot:
         print(f"\n📊 {get_text('stats.title')} ({datetime.now().strftime('%H:%M:%S')})")
         print(f"├─ {get_text('stats.uptime')}: {uptime}")
         print(f"├─ {get_text('stats.servers_count')}: {len(self.bot.guilds)}")
-        print(f"├─ {get_text('stats.users_count')}: {len(set(self.bot.get_all_members()))}")
+        print(f"├─ {get_text('stats.users_count')}: {self.population.user_count}")
         print(f"├─ {get_text('stats.commands_executed')}: {self.stats['commands_executed']}")
         print(f"├─ {get_text('stats.messages_seen')}: {self.stats['messages_seen']}")
         print(f"├─ {get_text('stats.errors_count')}: {self.stats['errors']}")
+        latency = self.command_latency.overall_stats()
+        if latency["count"]:
+            print(f"├─ {get_text('stats.command_latency')}: p50 {latency['p50_ms']}ms | p95 {latency['p95_ms']}ms | p99 {latency['p99_ms']}ms")
+        sys_info = self._get_system_info()
+        print(f"├─ {get_text('stats.system')}: CPU {sys_info['cpu']} | RAM {sys_info['ram']} ({sys_info['ram_used']}/{sys_info['ram_total']})")
+        print(f"├─ {get_text('stats.process')}: RSS {sys_info['rss']} | threads {sys_info['threads']} | fd {sys_info['fds']}")
         print(f"└─ {get_text('stats.latency')}: {round(self.bot.latency * 1000)}ms\n")
     
     def _get_uptime(self) -> str:
@@ -152,16 +229,33 @@ class DiscordBot:
         else:
             return f"{minutes}m {seconds}s"
     
+    def _cluster_stats(self) -> Dict[str, Any]:
+        """Statistiche di questo processo inviate al launcher (aggregate su tutti i cluster)"""
+        latencies = getattr(self.bot, "latencies", [(0, self.bot.latency)])
+        return {
+            "guilds": len(self.bot.guilds),
+            "users": self.population.user_count,
+            "commands_executed": self.stats["commands_executed"],
+            "messages_seen": self.stats["messages_seen"],
+            "errors": self.stats["errors"],
+            "latencies": {str(shard_id): round(latency * 1000) for shard_id, latency in latencies},
+        }
+    
     def _get_system_info(self) -> Dict:
-        """Ottieni informazioni di sistema"""
-        cpu_percent = psutil.cpu_percent(interval=1)
-        memory = psutil.virtual_memory()
+        """Ottieni informazioni di sistema (ultimo campione del sampler, non blocca il loop)"""
+        sample = self.system_metrics.snapshot()
+        if not sample:
+            return {key: "n/a" for key in ("cpu", "ram", "ram_used", "ram_total", "rss", "fds", "threads", "processes")}
         
         return {
-            "cpu": f"{cpu_percent}%",
-            "ram": f"{memory.percent}%",
-            "ram_used": f"{memory.used / (1024**3):.1f}GB",
-            "ram_total": f"{memory.total / (1024**3):.1f}GB"
+            "cpu": f"{sample['cpu']}%",
+            "ram": f"{sample['ram']}%",
+            "ram_used": f"{sample['ram_used'] / (1024**3):.1f}GB",
+            "ram_total": f"{sample['ram_total'] / (1024**3):.1f}GB",
+            "rss": f"{sample['rss'] / (1024**2):.0f}MB",
+            "fds": sample["fds"],
+            "threads": sample["threads"],
+            "processes": sample["processes"]
         }
     
     def setup_events(self):
@@ -172,6 +266,14 @@ class DiscordBot:
             # Avvia task background (se non già avviati)
             if not self.status_rotation.is_running():
                 self.start_background_tasks()
+            
+            # Conteggi per server subito, utenti unici in background a blocchi.
+            # on_ready si ripete a ogni riconnessione: la ricostruzione precedente va annullata
+            previous = self._population_rebuild
+            if previous is not None and not previous.done():
+                previous.cancel()
+                await asyncio.gather(previous, return_exceptions=True)
+            self._population_rebuild = asyncio.create_task(self.population.rebuild(self.bot.guilds))
 
             # ANSI Colors
             RESET = "\033[0m"
@@ -192,7 +294,7 @@ class DiscordBot:
             print(f"{YELLOW}├─{RESET} {get_text('system.bot_info.username')}: {GREEN}{BOLD}{self.bot.user.name}#{self.bot.user.discriminator}{RESET}")
             print(f"{YELLOW}├─{RESET} {get_text('system.bot_info.id')}: {GREEN}{self.bot.user.id}{RESET}")
             print(f"{YELLOW}├─{RESET} {get_text('system.bot_info.servers')}: {GREEN}{BOLD}{len(self.bot.guilds)}{RESET}")
-            print(f"{YELLOW}├─{RESET} {get_text('system.bot_info.users')}: {GREEN}{BOLD}{len(set(self.bot.get_all_members()))}{RESET}")
+            print(f"{YELLOW}├─{RESET} {get_text('system.bot_info.users')}: {GREEN}{BOLD}{self.population.user_count}{RESET}")
             print(f"{YELLOW}├─{RESET} {get_text('system.bot_info.plugins')}: {GREEN}{BOLD}{len(self.bot.cogs)}{RESET}")
             print(f"{YELLOW}├─{RESET} {get_text('system.bot_info.text_commands')}: {GREEN}{BOLD}{len([c for c in self.bot.commands])}{RESET}")
             print(f"{YELLOW}├─{RESET} {get_text('system.bot_info.slash_commands')}: {GREEN}{BOLD}{len(self.bot.tree.get_commands())}{RESET}")
@@ -203,7 +305,8 @@ class DiscordBot:
             print(f"{CYAN}{BOLD}{get_text('system.resources.title')}{RESET}")
             print(f"{BLUE}├─{RESET} CPU: {YELLOW}{sys_info['cpu']}{RESET}")
             print(f"{BLUE}├─{RESET} RAM: {YELLOW}{sys_info['ram']}{RESET} ({sys_info['ram_used']}/{sys_info['ram_total']})")
-            print(f"{BLUE}└─{RESET} {get_text('system.info.processes')}: {YELLOW}{len(psutil.pids())}{RESET}\n")
+            print(f"{BLUE}├─{RESET} {get_text('system.resources.process')}: {YELLOW}RSS {sys_info['rss']} | threads {sys_info['threads']} | fd {sys_info['fds']}{RESET}")
+            print(f"{BLUE}└─{RESET} {get_text('system.info.processes')}: {YELLOW}{sys_info['processes']}{RESET}\n")
             
             # Server List
             if len(self.bot.guilds) > 0:
@@ -260,6 +363,10 @@ class DiscordBot:
                 RED = "\033[91m"
                 print(f"{RED}❌ {get_text('commands.sync.error', error=e)}{RESET}")
             
+            # Il launcher avvia il cluster successivo solo dopo questo segnale
+            if self.cluster is not None:
+                await self.cluster.mark_ready()
+            
             print(f"{GREEN}{BOLD}{'─' * 88}{RESET}")
             print(f"{GREEN}{BOLD}{get_text('bot.startup.ready')}{RESET}".center(88 + len(RESET) + len(GREEN) + len(BOLD)))
             print(f"{GREEN}{BOLD}{'─' * 88}{RESET}\n")
@@ -285,13 +392,20 @@ class DiscordBot:
             # Log comando
             print(f"💬 {ctx.author} {get_text('commands.executed', command=ctx.command, location=ctx.guild.name if ctx.guild else 'DM')}")
         
+        # Tracking performance: comandi text (before/after invoke girano anche se il comando fallisce)
+        @self.bot.before_invoke
+        async def before_invoke(ctx):
+            self.command_latency.start(ctx)
+        
+        @self.bot.after_invoke
+        async def after_invoke(ctx):
+            self.command_latency.stop(ctx)
+        
+        # Tracking performance: slash command e context menu (inizio misurato da LatencyCommandTree)
         @self.bot.event
-        async def on_command_completion(ctx):
-            """Evento quando un comando completa con successo"""
-            # Tracking performance
-            if hasattr(ctx, 'command_start_time'):
-                elapsed = (datetime.now() - ctx.command_start_time).total_seconds()
-                self.command_timings[ctx.command.name].append(elapsed)
+        async def on_app_command_completion(interaction: discord.Interaction, command):
+            """Evento quando uno slash command completa con successo"""
+            self.command_latency.stop_interaction(interaction, command)
         
         @self.bot.event
         async def on_command_error(ctx, error):
@@ -332,6 +446,7 @@ class DiscordBot:
         async def on_app_command_error(interaction: discord.Interaction, error: discord.app_commands.AppCommandError):
             """Gestione errori globale per slash commands"""
             self.stats["errors"] += 1
+            self.command_latency.stop_interaction(interaction, failed=True)
             
             if isinstance(error, discord.app_commands.MissingPermissions):
                 await interaction.response.send_message(
@@ -363,25 +478,66 @@ class DiscordBot:
         async def on_guild_join(guild):
             """Evento quando il bot entra in un server"""
             self.stats["guilds_joined"] += 1
+            await self.population.guild_join(guild)
             print(f"➕ {get_text('servers.joined', name=guild.name, id=guild.id, members=guild.member_count)}")
         
         @self.bot.event
         async def on_guild_remove(guild):
             """Evento quando il bot viene rimosso da un server"""
             self.stats["guilds_left"] += 1
+            await self.population.guild_remove(guild)
             print(f"➖ {get_text('servers.left', name=guild.name, id=guild.id)}")
         
         @self.bot.event
         async def on_member_join(member):
             """Evento quando un membro si unisce a un server"""
+            self.population.member_join(member)
             # Log (può essere esteso con auto-role, welcome messages, etc)
             print(f"👋 {get_text('members.joined', member=member, guild=member.guild.name)}")
         
         @self.bot.event
         async def on_member_remove(member):
             """Evento quando un membro lascia un server"""
+            self.population.member_remove(member)
             print(f"👋 {get_text('members.left', member=member, guild=member.guild.name)}")
     
+    def setup_owner_commands(self):
+        """Comandi diagnostici del core, riservati all'owner del bot"""
+        
+        @self.bot.command(name="loophealth", aliases=["looplag"])
+        @commands.is_owner()
+        async def loop_health(ctx, count: int = 5):
+            """Lag dell'event loop e ultimi blocchi con coroutine, plugin e stack"""
+            if self.loop_monitor is None:
+                await ctx.send(f"⚠️ {get_text('bot.loop_monitor.disabled')}")
+                return
+            
+            summary = self.loop_monitor.summary()
+            lines = [
+                f"🩺 {get_text('bot.loop_monitor.title')}",
+                get_text('bot.loop_monitor.lag', lag=summary['lag_ms'], max_lag=summary['max_lag_ms'],
+                         stalls=summary['stalls'], threshold=summary['threshold_ms']),
+                "",
+            ]
+            stalls = self.loop_monitor.stalls(limit=max(1, min(count, 20)))
+            if not stalls:
+                lines.append(get_text('bot.loop_monitor.no_stalls'))
+            for stall in stalls:
+                when = datetime.fromtimestamp(stall["timestamp"]).strftime("%H:%M:%S")
+                state = "…" if stall["ongoing"] else ""
+                lines.append(
+                    f"[{when}] {stall['duration_ms']}ms{state} {stall['coroutine'] or '?'} "
+                    f"plugin={stall['plugin'] or 'core'} cog={stall['cog'] or '-'} ({stall['source']})"
+                )
+            if stalls:
+                # Stack del blocco più recente (frame più interni), nei limiti di un messaggio
+                lines.append("")
+                budget = 1800 - sum(len(line) + 1 for line in lines)
+                if budget > 0:
+                    lines.append("".join(stalls[0]["stack"])[-budget:])
+            
+            await ctx.send("```\n" + "\n".join(lines)[:1990] + "\n```")
+    
     async def start(self):
         """Avvia il bot e carica i plugin"""
         # Carica i plugin prima di avviare il bot
@@ -396,6 +552,18 @@ class DiscordBot:
             print()
             sys.exit(1)
         
+        if self.cluster is not None:
+            asyncio.create_task(self.cluster.run())
+        
+        # Endpoint Prometheus opzionale (stesso loop del bot)
+        self.metrics = MetricsExporter.from_config(self)
+        if self.metrics is not None:
+            try:
+                await self.metrics.start()
+            except OSError as e:
+                print(f"⚠️  {get_text('bot.metrics.failed', error=e)}")
+                self.metrics = None
+        
         # Avvia il bot
         try:
             await self.bot.start(token)
@@ -409,12 +577,23 @@ class DiscordBot:
             print(f"❌ Errore durante l'avvio del bot: {e}")
             print()
             sys.exit(1)
+        finally:
+            if self._population_rebuild is not None:
+                self._population_rebuild.cancel()
+            if self.metrics is not None:
+                await self.metrics.stop()
+            if self.loop_monitor is not None:
+                self.loop_monitor.stop()
+            self.system_metrics.stop()
 
 
     async def ui_updater_task(self, bot_queue):
         """Task per inviare aggiornamenti alla UI"""
         while not self.bot.is_closed():
             try:
+                # Metriche di sistema dal sampler (disponibili anche prima di on_ready)
+                bot_queue.put(("system", self.system_metrics.snapshot()))
+                
                 stats = {
                     "ping": round(self.bot.latency * 1000),
                     "uptime": self._get_uptime()
@@ -463,6 +642,13 @@ def run_bot_thread(bot_instance, loop):
 def main():
     """Funzione principale"""
     
+    # Processo cluster avviato dal launcher: niente updater, banner o UI (li gestisce il launcher)
+    cluster_args = parse_cluster_args(sys.argv)
+    if cluster_args is not None:
+        bot_instance = DiscordBot(cluster=cluster_args)
+        asyncio.run(bot_instance.start())
+        return
+    
     # 🌍 INIT LANGUAGE FIRST 🌍
     # Carica la lingua prima di tutto il resto per avere messaggi tradotti anche nell'updater
     try:
@@ -560,6 +746,12 @@ def main():
     
     startscreen_type = config.get("startscreen_type", "prompt")
     
+    # Modalità cluster: questo processo fa solo da launcher/supervisore dei processi bot
+    if config.get("sharding", {}).get("mode") == "cluster":
+        launcher = ClusterLauncher(config, os.path.abspath(__file__))
+        asyncio.run(launcher.run())
+        return
+    
     if startscreen_type == "UI" or startscreen_type == "ui":
         # Modalità UI
         import queue
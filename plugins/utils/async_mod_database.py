@@ -0,0 +1,363 @@
+"""
+Database manager asincrono per il plugin di moderazione
+Stessa interfaccia di ModerationDatabase, basata su aiosqlite (non blocca l'event loop)
+"""
+
+import asyncio
+import functools
+from typing import Optional, List, Dict, Any
+
+import aiosqlite
+
+from plugins.utils.epoch import now_ms
+from plugins.utils.mod_database import ModerationDatabase
+
+
+class AsyncModerationDatabase:
+    """
+    Versione asyncio di ModerationDatabase.
+
+    I metodi principali (warn, ban, mute, kick, cleanup, storico) sono implementati
+    nativamente con aiosqlite. Qualsiasi altro metodo pubblico di ModerationDatabase
+    resta disponibile come coroutine: viene eseguito in un thread tramite
+    asyncio.to_thread, così i plugin possono migrare un metodo alla volta.
+
+    Con il write-behind attivo sul database sincrono anche gli audit scritti qui passano
+    dalla sua coda: vengono scartati prima del rollback se la transazione fallisce.
+
+    Usage:
+        db = await AsyncModerationDatabase.open("data/moderation.db")
+        warn_id = await db.add_warn(user_id, moderator_id, guild_id, "Spam")
+        await db.close()
+
+        # Da un plugin che usa ancora il database sincrono
+        adb = self.db.as_async()
+        count = await adb.get_warn_count(user_id, guild_id)
+    """
+
+    def __init__(self, sync_db: ModerationDatabase):
+        self.sync = sync_db  # Database sincrono (schema, metodi non ancora migrati)
+        self.db_path = sync_db.db_path
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._connect_lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        self._queued_logs: List[int] = []  # Audit in coda write-behind della transazione corrente
+
+    @classmethod
+    async def open(cls, db_path: str = "data/moderation.db", **kwargs) -> "AsyncModerationDatabase":
+        """Crea il database (schema incluso) senza bloccare l'event loop"""
+        sync_db = await asyncio.to_thread(ModerationDatabase, db_path, **kwargs)
+        db = cls(sync_db)
+        await db.connect()
+        return db
+
+    async def connect(self) -> aiosqlite.Connection:
+        """Apre (una sola volta) la connessione aiosqlite"""
+        if self._conn is not None:
+            return self._conn
+        async with self._connect_lock:
+            if self._conn is None:
+                conn = await aiosqlite.connect(self.db_path, isolation_level=None)
+                conn.row_factory = aiosqlite.Row
+                await conn.execute("PRAGMA busy_timeout=5000")
+                await conn.execute("PRAGMA synchronous=NORMAL")
+                self._conn = conn
+        return self._conn
+
+    async def close(self, close_sync: bool = False):
+        """Chiude la connessione aiosqlite (e opzionalmente quella sincrona)"""
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+        if close_sync:
+            await asyncio.to_thread(self.sync.close)
+
+    async def __aenter__(self) -> "AsyncModerationDatabase":
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close(close_sync=True)
+
+    def __getattr__(self, name: str):
+        """Shim di compatibilità: i metodi sincroni non migrati diventano coroutine"""
+        if name.startswith("_"):
+            raise AttributeError(name)
+        attr = getattr(self.sync, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            return await asyncio.to_thread(attr, *args, **kwargs)
+
+        return wrapper
+
+    async def _fetchall(self, query: str, params: tuple = ()) -> List[Dict]:
+        conn = await self.connect()
+        async with conn.execute(query, params) as cursor:
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def _fetchone(self, query: str, params: tuple = ()) -> Optional[aiosqlite.Row]:
+        conn = await self.connect()
+        async with conn.execute(query, params) as cursor:
+            return await cursor.fetchone()
+
+    async def _begin(self) -> aiosqlite.Connection:
+        conn = await self.connect()
+        await conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    # ===== WARNS =====
+
+    async def add_warn(self, user_id: int, moderator_id: int, guild_id: int, reason: Optional[str] = None) -> int:
+        """Aggiunge un warn e ritorna l'ID"""
+        if self.sync._warn_cache is not None:
+            # La cache dei conteggi è write-through sul writer sincrono
+            return await asyncio.to_thread(self.sync.add_warn, user_id, moderator_id, guild_id, reason)
+
+        async with self._write_lock:
+            conn = await self._begin()
+            try:
+                cursor = await conn.execute("""
+                    INSERT INTO warns (user_id, moderator_id, guild_id, reason, timestamp)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (user_id, moderator_id, guild_id, reason, now_ms()))
+                warn_id = cursor.lastrowid
+
+                # Log nell'audit
+                await self._add_log(conn, "WARN", user_id, moderator_id, guild_id,
+                                    f"Warn #{warn_id}: {reason or 'Nessun motivo'}")
+                await self._commit(conn)
+            except BaseException:
+                await self._rollback(conn)
+                raise
+        return warn_id
+
+    async def remove_warn(self, warn_id: Optional[int] = None, user_id: Optional[int] = None,
+                          guild_id: Optional[int] = None) -> bool:
+        """Rimuove un warn specifico o l'ultimo warn di un utente"""
+        if self.sync._warn_cache is not None:
+            return await asyncio.to_thread(self.sync.remove_warn, warn_id, user_id, guild_id)
+
+        if warn_id:
+            query, params = "DELETE FROM warns WHERE id = ?", (warn_id,)
+        elif user_id and guild_id:
+            # Rimuovi l'ultimo warn
+            query = """
+                DELETE FROM warns WHERE id = (
+                    SELECT id FROM warns
+                    WHERE user_id = ? AND guild_id = ?
+                    ORDER BY timestamp DESC LIMIT 1
+                )
+            """
+            params = (user_id, guild_id)
+        else:
+            return False
+
+        return await self._execute_write(query, params) > 0
+
+    async def get_user_warns(self, user_id: int, guild_id: int) -> List[Dict]:
+        """Ottiene tutti i warn di un utente"""
+        return await self._fetchall("""
+            SELECT * FROM warns
+            WHERE user_id = ? AND guild_id = ?
+            ORDER BY timestamp DESC
+        """, (user_id, guild_id))
+
+    async def get_warn_count(self, user_id: int, guild_id: int) -> int:
+        """Conta i warn di un utente"""
+        if self.sync._warn_cache is not None:
+            # Hit servito in memoria; il miss carica sotto il lock del writer sincrono
+            count = self.sync._warn_cache.get(guild_id, user_id)
+            if count is not None:
+                return count
+            return await asyncio.to_thread(self.sync.get_warn_count, user_id, guild_id)
+
+        row = await self._fetchone("""
+            SELECT COUNT(*) as count FROM warns
+            WHERE user_id = ? AND guild_id = ?
+        """, (user_id, guild_id))
+        return row['count']
+
+    # ===== BANS =====
+
+    async def add_ban(self, user_id: int, moderator_id: int, guild_id: int,
+                      reason: Optional[str] = None, duration: Optional[int] = None) -> int:
+        """Aggiunge un ban (duration in secondi, None = permanente)"""
+        ban_type = "temporaneo" if duration else "permanente"
+        return await self._add_punishment("bans", "BAN", user_id, moderator_id, guild_id, reason, duration,
+                                          f"Ban {ban_type}: {reason or 'Nessun motivo'}")
+
+    async def remove_ban(self, user_id: int, guild_id: int) -> bool:
+        """Rimuove un ban (setta active = 0)"""
+        return await self._execute_write("""
+            UPDATE bans SET active = 0
+            WHERE user_id = ? AND guild_id = ? AND active = 1
+        """, (user_id, guild_id)) > 0
+
+    async def get_active_bans(self, guild_id: Optional[int] = None) -> List[Dict]:
+        """Ottiene tutti i ban attivi (opzionalmente filtrati per guild)"""
+        return await self._get_active("bans", guild_id)
+
+    # ===== MUTES =====
+
+    async def add_mute(self, user_id: int, moderator_id: int, guild_id: int,
+                       reason: Optional[str] = None, duration: Optional[int] = None) -> int:
+        """Aggiunge un mute (duration in secondi, None = permanente)"""
+        mute_type = "temporaneo" if duration else "permanente"
+        return await self._add_punishment("mutes", "MUTE", user_id, moderator_id, guild_id, reason, duration,
+                                          f"Mute {mute_type}: {reason or 'Nessun motivo'}")
+
+    async def remove_mute(self, user_id: int, guild_id: int) -> bool:
+        """Rimuove un mute (setta active = 0)"""
+        return await self._execute_write("""
+            UPDATE mutes SET active = 0
+            WHERE user_id = ? AND guild_id = ? AND active = 1
+        """, (user_id, guild_id)) > 0
+
+    async def get_active_mutes(self, guild_id: Optional[int] = None) -> List[Dict]:
+        """Ottiene tutti i mute attivi"""
+        return await self._get_active("mutes", guild_id)
+
+    # ===== KICKS =====
+
+    async def add_kick(self, user_id: int, moderator_id: int, guild_id: int,
+                       reason: Optional[str] = None) -> int:
+        """Aggiunge un kick"""
+        async with self._write_lock:
+            conn = await self._begin()
+            try:
+                cursor = await conn.execute("""
+                    INSERT INTO kicks (user_id, moderator_id, guild_id, reason, timestamp)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (user_id, moderator_id, guild_id, reason, now_ms()))
+                kick_id = cursor.lastrowid
+
+                # Log
+                await self._add_log(conn, "KICK", user_id, moderator_id, guild_id,
+                                    f"Kick: {reason or 'Nessun motivo'}")
+                await self._commit(conn)
+            except BaseException:
+                await self._rollback(conn)
+                raise
+        return kick_id
+
+    # ===== UTILITIES =====
+
+    async def _add_log(self, conn: aiosqlite.Connection, action_type: str, user_id: int,
+                       moderator_id: int, guild_id: int, details: str):
+        """Aggiunge un entry nel log di moderazione (in coda write-behind se attivo)"""
+        params = (action_type, user_id, moderator_id, guild_id, details, now_ms())
+        queue = self.sync._write_behind
+        entry_id = queue.try_enqueue(self.sync._LOG_INSERT, params) if queue is not None else None
+        if entry_id is not None:
+            self._queued_logs.append(entry_id)
+            return
+        await conn.execute(self.sync._LOG_INSERT, params)
+
+    async def _commit(self, conn: aiosqlite.Connection):
+        await conn.commit()
+        self._queued_logs.clear()
+
+    async def _rollback(self, conn: aiosqlite.Connection):
+        # Prima del rollback: finché la transazione è aperta il flusher non può scrivere
+        for entry_id in self._queued_logs:
+            self.sync._write_behind.discard(entry_id)
+        self._queued_logs.clear()
+        await conn.rollback()
+
+    async def _execute_write(self, query: str, params: tuple = ()) -> int:
+        """Esegue una singola scrittura in transazione, ritorna le righe toccate"""
+        async with self._write_lock:
+            conn = await self._begin()
+            try:
+                cursor = await conn.execute(query, params)
+                rowcount = cursor.rowcount
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+        return rowcount
+
+    async def _add_punishment(self, table: str, action_type: str, user_id: int, moderator_id: int,
+                              guild_id: int, reason: Optional[str], duration: Optional[int],
+                              details: str) -> int:
+        """Inserisce un ban/mute con scadenza opzionale e relativo log"""
+        timestamp = now_ms()
+        expires_at = timestamp + duration * 1000 if duration else None
+
+        async with self._write_lock:
+            conn = await self._begin()
+            try:
+                cursor = await conn.execute(f"""
+                    INSERT INTO {table} (user_id, moderator_id, guild_id, reason, duration, expires_at, timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, (user_id, moderator_id, guild_id, reason, duration, expires_at, timestamp))
+                punishment_id = cursor.lastrowid
+
+                await self._add_log(conn, action_type, user_id, moderator_id, guild_id, details)
+                await self._commit(conn)
+            except BaseException:
+                await self._rollback(conn)
+                raise
+
+        if expires_at is not None:
+            # Stessi listener del database sincrono (es. ExpiryScheduler)
+            self.sync._notify_expiry(action_type.lower(), punishment_id, expires_at)
+        return punishment_id
+
+    async def _get_active(self, table: str, guild_id: Optional[int]) -> List[Dict]:
+        if guild_id:
+            return await self._fetchall(f"""
+                SELECT * FROM {table}
+                WHERE guild_id = ? AND active = 1
+                ORDER BY timestamp DESC
+            """, (guild_id,))
+        return await self._fetchall(f"""
+            SELECT * FROM {table}
+            WHERE active = 1
+            ORDER BY timestamp DESC
+        """)
+
+    async def cleanup_expired(self) -> Dict[str, int]:
+        """Rimuove ban e mute scaduti, ritorna conteggi"""
+        now = now_ms()
+        expired = {}
+
+        async with self._write_lock:
+            conn = await self._begin()
+            try:
+                for table in ("bans", "mutes"):
+                    cursor = await conn.execute(f"""
+                        UPDATE {table} SET active = 0
+                        WHERE active = 1 AND expires_at IS NOT NULL AND expires_at <= ?
+                    """, (now,))
+                    expired[table] = cursor.rowcount
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+
+        return expired
+
+    async def get_user_history(self, user_id: int, guild_id: int) -> Dict[str, Any]:
+        """Ottiene tutto lo storico di moderazione di un utente"""
+        history = {}
+        for key in ("warns", "bans", "mutes", "kicks"):
+            history[key] = await self._fetchall(f"""
+                SELECT * FROM {key}
+                WHERE user_id = ? AND guild_id = ?
+                ORDER BY timestamp DESC
+            """, (user_id, guild_id))
+        return history
+
+    async def get_user_history_page(self, user_id: int, guild_id: int, limit: int = 10,
+                                    cursor: Optional[str] = None,
+                                    types: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Storico unificato e paginato (vedi ModerationDatabase.get_user_history_page)"""
+        query, params = self.sync._history_page_query(user_id, guild_id, limit, cursor, types)
+        conn = await self.connect()
+        async with conn.execute(query, params) as db_cursor:
+            rows = await db_cursor.fetchall()
+        return self.sync._history_page_result(rows, limit)
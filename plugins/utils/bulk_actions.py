@@ -0,0 +1,171 @@
+"""
+Esecuzione di azioni di moderazione di massa lato Discord (es. risposta a un raid)
+Chiamate API a ritmo controllato + registrazione nel database con le operazioni bulk
+"""
+
+import asyncio
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+import discord
+
+from plugins.utils.mod_database import ModerationDatabase
+
+
+class RateLimiter:
+    """Token bucket asincrono: al massimo `rate` chiamate al secondo, con burst iniziale"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = max(0.1, rate)
+        self.capacity = max(1, burst if burst is not None else int(self.rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class BulkModerationExecutor:
+    """
+    Applica ban/unban/mute di massa su Discord e li registra nel database.
+
+    Le chiamate API passano da un token bucket e da un semaforo (poche richieste
+    in volo), così si resta sotto i rate limit invece di accumulare 429; dove
+    disponibile usa guild.bulk_ban (fino a 200 utenti per richiesta). Solo gli
+    utenti per cui Discord ha risposto con successo vengono scritti nel DB,
+    con una sola transazione per operazione.
+
+    Usage:
+        executor = BulkModerationExecutor(db)
+        result = await executor.ban_many(guild, raid_user_ids, ctx.author.id, "Raid")
+    """
+
+    BULK_BAN_MAX = 200  # Limite di Discord per POST /guilds/{id}/bulk-ban
+
+    def __init__(self, db: ModerationDatabase, calls_per_second: float = 5.0,
+                 max_concurrency: int = 4):
+        self.db = db
+        self.limiter = RateLimiter(calls_per_second)
+        self.semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _call(self, factory: Callable[[], Awaitable[Any]]) -> Any:
+        async with self.semaphore:
+            await self.limiter.acquire()
+            return await factory()
+
+    async def _run_each(self, items: Iterable[Any],
+                        factory: Callable[[Any], Awaitable[Any]]) -> Dict[str, List]:
+        """Esegue una chiamata per elemento (a ritmo controllato), separando successi e fallimenti"""
+        items = list(items)
+        results = await asyncio.gather(
+            *(self._call(lambda item=item: factory(item)) for item in items),
+            return_exceptions=True
+        )
+        done, failed = [], []
+        for item, result in zip(items, results):
+            if isinstance(result, BaseException):
+                failed.append((item, result))
+            else:
+                done.append(item)
+        return {"done": done, "failed": failed}
+
+    async def ban_many(self, guild: discord.Guild, user_ids: Iterable[int], moderator_id: int,
+                       reason: Optional[str] = None, duration: Optional[int] = None,
+                       delete_message_seconds: int = 0) -> Dict[str, Any]:
+        """Banna più utenti; ritorna banned, failed, ids (id dei ban nel DB) e seconds"""
+        started = time.perf_counter()
+        user_ids = list(dict.fromkeys(user_ids))
+        banned: List[int] = []
+        failed: List[int] = []
+
+        if hasattr(guild, "bulk_ban"):
+            for start in range(0, len(user_ids), self.BULK_BAN_MAX):
+                chunk = user_ids[start:start + self.BULK_BAN_MAX]
+                try:
+                    result = await self._call(lambda chunk=chunk: guild.bulk_ban(
+                        [discord.Object(id=user_id) for user_id in chunk],
+                        reason=reason, delete_message_seconds=delete_message_seconds
+                    ))
+                except discord.HTTPException as e:
+                    print(f"❌ [ModDB] Errore bulk ban: {e}")
+                    failed += chunk
+                    continue
+                banned += [user.id for user in result.banned]
+                failed += [user.id for user in result.failed]
+        else:
+            outcome = await self._run_each(user_ids, lambda user_id: guild.ban(
+                discord.Object(id=user_id), reason=reason,
+                delete_message_seconds=delete_message_seconds
+            ))
+            banned = outcome["done"]
+            failed = [user_id for user_id, _error in outcome["failed"]]
+
+        ids = await asyncio.to_thread(
+            self.db.add_bans_bulk, banned, moderator_id, guild.id, reason, duration
+        )
+        return {
+            "banned": banned,
+            "failed": failed,
+            "ids": ids,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+    async def unban_many(self, guild: discord.Guild, user_ids: Iterable[int],
+                         reason: Optional[str] = None) -> Dict[str, Any]:
+        """Sbanna più utenti (su Discord e nel DB); ritorna unbanned, failed e seconds"""
+        started = time.perf_counter()
+        outcome = await self._run_each(dict.fromkeys(user_ids), lambda user_id: guild.unban(
+            discord.Object(id=user_id), reason=reason
+        ))
+        # Un 404 (già sbannato su Discord) non deve lasciare il ban attivo nel DB
+        unbanned = outcome["done"] + [
+            user_id for user_id, error in outcome["failed"] if isinstance(error, discord.NotFound)
+        ]
+        await asyncio.to_thread(self.db.remove_bans_bulk, unbanned, guild.id)
+        return {
+            "unbanned": unbanned,
+            "failed": [user_id for user_id, error in outcome["failed"]
+                       if not isinstance(error, discord.NotFound)],
+            "seconds": round(time.perf_counter() - started, 3),
+        }
+
+    async def mute_many(self, guild: discord.Guild, members: Iterable[discord.Member],
+                        moderator_id: int, reason: Optional[str] = None,
+                        duration: Optional[int] = None,
+                        mute_role: Optional[discord.Role] = None) -> Dict[str, Any]:
+        """
+        Muta più membri: con mute_role aggiunge il ruolo, altrimenti usa il timeout
+        di Discord (richiede duration). Ritorna muted, failed, ids e seconds.
+        """
+        if mute_role is None and not duration:
+            raise ValueError("Senza mute_role serve una duration per il timeout")
+
+        started = time.perf_counter()
+        members = list({member.id: member for member in members}.values())
+        if mute_role is not None:
+            outcome = await self._run_each(members, lambda member: member.add_roles(mute_role, reason=reason))
+        else:
+            outcome = await self._run_each(members, lambda member: member.timeout(
+                timedelta(seconds=duration), reason=reason
+            ))
+
+        muted = [member.id for member in outcome["done"]]
+        ids = await asyncio.to_thread(
+            self.db.add_mutes_bulk, muted, moderator_id, guild.id, reason, duration
+        )
+        return {
+            "muted": muted,
+            "failed": [member.id for member, _error in outcome["failed"]],
+            "ids": ids,
+            "seconds": round(time.perf_counter() - started, 3),
+        }
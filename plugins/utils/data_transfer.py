@@ -0,0 +1,135 @@
+"""
+Export e import in streaming dei dati di moderazione (JSONL o CSV)
+Memoria costante: cursori con fetchmany in export, righe lette una alla volta in import
+"""
+
+import csv
+import json
+import sqlite3
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from plugins.utils.epoch import now_ms
+
+EXPORT_FORMAT = "moderation-export"
+EXPORT_VERSION = 1
+EXPORT_TABLES = ("warns", "bans", "mutes", "kicks", "mod_log")
+
+# Colonne note per tabella (le altre chiavi in import vengono ignorate)
+TABLE_COLUMNS: Dict[str, Tuple[str, ...]] = {
+    "warns": ("id", "user_id", "moderator_id", "guild_id", "reason", "timestamp"),
+    "kicks": ("id", "user_id", "moderator_id", "guild_id", "reason", "timestamp"),
+    "bans": ("id", "user_id", "moderator_id", "guild_id", "reason", "duration", "expires_at",
+             "timestamp", "active"),
+    "mutes": ("id", "user_id", "moderator_id", "guild_id", "reason", "duration", "expires_at",
+              "timestamp", "active"),
+    "mod_log": ("id", "action_type", "user_id", "moderator_id", "guild_id", "details", "timestamp"),
+}
+
+# CSV: un solo file con colonna "table" e l'unione delle colonne
+CSV_COLUMNS = ["table"] + list(dict.fromkeys(col for cols in TABLE_COLUMNS.values() for col in cols))
+_CSV_INTEGERS = {"id", "user_id", "moderator_id", "guild_id", "duration", "expires_at", "timestamp", "active"}
+
+
+class ExportWriter:
+    """Scrive righe (tabella, dict) nel formato scelto"""
+
+    def __init__(self, fp: TextIO, format: str, guild_id: int):
+        if format not in ("jsonl", "csv"):
+            raise ValueError(f"Formato non supportato: {format} (jsonl, csv)")
+        self.fp = fp
+        self.format = format
+        self.counts: Dict[str, int] = {}
+        if format == "csv":
+            self._csv = csv.DictWriter(fp, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+            self._csv.writeheader()
+        else:
+            fp.write(json.dumps({
+                "format": EXPORT_FORMAT, "version": EXPORT_VERSION,
+                "guild_id": guild_id, "exported_at": now_ms(),
+            }) + "\n")
+
+    def write_rows(self, table: str, rows: Iterable[sqlite3.Row]):
+        written = 0
+        for row in rows:
+            record = {"table": table}
+            record.update((key, row[key]) for key in TABLE_COLUMNS[table])
+            if self.format == "csv":
+                self._csv.writerow(record)
+            else:
+                self.fp.write(json.dumps(record, ensure_ascii=False) + "\n")
+            written += 1
+        self.counts[table] = self.counts.get(table, 0) + written
+
+
+def stream_query(conn: sqlite3.Connection, query: str, params: tuple,
+                 chunk_size: int = 1000) -> Iterator[List[sqlite3.Row]]:
+    """Itera i risultati a blocchi di chunk_size (mai fetchall)"""
+    cursor = conn.execute(query, params)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+
+def _detect_format(first_line: str) -> str:
+    return "jsonl" if first_line.lstrip().startswith("{") else "csv"
+
+
+def _csv_value(column: str, value: str) -> Any:
+    if value == "":
+        return None
+    if column in _CSV_INTEGERS:
+        try:
+            return int(value)
+        except ValueError:
+            return value  # Timestamp testuale di un export vecchio: lo converte il trigger
+    return value
+
+
+def iter_import_rows(fp: TextIO, format: Optional[str] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Legge un export riga per riga e produce (tabella, colonne note)"""
+    first = fp.readline()
+    if not first:
+        return
+    format = format or _detect_format(first)
+
+    if format == "jsonl":
+        lines: Iterable[str] = _chain_first(first, fp)
+        for line_no, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Riga {line_no} non valida: {e}") from None
+            if record.get("format") == EXPORT_FORMAT:
+                if record.get("version", 1) > EXPORT_VERSION:
+                    raise ValueError(f"Versione di export non supportata: {record.get('version')}")
+                continue
+            table = record.get("table")
+            if table not in TABLE_COLUMNS:
+                raise ValueError(f"Riga {line_no}: tabella sconosciuta {table!r}")
+            yield table, {key: record[key] for key in TABLE_COLUMNS[table] if key in record}
+
+    elif format == "csv":
+        reader = csv.DictReader(_chain_first(first, fp))
+        for line_no, record in enumerate(reader, 2):
+            table = record.get("table")
+            if table not in TABLE_COLUMNS:
+                raise ValueError(f"Riga {line_no}: tabella sconosciuta {table!r}")
+            yield table, {
+                key: _csv_value(key, record[key])
+                for key in TABLE_COLUMNS[table] if key in record and record[key] is not None
+            }
+    else:
+        raise ValueError(f"Formato non supportato: {format} (jsonl, csv)")
+
+
+def _chain_first(first: str, fp: TextIO) -> Iterator[str]:
+    yield first
+    yield from fp
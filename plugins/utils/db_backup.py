@@ -0,0 +1,152 @@
+"""
+Backup a caldo del database di moderazione
+Usa sqlite3.Connection.backup a passi di N pagine su un thread dedicato (le scritture continuano)
+"""
+
+import glob
+import gzip
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+
+class BackupManager:
+    """
+    Gestisce backup online, rotazione e compressione opzionale.
+
+    Il backup legge da una connessione dedicata: in WAL i lettori non
+    bloccano il writer, e copiando poche pagine per passo (con una breve
+    pausa tra i passi) il lock sul database non viene mai tenuto a lungo.
+    Il file viene scritto come .tmp e rinominato solo a backup completo,
+    quindi nella cartella non finiscono mai copie troncate.
+    """
+
+    def __init__(self, db_path: str, backup_dir: Optional[str] = None, keep_backups: int = 3,
+                 interval_hours: float = 24, compress: bool = False,
+                 pages_per_step: int = 256, step_sleep: float = 0.005):
+        self.db_path = db_path
+        self.backup_dir = backup_dir or os.path.join(os.path.dirname(db_path) or ".", "backups")
+        self.keep_backups = max(1, keep_backups)
+        self.interval = max(60.0, interval_hours * 3600)
+        self.compress = compress
+        self.pages_per_step = max(1, pages_per_step)
+        self.step_sleep = max(0.0, step_sleep)
+
+        self._prefix = os.path.splitext(os.path.basename(db_path))[0]
+        self._run_lock = threading.Lock()  # Un backup alla volta
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._history: Deque[Dict[str, Any]] = deque(maxlen=20)
+
+    def backup_now(self) -> Dict[str, Any]:
+        """Esegue un backup completo (bloccante per il thread chiamante) e ritorna il record"""
+        with self._run_lock:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            started_at = datetime.now()
+            stamp = started_at.strftime("%Y%m%d-%H%M%S-%f")
+            target = os.path.join(self.backup_dir, f"{self._prefix}-{stamp}.db")
+            tmp_path = target + ".tmp"
+
+            started = time.perf_counter()
+            steps = 0
+
+            def progress(status, remaining, total):
+                nonlocal steps
+                steps += 1
+
+            source = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            dest = sqlite3.connect(tmp_path)
+            try:
+                # Transazione di lettura aperta: lo snapshot WAL resta fisso, quindi le
+                # scritture degli altri thread non fanno ripartire il backup da capo
+                source.execute("BEGIN")
+                source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+                source.backup(dest, pages=self.pages_per_step, progress=progress, sleep=self.step_sleep)
+                source.execute("COMMIT")
+                page_count = dest.execute("PRAGMA page_count").fetchone()[0]
+            finally:
+                dest.close()
+                source.close()
+            copy_seconds = time.perf_counter() - started
+
+            if self.compress:
+                final_path = target + ".gz"
+                with open(tmp_path, "rb") as src, gzip.open(final_path + ".tmp", "wb", compresslevel=6) as gz:
+                    shutil.copyfileobj(src, gz, 1024 * 1024)
+                os.remove(tmp_path)
+                os.replace(final_path + ".tmp", final_path)
+            else:
+                final_path = target
+                os.replace(tmp_path, final_path)
+
+            record = {
+                "path": final_path,
+                "started_at": started_at.isoformat(timespec="seconds"),
+                "pages": page_count,
+                "steps": steps,
+                "bytes": os.path.getsize(final_path),
+                "copy_seconds": round(copy_seconds, 3),
+                "total_seconds": round(time.perf_counter() - started, 3),
+                "compressed": self.compress,
+            }
+            self._history.append(record)
+            record["removed"] = self.rotate()
+            return record
+
+    def list_backups(self) -> List[str]:
+        """Backup presenti (dal più vecchio al più recente)"""
+        pattern = os.path.join(self.backup_dir, f"{self._prefix}-*.db")
+        files = glob.glob(pattern) + glob.glob(pattern + ".gz")
+        return sorted(files, key=os.path.basename)
+
+    def rotate(self) -> List[str]:
+        """Mantiene solo gli ultimi keep_backups file, ritorna quelli eliminati"""
+        backups = self.list_backups()
+        removed = backups[:-self.keep_backups] if len(backups) > self.keep_backups else []
+        for path in removed:
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"⚠️ [ModDB] Impossibile rimuovere il backup {path}: {e}")
+        return removed
+
+    def start(self):
+        """Avvia i backup periodici su un thread daemon"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def worker():
+            while not self._stop.wait(self.interval):
+                try:
+                    record = self.backup_now()
+                    print(f"💾 [ModDB] Backup completato: {record['path']} ({record['total_seconds']}s)")
+                except Exception as e:
+                    print(f"❌ [ModDB] Errore backup: {e}")
+
+        self._thread = threading.Thread(target=worker, name="mod-db-backup", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 30.0):
+        """Ferma i backup periodici (attende il backup in corso)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Ultimi backup con durata e dimensione"""
+        history = list(self._history)
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "interval_hours": round(self.interval / 3600, 2),
+            "keep_backups": self.keep_backups,
+            "backups_on_disk": len(self.list_backups()),
+            "last": history[-1] if history else None,
+            "history": history,
+        }
@@ -0,0 +1,257 @@
+"""
+Connection manager per i database SQLite della moderazione
+Mantiene connessioni persistenti: un writer serializzato e un pool limitato di reader
+"""
+
+import sqlite3
+import threading
+import time
+import queue
+import weakref
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Limiti superiori (secondi) dei bucket dei tempi di attesa/uso delle connessioni
+TIMING_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# ConnectionManager aperti nel processo (per esportare i tempi senza passare il database)
+_open_managers: "weakref.WeakSet[ConnectionManager]" = weakref.WeakSet()
+
+
+class PoolTimings:
+    """Istogrammi a bucket fissi dei tempi di attesa e di uso delle connessioni, per modalità"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, mode: str, wait: float, held: float):
+        with self._lock:
+            data = self._data.get(mode)
+            if data is None:
+                data = self._data[mode] = {
+                    "count": 0,
+                    "wait_sum": 0.0,
+                    "held_sum": 0.0,
+                    "wait_buckets": [0] * (len(TIMING_BUCKETS) + 1),
+                    "held_buckets": [0] * (len(TIMING_BUCKETS) + 1),
+                }
+            data["count"] += 1
+            data["wait_sum"] += wait
+            data["held_sum"] += held
+            data["wait_buckets"][bisect_left(TIMING_BUCKETS, wait)] += 1
+            data["held_buckets"][bisect_left(TIMING_BUCKETS, held)] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Copia dei contatori; i bucket non sono cumulativi, l'ultimo è +Inf"""
+        with self._lock:
+            return {
+                mode: {**data, "wait_buckets": list(data["wait_buckets"]),
+                       "held_buckets": list(data["held_buckets"])}
+                for mode, data in self._data.items()
+            }
+
+
+def timing_stats() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Tempi di tutti i ConnectionManager aperti, per percorso del database"""
+    return {manager.db_path: manager.timings.snapshot() for manager in list(_open_managers)}
+
+
+class ConnectionManager:
+    """Gestisce connessioni SQLite long-lived (1 writer + N reader) in modalità WAL"""
+
+    # Pragma applicati ad ogni connessione aperta dal manager
+    DEFAULT_PRAGMAS = {
+        "synchronous": "NORMAL",      # In WAL è sicuro e risparmia un fsync per commit
+        "temp_store": "MEMORY",
+        "cache_size": -16000,         # ~16MB di page cache per connessione
+        "mmap_size": 134217728,       # 128MB di memory-mapped I/O
+        "foreign_keys": "ON",
+    }
+
+    def __init__(self, db_path: str, max_readers: int = 4, cached_statements: int = 256,
+                 busy_timeout_ms: int = 5000, pragmas: Optional[Dict[str, object]] = None):
+        self.db_path = db_path
+        self.max_readers = max(1, max_readers)
+        self.cached_statements = cached_statements
+        self.busy_timeout_ms = busy_timeout_ms
+        self.pragmas = dict(self.DEFAULT_PRAGMAS)
+        if pragmas:
+            self.pragmas.update(pragmas)
+
+        self._closed = False
+        # Attesa per ottenere la connessione e durata d'uso (transazione inclusa)
+        self.timings = PoolTimings()
+
+        # Writer: una sola connessione, serializzata da un RLock (le scritture annidate
+        # dello stesso thread riusano la transazione già aperta)
+        self._writer_lock = threading.RLock()
+        self._writer_depth = 0
+        self._writer_owner: Optional[int] = None
+        self._rollback_hooks: List[Callable[[], None]] = []
+        self._trace: Optional[Callable[[str], None]] = None
+        self._writer = self._connect()
+        # auto_vacuum va impostato prima che il file venga inizializzato (WAL incluso):
+        # sui database già esistenti è un no-op finché non si esegue un VACUUM completo
+        self._writer.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._writer.execute("PRAGMA journal_mode=WAL")
+
+        # Reader: creati on-demand fino a max_readers, poi riutilizzati
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._readers_created = 0
+        self._readers_lock = threading.Lock()
+        self._all_readers = []
+        _open_managers.add(self)
+
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        """Apre una nuova connessione configurata con i pragma del manager"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,  # Transazioni gestite esplicitamente
+            check_same_thread=False,  # L'accesso è serializzato dal manager
+            cached_statements=self.cached_statements,
+        )
+        conn.row_factory = sqlite3.Row  # Accesso per nome colonna
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        if readonly:
+            conn.execute("PRAGMA query_only=1")
+        if self._trace is not None:
+            conn.set_trace_callback(self._trace)
+        return conn
+
+    def set_trace_callback(self, callback: Optional[Callable[[str], None]]):
+        """Traccia le istruzioni SQL di tutte le connessioni, anche dei reader futuri (None = off)"""
+        with self._readers_lock:
+            self._trace = callback
+            for conn in [self._writer] + self._all_readers:
+                conn.set_trace_callback(callback)
+
+    def _check_open(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("ConnectionManager già chiuso")
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """
+        Acquisisce la connessione writer dentro una transazione IMMEDIATE.
+        Commit all'uscita, rollback in caso di eccezione.
+        """
+        self._check_open()
+        requested = time.perf_counter()
+        with self._writer_lock:
+            acquired = time.perf_counter()
+            outermost = self._writer_depth == 0
+            if outermost:
+                self._writer.execute("BEGIN IMMEDIATE")
+                self._writer_owner = threading.get_ident()
+            self._writer_depth += 1
+            try:
+                yield self._writer
+            except BaseException:
+                self._writer_depth -= 1
+                if outermost:
+                    self._writer_owner = None
+                    self._writer.rollback()
+                    self._run_rollback_hooks()
+                raise
+            else:
+                self._writer_depth -= 1
+                if outermost:
+                    self._writer_owner = None
+                    try:
+                        self._writer.commit()
+                    except sqlite3.Error:
+                        self._writer.rollback()
+                        self._run_rollback_hooks()
+                        raise
+                    self._rollback_hooks.clear()
+            finally:
+                if outermost:
+                    self.timings.record("write", acquired - requested, time.perf_counter() - acquired)
+
+    def on_rollback(self, hook: Callable[[], None]):
+        """Registra una callback eseguita se la transazione di scrittura corrente fallisce"""
+        if self._writer_owner != threading.get_ident():
+            raise RuntimeError("on_rollback() va chiamato dentro write()")
+        self._rollback_hooks.append(hook)
+
+    def _run_rollback_hooks(self):
+        hooks, self._rollback_hooks = self._rollback_hooks, []
+        for hook in hooks:
+            hook()
+
+    @contextmanager
+    def serialized(self) -> Iterator[sqlite3.Connection]:
+        """
+        Connessione writer sotto lock ma senza aprire una transazione:
+        per letture che devono essere ordinate rispetto alle scritture
+        (es. popolare una cache write-through senza race).
+        """
+        self._check_open()
+        with self._writer_lock:
+            yield self._writer
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """Presta una connessione reader dal pool (bloccante se tutte occupate)"""
+        self._check_open()
+
+        # Se il thread corrente ha una scrittura in corso legge dalla stessa
+        # connessione, così vede le proprie modifiche non ancora committate
+        if self._writer_owner == threading.get_ident():
+            yield self._writer
+            return
+
+        requested = time.perf_counter()
+        conn = self._acquire_reader()
+        acquired = time.perf_counter()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+            self.timings.record("read", acquired - requested, time.perf_counter() - acquired)
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._readers_lock:
+            if self._readers_created < self.max_readers:
+                conn = self._connect(readonly=True)
+                self._readers_created += 1
+                self._all_readers.append(conn)
+                return conn
+
+        return self._readers.get()
+
+    def stats(self) -> Dict[str, int]:
+        """Statistiche del pool (per debug e benchmark)"""
+        return {
+            "readers_open": self._readers_created,
+            "readers_idle": self._readers.qsize(),
+            "max_readers": self.max_readers,
+        }
+
+    def close(self):
+        """Chiude tutte le connessioni (checkpoint del WAL incluso)"""
+        if self._closed:
+            return
+        _open_managers.discard(self)
+        with self._writer_lock:
+            self._closed = True
+            for conn in self._all_readers:
+                conn.close()
+            self._all_readers.clear()
+            try:
+                self._writer.execute("PRAGMA optimize")
+            except sqlite3.Error:
+                pass
+            self._writer.close()
@@ -0,0 +1,49 @@
+"""
+Timestamp del database di moderazione: interi in millisecondi epoch (UTC)
+Conversioni lato Python e lato SQL per i dati scritti come testo DATETIME dalle versioni precedenti
+"""
+
+import time
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+# Espressione SQL equivalente a now_ms() (funziona anche senza unixepoch(), SQLite < 3.38)
+SQL_NOW_MS = "CAST(ROUND((julianday('now') - 2440587.5) * 86400000) AS INTEGER)"
+
+
+def now_ms() -> int:
+    """Istante corrente in millisecondi epoch"""
+    return time.time_ns() // 1_000_000
+
+
+def to_epoch_ms(value: Any) -> Optional[int]:
+    """
+    Converte un valore temporale in millisecondi epoch.
+    Accetta int/float (già in ms), datetime (naive = ora locale) e stringhe ISO.
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        raise TypeError(f"Timestamp non valido: {value!r}")
+    if isinstance(value, (int, float)):
+        return int(value)
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value))
+    return int(round(value.timestamp() * 1000))
+
+
+def from_epoch_ms(value: Optional[int]) -> Optional[datetime]:
+    """Millisecondi epoch -> datetime UTC (aware), per la visualizzazione"""
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+
+def sql_text_to_ms(column: str, local: bool = False) -> str:
+    """
+    Espressione SQL che converte una colonna DATETIME testuale in millisecondi epoch.
+    local=True per i valori scritti dall'adapter sqlite3 (datetime naive in ora locale),
+    False per CURRENT_TIMESTAMP (già UTC).
+    """
+    modifier = ", 'utc'" if local else ""
+    return f"CAST(ROUND((julianday({column}{modifier}) - 2440587.5) * 86400000) AS INTEGER)"
@@ -0,0 +1,169 @@
+"""
+Scheduler delle scadenze per ban e mute temporanei
+Min-heap in memoria: dorme fino alla prossima scadenza e rimuove solo le punizioni scadute
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from plugins.utils.epoch import to_epoch_ms
+from plugins.utils.mod_database import ModerationDatabase
+
+# Callback opzionale: (kind, riga) dove kind è "ban" o "mute", per sbannare/smutare su Discord
+ExpireCallback = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+def _to_epoch(expires_at: Any) -> float:
+    """Converte il valore di expires_at salvato nel DB (millisecondi epoch) in epoch (secondi)"""
+    return to_epoch_ms(expires_at) / 1000
+
+
+class ExpiryScheduler:
+    """
+    Scheduler in-process per le scadenze.
+
+    All'avvio carica le righe attive con expires_at in un min-heap, poi dorme
+    fino alla scadenza più vicina. add_ban/add_mute inseriscono le nuove
+    scadenze nell'heap tramite listener (anche da altri thread), svegliando
+    lo scheduler se la nuova scadenza è la più vicina. Le righe revocate
+    manualmente vengono scartate al momento della scadenza (update a 0 righe);
+    quelle ancora attive con expires_at nel futuro (orologi disallineati,
+    scadenza modificata) tornano nell'heap alla loro nuova scadenza.
+
+    Usage:
+        scheduler = ExpiryScheduler(db, on_expire=self._lift_on_discord)
+        await scheduler.start()
+        ...
+        await scheduler.stop()
+    """
+
+    def __init__(self, db: ModerationDatabase, on_expire: Optional[ExpireCallback] = None,
+                 max_batch: int = 100):
+        self.db = db
+        self.on_expire = on_expire
+        self.max_batch = max_batch
+
+        self._heap: List[Tuple[float, int, str, int]] = []
+        self._seq = itertools.count()  # Tie-breaker stabile per scadenze identiche
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lifted = 0
+        self._lag_ms = 0.0
+
+    async def start(self):
+        """Carica le scadenze attive e avvia il loop dello scheduler"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+
+        pending = await asyncio.to_thread(self.db.get_pending_expirations)
+        self._heap = [
+            (_to_epoch(row["expires_at"]), next(self._seq), row["kind"], row["id"])
+            for row in pending
+        ]
+        heapq.heapify(self._heap)
+
+        self.db.add_expiry_listener(self.schedule)
+        self._task = self._loop.create_task(self._run(), name="mod-expiry-scheduler")
+
+    async def stop(self):
+        """Ferma lo scheduler (le scadenze restano nel DB per il prossimo avvio)"""
+        self.db.remove_expiry_listener(self.schedule)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def schedule(self, kind: str, punishment_id: int, expires_at: Any):
+        """Aggiunge una scadenza all'heap. Thread-safe: chiamabile dai thread del DB."""
+        if self._loop is None or self._loop.is_closed():
+            return
+        entry = (_to_epoch(expires_at), next(self._seq), kind, punishment_id)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._push(entry)
+        else:
+            self._loop.call_soon_threadsafe(self._push, entry)
+
+    def _push(self, entry: Tuple[float, int, str, int]):
+        heapq.heappush(self._heap, entry)
+        # Sveglia il loop solo se la nuova scadenza è diventata la prima
+        if self._heap[0] is entry:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - time.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                    continue  # Nuova scadenza più vicina: ricalcola
+                except asyncio.TimeoutError:
+                    pass
+
+            now = time.time()
+            due = []
+            while self._heap and self._heap[0][0] <= now and len(due) < self.max_batch:
+                expires, _, kind, punishment_id = heapq.heappop(self._heap)
+                due.append((kind, punishment_id))
+                self._lag_ms = max(0.0, (now - expires) * 1000)
+
+            try:
+                lifted = await asyncio.to_thread(self.db.expire_punishments, due)
+            except Exception as e:
+                print(f"❌ [ModDB] Errore scadenze: {e}")
+                # Rimette in coda e riprova tra poco
+                for kind, punishment_id in due:
+                    heapq.heappush(self._heap, (now + 5, next(self._seq), kind, punishment_id))
+                continue
+
+            self._lifted += len(lifted)
+            if len(lifted) < len(due):
+                await self._reschedule_skipped(due, now)
+            if self.on_expire is not None:
+                for kind, row in lifted:
+                    try:
+                        await self.on_expire(kind, row)
+                    except Exception as e:
+                        print(f"❌ [ModDB] Errore callback scadenza {kind} #{row.get('id')}: {e}")
+
+    async def _reschedule_skipped(self, due: List[Tuple[str, Any]], now: float):
+        """Rimette nell'heap le punizioni non disattivate ma ancora attive con una scadenza"""
+        try:
+            pending = await asyncio.to_thread(self.db.get_active_expiries, due)
+        except Exception as e:
+            print(f"❌ [ModDB] Errore scadenze: {e}")
+            pending = {item: None for item in due}
+        for (kind, punishment_id), expires_at in pending.items():
+            expires = _to_epoch(expires_at) if expires_at is not None else now
+            # Già scaduta per l'orologio del bot ma non disattivata: riprova tra poco, non in loop
+            if expires <= now:
+                expires = now + 1
+            heapq.heappush(self._heap, (expires, next(self._seq), kind, punishment_id))
+
+    def stats(self) -> Dict[str, Any]:
+        """Stato dello scheduler"""
+        return {
+            "pending": len(self._heap),
+            "next_expiry_in": round(self._heap[0][0] - time.time(), 3) if self._heap else None,
+            "lifted": self._lifted,
+            "last_lag_ms": round(self._lag_ms, 3),
+            "running": self._task is not None and not self._task.done(),
+        }
@@ -0,0 +1,233 @@
+"""
+Retention e archiviazione di mod_log
+Sposta le righe più vecchie di N giorni (per guild) in un database di archivio indicizzato
+e recupera lo spazio del database principale con incremental vacuum
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from plugins.utils.data_transfer import stream_query
+from plugins.utils.db_pool import ConnectionManager
+from plugins.utils.epoch import SQL_NOW_MS, now_ms, sql_text_to_ms
+
+
+class LogArchiver:
+    """
+    Applica la retention di mod_log.
+
+    Per ogni guild le righe con timestamp più vecchio del limite vengono
+    copiate a blocchi nel database di archivio (INSERT OR IGNORE sull'id
+    originale) e poi cancellate dal database principale. Le due transazioni
+    sono separate ma il passaggio è idempotente: se il processo si ferma a
+    metà, il blocco viene semplicemente ricopiato e cancellato al giro dopo.
+    """
+
+    def __init__(self, pool: ConnectionManager, archive_path: str, default_days: int = 180,
+                 guild_overrides: Optional[Dict[int, int]] = None, chunk_size: int = 1000,
+                 vacuum_pages: int = 500, interval_hours: float = 24):
+        self.pool = pool
+        self.archive_path = archive_path
+        self.default_days = default_days
+        self.guild_overrides = {int(k): int(v) for k, v in (guild_overrides or {}).items()}
+        self.chunk_size = max(1, chunk_size)
+        self.vacuum_pages = max(0, vacuum_pages)
+        self.interval = max(60.0, interval_hours * 3600)
+
+        directory = os.path.dirname(archive_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.archive = ConnectionManager(archive_path, max_readers=2)
+        with self.archive.write() as conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS mod_log_archive (
+                    id INTEGER PRIMARY KEY,
+                    action_type TEXT NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    moderator_id INTEGER NOT NULL,
+                    guild_id INTEGER NOT NULL,
+                    details TEXT,
+                    timestamp INTEGER,
+                    archived_at INTEGER DEFAULT ({SQL_NOW_MS})
+                )
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_archive_guild_user_ts
+                ON mod_log_archive (guild_id, user_id, timestamp)
+            """)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_archive_guild_ts
+                ON mod_log_archive (guild_id, timestamp)
+            """)
+            # v1: timestamp testuali (archivi creati prima dei millisecondi epoch) -> interi
+            if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+                conn.execute(f"""
+                    UPDATE mod_log_archive SET
+                        timestamp = {sql_text_to_ms('timestamp')},
+                        archived_at = {sql_text_to_ms('archived_at')}
+                    WHERE typeof(timestamp) = 'text' OR typeof(archived_at) = 'text'
+                """)
+                conn.execute("PRAGMA user_version = 1")
+
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_run: Optional[Dict[str, Any]] = None
+
+    def retention_days(self, guild_id: int) -> int:
+        """Giorni di retention per una guild (0 = conserva tutto nel DB principale)"""
+        return self.guild_overrides.get(guild_id, self.default_days)
+
+    def _cutoff(self, days: int) -> int:
+        # mod_log.timestamp è in millisecondi epoch
+        return now_ms() - days * 86_400_000
+
+    def _guild_ids(self) -> List[int]:
+        """Guild presenti in mod_log (loose index scan: una ricerca per guild, niente scan)"""
+        guilds = []
+        last = None
+        with self.pool.read() as conn:
+            while True:
+                if last is None:
+                    row = conn.execute("SELECT MIN(guild_id) FROM mod_log").fetchone()
+                else:
+                    row = conn.execute("SELECT MIN(guild_id) FROM mod_log WHERE guild_id > ?", (last,)).fetchone()
+                if row[0] is None:
+                    return guilds
+                last = row[0]
+                guilds.append(last)
+
+    def archive_guild(self, guild_id: int, days: Optional[int] = None) -> int:
+        """Archivia le righe scadute di una guild, ritorna quante ne ha spostate"""
+        days = self.retention_days(guild_id) if days is None else days
+        if days <= 0:
+            return 0
+        cutoff = self._cutoff(days)
+        moved = 0
+
+        while not self._stop.is_set():
+            with self.pool.read() as conn:
+                rows = conn.execute("""
+                    SELECT id, action_type, user_id, moderator_id, guild_id, details, timestamp
+                    FROM mod_log
+                    WHERE guild_id = ? AND timestamp < ?
+                    ORDER BY timestamp
+                    LIMIT ?
+                """, (guild_id, cutoff, self.chunk_size)).fetchall()
+            if not rows:
+                break
+
+            archived_at = now_ms()
+            with self.archive.write() as conn:
+                conn.executemany("""
+                    INSERT OR IGNORE INTO mod_log_archive
+                        (id, action_type, user_id, moderator_id, guild_id, details, timestamp, archived_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, [tuple(row) + (archived_at,) for row in rows])
+
+            with self.pool.write() as conn:
+                conn.executemany("DELETE FROM mod_log WHERE id = ?", [(row["id"],) for row in rows])
+
+            moved += len(rows)
+        return moved
+
+    def incremental_vacuum(self, pages: Optional[int] = None) -> int:
+        """Libera al massimo N pagine vuote del DB principale (richiede auto_vacuum=INCREMENTAL)"""
+        pages = self.vacuum_pages if pages is None else pages
+        with self.pool.serialized() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return 0
+            before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+            after = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return before - after
+
+    def run(self) -> Dict[str, Any]:
+        """Un giro completo: archivia tutte le guild, poi un passo di incremental vacuum"""
+        with self._run_lock:
+            started = time.perf_counter()
+            per_guild = {}
+            for guild_id in self._guild_ids():
+                if self._stop.is_set():
+                    break
+                moved = self.archive_guild(guild_id)
+                if moved:
+                    per_guild[guild_id] = moved
+
+            freed = self.incremental_vacuum() if per_guild else 0
+            self._last_run = {
+                "archived": sum(per_guild.values()),
+                "guilds": per_guild,
+                "freed_pages": freed,
+                "seconds": round(time.perf_counter() - started, 3),
+                "finished_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            return self._last_run
+
+    def get_archived_log(self, guild_id: int, user_id: Optional[int] = None,
+                         before: Optional[int] = None, limit: int = 50) -> List[Dict]:
+        """Righe archiviate (più recenti prima), servite dagli indici dell'archivio"""
+        query = "SELECT * FROM mod_log_archive WHERE guild_id = ?"
+        params: List[Any] = [guild_id]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        if before is not None:
+            query += " AND timestamp < ?"
+            params.append(before)
+        query += " ORDER BY timestamp DESC LIMIT ?"
+        params.append(limit)
+        with self.archive.read() as conn:
+            return [dict(row) for row in conn.execute(query, params)]
+
+    def iter_guild(self, guild_id: int, chunk_size: int = 1000) -> Iterator[List[sqlite3.Row]]:
+        """Tutte le righe archiviate di una guild, a blocchi (per l'export)"""
+        with self.archive.read() as conn:
+            yield from stream_query(conn, """
+                SELECT id, action_type, user_id, moderator_id, guild_id, details, timestamp
+                FROM mod_log_archive WHERE guild_id = ?
+            """, (guild_id,), chunk_size)
+
+    def start(self):
+        """Avvia la retention periodica su un thread daemon (primo giro subito)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+
+        def worker():
+            while not self._stop.is_set():
+                try:
+                    result = self.run()
+                    if result["archived"]:
+                        print(f"🗄️ [ModDB] Archiviate {result['archived']} righe di mod_log "
+                              f"({result['seconds']}s, {result['freed_pages']} pagine liberate)")
+                except Exception as e:
+                    print(f"❌ [ModDB] Errore archiviazione mod_log: {e}")
+                self._stop.wait(self.interval)
+
+        self._thread = threading.Thread(target=worker, name="mod-db-archive", daemon=True)
+        self._thread.start()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.archive.read() as conn:
+            archived_rows = conn.execute("SELECT COUNT(*) FROM mod_log_archive").fetchone()[0]
+        return {
+            "archive_path": self.archive_path,
+            "archived_rows": archived_rows,
+            "default_days": self.default_days,
+            "guild_overrides": dict(self.guild_overrides),
+            "last_run": self._last_run,
+        }
+
+    def close(self, timeout: float = 30.0):
+        """Ferma il thread e chiude il database di archivio"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._run_lock:
+            self.archive.close()
@@ -0,0 +1,373 @@
+"""
+Motore di migrazione versionato per il database di moderazione
+Usa PRAGMA user_version, applica gli step in ordine e in transazione,
+ed esegue i backfill grandi a blocchi (riprendibili) per non bloccare l'avvio
+"""
+
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional, Sequence, Union
+
+from plugins.utils.db_pool import ConnectionManager
+from plugins.utils.epoch import sql_text_to_ms
+
+# Uno step è uno statement SQL o una funzione che riceve la connessione writer
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+
+
+class Backfill:
+    """
+    Backfill a blocchi su una tabella, per intervalli di rowid.
+
+    fn(conn, low, high) deve processare le righe con low < rowid <= high.
+    Ogni blocco gira in una transazione separata e il progresso viene salvato
+    in schema_backfills, quindi un riavvio riprende da dove si era fermato.
+    I backfill non bloccanti (blocking=False) girano in background dopo l'avvio.
+    """
+
+    def __init__(self, name: str, table: str, fn: Callable[[sqlite3.Connection, int, int], None],
+                 chunk_size: int = 5000, blocking: bool = True):
+        self.name = name
+        self.table = table
+        self.fn = fn
+        self.chunk_size = chunk_size
+        self.blocking = blocking
+
+
+class Migration:
+    """Una versione dello schema: step DDL transazionali + backfill opzionali"""
+
+    def __init__(self, version: int, description: str, steps: Sequence[Step] = (),
+                 backfills: Sequence[Backfill] = ()):
+        self.version = version
+        self.description = description
+        self.steps = list(steps)
+        self.backfills = list(backfills)
+
+
+class MigrationRunner:
+    """Applica le migrazioni mancanti e gestisce i backfill a blocchi"""
+
+    def __init__(self, pool: ConnectionManager, migrations: Sequence[Migration]):
+        self.pool = pool
+        self.migrations = sorted(migrations, key=lambda m: m.version)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        versions = [m.version for m in self.migrations]
+        if len(set(versions)) != len(versions):
+            raise ValueError(f"Versioni di migrazione duplicate: {versions}")
+
+    @property
+    def latest_version(self) -> int:
+        return self.migrations[-1].version if self.migrations else 0
+
+    def current_version(self) -> int:
+        with self.pool.read() as conn:
+            return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def run(self) -> List[int]:
+        """
+        Applica in ordine le migrazioni con versione > user_version.
+        Ogni migrazione (step + aggiornamento user_version) è atomica;
+        i backfill bloccanti vengono completati prima della migrazione successiva.
+        Ritorna le versioni applicate.
+        """
+        with self.pool.write() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS schema_backfills (
+                    name TEXT PRIMARY KEY,
+                    last_rowid INTEGER NOT NULL DEFAULT 0,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+        applied = []
+        current = self.current_version()
+
+        for migration in self.migrations:
+            if migration.version <= current:
+                continue
+
+            with self.pool.write() as conn:
+                for step in migration.steps:
+                    if callable(step):
+                        step(conn)
+                    else:
+                        conn.execute(step)
+                for backfill in migration.backfills:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO schema_backfills (name) VALUES (?)", (backfill.name,)
+                    )
+                conn.execute(f"PRAGMA user_version = {int(migration.version)}")
+
+            for backfill in migration.backfills:
+                if backfill.blocking:
+                    self.run_backfill(backfill)
+
+            applied.append(migration.version)
+
+        # Backfill bloccanti rimasti a metà da un avvio precedente
+        for backfill in self._pending_backfills():
+            if backfill.blocking:
+                self.run_backfill(backfill)
+
+        return applied
+
+    def _pending_backfills(self) -> List[Backfill]:
+        with self.pool.read() as conn:
+            done = {
+                row["name"]: row["done"]
+                for row in conn.execute("SELECT name, done FROM schema_backfills")
+            }
+        current = self.current_version()
+        return [
+            backfill
+            for migration in self.migrations if migration.version <= current
+            for backfill in migration.backfills
+            if done.get(backfill.name) == 0
+        ]
+
+    def run_backfill(self, backfill: Backfill, max_seconds: Optional[float] = None) -> bool:
+        """
+        Esegue (o riprende) un backfill a blocchi.
+        Ritorna True se completato, False se interrotto (stop o tempo esaurito).
+        """
+        started = time.monotonic()
+
+        with self.pool.read() as conn:
+            row = conn.execute(
+                "SELECT last_rowid, done FROM schema_backfills WHERE name = ?", (backfill.name,)
+            ).fetchone()
+            if row is not None and row["done"]:
+                return True
+            last_rowid = row["last_rowid"] if row is not None else 0
+            max_rowid = conn.execute(f"SELECT MAX(rowid) FROM {backfill.table}").fetchone()[0] or 0
+
+        while last_rowid < max_rowid:
+            if self._stop.is_set():
+                return False
+            if max_seconds is not None and time.monotonic() - started > max_seconds:
+                return False
+
+            high = min(last_rowid + backfill.chunk_size, max_rowid)
+            with self.pool.write() as conn:
+                backfill.fn(conn, last_rowid, high)
+                conn.execute("""
+                    UPDATE schema_backfills SET last_rowid = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE name = ?
+                """, (high, backfill.name))
+            last_rowid = high
+
+        with self.pool.write() as conn:
+            conn.execute("""
+                UPDATE schema_backfills SET done = 1, updated_at = CURRENT_TIMESTAMP
+                WHERE name = ?
+            """, (backfill.name,))
+        return True
+
+    def start_background_backfills(self, pause: float = 0.05):
+        """Completa i backfill non bloccanti in un thread daemon, un blocco alla volta"""
+        pending = [b for b in self._pending_backfills() if not b.blocking]
+        if not pending or (self._thread and self._thread.is_alive()):
+            return
+
+        def worker():
+            for backfill in pending:
+                # Piccole fette di tempo con pause: le scritture dei comandi passano in mezzo
+                while not self._stop.is_set():
+                    try:
+                        if self.run_backfill(backfill, max_seconds=0.25):
+                            break
+                    except sqlite3.ProgrammingError:
+                        return  # Database chiuso durante lo shutdown
+                    self._stop.wait(pause)
+
+        self._thread = threading.Thread(target=worker, name="mod-db-backfill", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Ferma il thread dei backfill in background (il progresso resta salvato)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+# ===== RICERCA FULL-TEXT =====
+# (tipo, tabella, colonna testo, codice). Il rowid FTS è id * 8 + codice:
+# univoco tra le tabelle e calcolabile nei trigger senza tabelle di appoggio.
+FTS_SOURCES = [
+    ("warn", "warns", "reason", 1),
+    ("ban", "bans", "reason", 2),
+    ("mute", "mutes", "reason", 3),
+    ("kick", "kicks", "reason", 4),
+    ("log", "mod_log", "details", 5),
+]
+
+
+def _fts_triggers(kind: str, table: str, column: str, code: int) -> List[str]:
+    """Trigger che tengono action_search allineata alla tabella sorgente"""
+    insert = f"""
+        INSERT INTO action_search (rowid, body, guild_id, kind, source_id)
+        SELECT NEW.id * 8 + {code}, NEW.{column}, NEW.guild_id, '{kind}', NEW.id
+        WHERE NEW.{column} IS NOT NULL
+    """
+    delete = f"DELETE FROM action_search WHERE rowid = OLD.id * 8 + {code}"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_insert AFTER INSERT ON {table} "
+        f"BEGIN {insert}; END",
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_delete AFTER DELETE ON {table} "
+        f"BEGIN {delete}; END",
+        # Solo sugli UPDATE della colonna testo: le altre modifiche (active, expires_at) non toccano l'indice
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_fts_update AFTER UPDATE OF {column} ON {table} "
+        f"BEGIN {delete}; {insert}; END",
+    ]
+
+
+def _fts_backfill(kind: str, table: str, column: str, code: int) -> Backfill:
+    """Indicizza le righe già presenti (a blocchi, in background)"""
+    def fn(conn: sqlite3.Connection, low: int, high: int):
+        conn.execute(f"""
+            INSERT OR REPLACE INTO action_search (rowid, body, guild_id, kind, source_id)
+            SELECT id * 8 + {code}, {column}, guild_id, '{kind}', id
+            FROM {table}
+            WHERE rowid > ? AND rowid <= ? AND {column} IS NOT NULL
+        """, (low, high))
+    return Backfill(f"fts_{table}", table, fn, chunk_size=5000, blocking=False)
+
+
+# ===== TIMESTAMP INTERI =====
+# timestamp era CURRENT_TIMESTAMP (testo UTC), expires_at un datetime Python
+# salvato come testo in ora locale: entrambi diventano millisecondi epoch.
+EPOCH_COLUMNS = [
+    ("warns", "timestamp", False),
+    ("kicks", "timestamp", False),
+    ("bans", "timestamp", False),
+    ("bans", "expires_at", True),
+    ("mutes", "timestamp", False),
+    ("mutes", "expires_at", True),
+    ("mod_log", "timestamp", False),
+]
+
+
+def _epoch_trigger(table: str, column: str, local: bool) -> str:
+    """Rete di sicurezza per gli insert che lasciano il DEFAULT CURRENT_TIMESTAMP o passano un datetime"""
+    return (
+        f"CREATE TRIGGER IF NOT EXISTS trg_{table}_{column}_ms AFTER INSERT ON {table} "
+        f"WHEN typeof(NEW.{column}) = 'text' BEGIN "
+        f"UPDATE {table} SET {column} = {sql_text_to_ms('NEW.' + column, local)} WHERE id = NEW.id; END"
+    )
+
+
+def _epoch_backfill(table: str, column: str, local: bool) -> Backfill:
+    """Converte in place le righe esistenti (bloccante: le query non devono vedere tipi misti)"""
+    def fn(conn: sqlite3.Connection, low: int, high: int):
+        conn.execute(f"""
+            UPDATE {table} SET {column} = {sql_text_to_ms(column, local)}
+            WHERE rowid > ? AND rowid <= ? AND typeof({column}) = 'text'
+        """, (low, high))
+    return Backfill(f"epoch_ms_{table}_{column}", table, fn, chunk_size=5000, blocking=True)
+
+
+# ===== STATISTICHE =====
+DAY_MS = 86_400_000
+
+# Giorno UTC (epoch day) di NEW.timestamp, anche se l'insert è arrivato con testo
+_NEW_DAY = (
+    "(CASE typeof(NEW.timestamp) WHEN 'text' THEN "
+    f"{sql_text_to_ms('NEW.timestamp')} ELSE NEW.timestamp END) / {DAY_MS}"
+)
+
+
+def _stats_backfill(conn: sqlite3.Connection, low: int, high: int):
+    """Aggrega le righe di mod_log precedenti ai trigger (fino al rowid salvato dalla migrazione)"""
+    limit = conn.execute(
+        "SELECT value FROM mod_stats_meta WHERE key = 'backfill_max_rowid'"
+    ).fetchone()[0]
+    high = min(high, limit)
+    if high <= low:
+        return
+    conn.execute(f"""
+        INSERT INTO mod_stats_daily (guild_id, day, action_type, count)
+        SELECT guild_id, timestamp / {DAY_MS}, action_type, COUNT(*)
+        FROM mod_log WHERE rowid > ? AND rowid <= ?
+        GROUP BY 1, 2, 3
+        ON CONFLICT (guild_id, day, action_type) DO UPDATE SET count = count + excluded.count
+    """, (low, high))
+    conn.execute(f"""
+        INSERT INTO mod_stats_moderators (guild_id, day, moderator_id, action_type, count)
+        SELECT guild_id, timestamp / {DAY_MS}, moderator_id, action_type, COUNT(*)
+        FROM mod_log WHERE rowid > ? AND rowid <= ?
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (guild_id, day, moderator_id, action_type) DO UPDATE SET count = count + excluded.count
+    """, (low, high))
+
+
+# ===== MIGRAZIONI =====
+# Aggiungere sempre in coda con versione crescente; mai modificare una migrazione già rilasciata.
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Indici secondari su warns, bans, mutes, kicks e mod_log", steps=[
+        "CREATE INDEX IF NOT EXISTS idx_warns_guild_user_ts ON warns (guild_id, user_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_kicks_guild_user_ts ON kicks (guild_id, user_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_bans_guild_user_ts ON bans (guild_id, user_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_mutes_guild_user_ts ON mutes (guild_id, user_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_bans_active_guild_ts ON bans (guild_id, timestamp) WHERE active = 1",
+        "CREATE INDEX IF NOT EXISTS idx_mutes_active_guild_ts ON mutes (guild_id, timestamp) WHERE active = 1",
+        "CREATE INDEX IF NOT EXISTS idx_bans_active_ts ON bans (timestamp) WHERE active = 1",
+        "CREATE INDEX IF NOT EXISTS idx_mutes_active_ts ON mutes (timestamp) WHERE active = 1",
+        "CREATE INDEX IF NOT EXISTS idx_bans_expiry ON bans (expires_at) "
+        "WHERE active = 1 AND expires_at IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_mutes_expiry ON mutes (expires_at) "
+        "WHERE active = 1 AND expires_at IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_mod_log_guild_user_ts ON mod_log (guild_id, user_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_mod_log_guild_ts ON mod_log (guild_id, timestamp)",
+    ]),
+    Migration(2, "Indice FTS5 su motivi e dettagli (action_search)", steps=[
+        # guild_id è una colonna indicizzata: il filtro per guild fa parte del MATCH
+        """CREATE VIRTUAL TABLE IF NOT EXISTS action_search USING fts5(
+            body, guild_id, kind UNINDEXED, source_id UNINDEXED,
+            tokenize = 'unicode61 remove_diacritics 2'
+        )""",
+        # Il ranking pesa solo il testo, non il token della guild
+        "INSERT INTO action_search (action_search, rank) VALUES ('rank', 'bm25(1.0, 0.0)')",
+        *[sql for source in FTS_SOURCES for sql in _fts_triggers(*source)],
+    ], backfills=[_fts_backfill(*source) for source in FTS_SOURCES]),
+    Migration(3, "timestamp ed expires_at come INTEGER in millisecondi epoch", steps=[
+        _epoch_trigger(*column) for column in EPOCH_COLUMNS
+    ], backfills=[_epoch_backfill(*column) for column in EPOCH_COLUMNS]),
+    Migration(4, "Rollup giornalieri per guild e moderatore (mod_stats_*)", steps=[
+        """CREATE TABLE IF NOT EXISTS mod_stats_daily (
+            guild_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            action_type TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, day, action_type)
+        ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS mod_stats_moderators (
+            guild_id INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            moderator_id INTEGER NOT NULL,
+            action_type TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, day, moderator_id, action_type)
+        ) WITHOUT ROWID""",
+        "CREATE TABLE IF NOT EXISTS mod_stats_meta (key TEXT PRIMARY KEY, value INTEGER)",
+        # Le righe successive le conta il trigger: il backfill si ferma qui (niente doppi conteggi)
+        "INSERT OR REPLACE INTO mod_stats_meta (key, value) "
+        "SELECT 'backfill_max_rowid', COALESCE(MAX(rowid), 0) FROM mod_log",
+        # Stessa transazione di ogni insert in mod_log (diretto, bulk, write-behind o async)
+        f"""CREATE TRIGGER IF NOT EXISTS trg_mod_log_stats AFTER INSERT ON mod_log BEGIN
+            INSERT INTO mod_stats_daily (guild_id, day, action_type, count)
+            VALUES (NEW.guild_id, {_NEW_DAY}, NEW.action_type, 1)
+            ON CONFLICT (guild_id, day, action_type) DO UPDATE SET count = count + 1;
+            INSERT INTO mod_stats_moderators (guild_id, day, moderator_id, action_type, count)
+            VALUES (NEW.guild_id, {_NEW_DAY}, NEW.moderator_id, NEW.action_type, 1)
+            ON CONFLICT (guild_id, day, moderator_id, action_type) DO UPDATE SET count = count + 1;
+        END""",
+    ], backfills=[
+        Backfill("mod_stats_rollup", "mod_log", _stats_backfill, chunk_size=20000, blocking=False),
+    ]),
+]
@@ -5,48 +5,213 @@ Handles all SQLite operations for warns, bans, mutes, kicks, and audit logging
 
 import sqlite3
 import os
-from datetime import datetime, timedelta
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable, TextIO, Tuple
 import json
+import re
+import tempfile
 
+from plugins.utils.db_pool import ConnectionManager
+from plugins.utils.epoch import SQL_NOW_MS, now_ms, to_epoch_ms
+from plugins.utils.migrations import DAY_MS, MIGRATIONS, MigrationRunner
+from plugins.utils.write_behind import WriteBehindQueue
+from plugins.utils.warn_cache import WarnCountCache
+from plugins.utils.db_backup import BackupManager
+from plugins.utils.log_archive import LogArchiver
+from plugins.utils.storage import ModerationStorage
+from plugins.utils.data_transfer import (
+    EXPORT_TABLES, TABLE_COLUMNS, ExportWriter, iter_import_rows, stream_query
+)
 
-class ModerationDatabase:
-    """Gestisce il database SQLite per il sistema di moderazione"""
+
+class ModerationDatabase(ModerationStorage):
+    """Gestisce il database SQLite per il sistema di moderazione (backend di default)"""
     
-    def __init__(self, db_path: str = "data/moderation.db"):
+    def __init__(self, db_path: str = "data/moderation.db", max_readers: int = 4,
+                 write_behind: Optional[Dict[str, int]] = None,
+                 warn_cache_size: int = 50000,
+                 backup: Optional[Dict[str, Any]] = None,
+                 retention: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            db_path: Percorso del file SQLite
+            max_readers: Connessioni di sola lettura nel pool
+            write_behind: Se impostato (anche {}), gli insert di audit in mod_log vengono
+                accodati e scritti a batch. Chiavi opzionali: flush_interval_ms,
+                flush_max_rows, max_queue
+            warn_cache_size: Max coppie (guild, utente) nella cache dei conteggi warn (0 = off)
+            backup: Se impostato, avvia i backup periodici a caldo. Chiavi opzionali:
+                backup_dir, keep_backups, interval_hours, compress, pages_per_step
+            retention: Se impostato, sposta periodicamente le righe vecchie di mod_log
+                nel database di archivio. Chiavi: archive_path, default_days,
+                guild_overrides, chunk_size, vacuum_pages, interval_hours
+        """
         self.db_path = db_path
         self._ensure_data_directory()
+        # Connessioni persistenti: 1 writer + pool di reader (WAL)
+        self._pool = ConnectionManager(db_path, max_readers=max_readers)
+        self._migrations = MigrationRunner(self._pool, MIGRATIONS)
         self._initialize_database()
+        
+        # Cache LRU dei conteggi warn (write-through su add_warn/remove_warn)
+        self._warn_cache: Optional[WarnCountCache] = None
+        if warn_cache_size > 0:
+            self._warn_cache = WarnCountCache(warn_cache_size)
+        
+        # Listener per le nuove scadenze (es. ExpiryScheduler)
+        self._expiry_listeners: List[Callable[[str, int, Any], None]] = []
+        
+        # Write-behind opzionale per gli insert di audit
+        self._write_behind: Optional[WriteBehindQueue] = None
+        if write_behind is not None:
+            self._write_behind = WriteBehindQueue(self._pool, **write_behind)
+        
+        # Backup periodici a caldo (SQLite backup API su thread dedicato)
+        self._backups: Optional[BackupManager] = None
+        if backup is not None:
+            self._backups = BackupManager(db_path, **backup)
+            self._backups.start()
+        
+        # Retention di mod_log: archivio indicizzato + incremental vacuum
+        self._archiver: Optional[LogArchiver] = None
+        if retention is not None:
+            retention = dict(retention)
+            archive_path = retention.pop(
+                "archive_path", os.path.splitext(db_path)[0] + "_archive.db")
+            self._archiver = LogArchiver(self._pool, archive_path, **retention)
+            self._archiver.start()
+    
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], db_path: str = "data/moderation.db") -> ModerationStorage:
+        """Crea il database leggendo le opzioni da config/moderation.json"""
+        write_behind = None
+        wb_config = config.get("write_behind", {})
+        if wb_config.get("enabled", False):
+            write_behind = {
+                key: int(wb_config[key])
+                for key in ("flush_interval_ms", "flush_max_rows", "max_queue")
+                if key in wb_config
+            }
+        
+        # Cache conteggi warn: limite in entry oppure in KB di memoria stimata
+        cache_config = config.get("cache", {})
+        warn_cache_size = int(cache_config.get("warn_count_max_entries", 50000))
+        if "warn_count_max_kb" in cache_config:
+            warn_cache_size = int(cache_config["warn_count_max_kb"]) * 1024 // WarnCountCache.APPROX_ENTRY_BYTES
+        if not cache_config.get("enabled", True):
+            warn_cache_size = 0
+        
+        # Backup: valori numerici come stringhe, come nel resto della config
+        backup = None
+        backup_config = config.get("backup", {})
+        if backup_config.get("enabled", False):
+            backup = {
+                "interval_hours": float(backup_config.get("interval_hours", 24)),
+                "keep_backups": int(backup_config.get("keep_backups", 3)),
+                "compress": bool(backup_config.get("compress", False)),
+            }
+            if backup_config.get("directory"):
+                backup["backup_dir"] = backup_config["directory"]
+        
+        # Retention mod_log: giorni di default + override per guild
+        retention = None
+        retention_config = config.get("retention", {})
+        if retention_config.get("enabled", False):
+            retention = {
+                "default_days": int(retention_config.get("mod_log_days", 180)),
+                "guild_overrides": {
+                    int(guild_id): int(days)
+                    for guild_id, days in retention_config.get("guild_overrides", {}).items()
+                },
+                "interval_hours": float(retention_config.get("interval_hours", 24)),
+                "vacuum_pages": int(retention_config.get("vacuum_pages", 500)),
+            }
+            if retention_config.get("archive_path"):
+                retention["archive_path"] = retention_config["archive_path"]
+        
+        storage_config = config.get("storage", {})
+        mode = storage_config.get("mode", "single")
+        
+        # Database di rete condiviso tra più processi del bot (richiede psycopg)
+        if mode == "postgres":
+            from plugins.utils.pg_storage import PostgresModerationStorage
+            dsn = os.environ.get("MODERATION_DATABASE_URL") or storage_config.get("dsn")
+            if not dsn:
+                raise ValueError("storage.mode = postgres richiede storage.dsn o MODERATION_DATABASE_URL")
+            return PostgresModerationStorage(
+                dsn,
+                min_size=int(storage_config.get("pool_min", 1)),
+                max_size=int(storage_config.get("pool_max", 10)),
+            )
+        
+        # Storage partizionato: un file per guild o N file per hash, stesse opzioni per ogni shard
+        if mode != "single":
+            from plugins.utils.sharded_db import ShardedModerationDatabase
+            max_open = int(storage_config.get("max_open", 64))
+            return ShardedModerationDatabase(
+                storage_config.get("directory") or os.path.splitext(db_path)[0],
+                mode=mode,
+                shards=int(storage_config.get("shards", 16)),
+                max_open=max_open,
+                write_behind=write_behind,
+                # Il limite della cache è globale: diviso tra gli shard aperti
+                warn_cache_size=warn_cache_size and max(1000, warn_cache_size // max_open),
+                backup=backup,
+                retention=retention,
+            )
+        
+        return cls(db_path, write_behind=write_behind, warn_cache_size=warn_cache_size,
+                   backup=backup, retention=retention)
     
     def _ensure_data_directory(self):
         """Crea la directory data se non esiste"""
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
     
-    def _get_connection(self) -> sqlite3.Connection:
-        """Ottiene una connessione al database"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Accesso per nome colonna
-        return conn
+    def close(self):
+        """Chiude le connessioni persistenti del database"""
+        if self._backups is not None:
+            self._backups.stop()
+        if self._archiver is not None:
+            self._archiver.close()
+        self._migrations.stop()
+        # Prima svuota la coda write-behind: nessun audit perso allo shutdown
+        if self._write_behind is not None:
+            self._write_behind.close()
+        self._pool.close()
+    
+    def as_async(self):
+        """Ritorna un AsyncModerationDatabase che condivide questo database"""
+        if getattr(self, "_async_db", None) is None:
+            # Import locale: aiosqlite serve solo a chi usa l'API asincrona
+            from plugins.utils.async_mod_database import AsyncModerationDatabase
+            self._async_db = AsyncModerationDatabase(self)
+        return self._async_db
     
     def _initialize_database(self):
         """Inizializza il database con le tabelle necessarie"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        with self._pool.write() as conn:
+            self._create_tables(conn.cursor())
+        
+        # Migrazioni versionate (indici, backfill, ...) sopra lo schema base
+        self._migrations.run()
+        self._migrations.start_background_backfills()
+    
+    def _create_tables(self, cursor: sqlite3.Cursor):
+        """Crea le tabelle se non esistono (timestamp ed expires_at in millisecondi epoch)"""
         
         # Tabella warns
-        cursor.execute("""
+        cursor.execute(f"""
             CREATE TABLE IF NOT EXISTS warns (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
                 moderator_id INTEGER NOT NULL,
                 guild_id INTEGER NOT NULL,
                 reason TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                timestamp INTEGER DEFAULT ({SQL_NOW_MS})
             )
         """)
         
         # Tabella bans
-        cursor.execute("""
+        cursor.execute(f"""
             CREATE TABLE IF NOT EXISTS bans (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
@@ -54,14 +219,14 @@ class ModerationDatabase:
                 guild_id INTEGER NOT NULL,
                 reason TEXT,
                 duration INTEGER,
-                expires_at DATETIME,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                expires_at INTEGER,
+                timestamp INTEGER DEFAULT ({SQL_NOW_MS}),
                 active BOOLEAN DEFAULT 1
             )
         """)
         
         # Tabella mutes
-        cursor.execute("""
+        cursor.execute(f"""
             CREATE TABLE IF NOT EXISTS mutes (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
@@ -69,26 +234,26 @@ class ModerationDatabase:
                 guild_id INTEGER NOT NULL,
                 reason TEXT,
                 duration INTEGER,
-                expires_at DATETIME,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                expires_at INTEGER,
+                timestamp INTEGER DEFAULT ({SQL_NOW_MS}),
                 active BOOLEAN DEFAULT 1
             )
         """)
         
         # Tabella kicks
-        cursor.execute("""
+        cursor.execute(f"""
             CREATE TABLE IF NOT EXISTS kicks (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER NOT NULL,
                 moderator_id INTEGER NOT NULL,
                 guild_id INTEGER NOT NULL,
                 reason TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                timestamp INTEGER DEFAULT ({SQL_NOW_MS})
             )
         """)
         
         # Tabella mod_log (audit generale)
-        cursor.execute("""
+        cursor.execute(f"""
             CREATE TABLE IF NOT EXISTS mod_log (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 action_type TEXT NOT NULL,
@@ -96,340 +261,875 @@ class ModerationDatabase:
                 moderator_id INTEGER NOT NULL,
                 guild_id INTEGER NOT NULL,
                 details TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                timestamp INTEGER DEFAULT ({SQL_NOW_MS})
             )
         """)
+    
+    def check_query_plans(self) -> List[Dict[str, str]]:
+        """
+        Ritorna le query critiche che non usano un indice (vuoto = tutto ok).
+        I metodi vengono eseguiti davvero, su una copia del database: l'originale non cambia.
+        """
+        from plugins.utils.query_plans import capture_statements, find_plan_regressions
         
-        conn.commit()
-        conn.close()
+        self.flush_audit_log()
+        with tempfile.TemporaryDirectory() as tmp:
+            copy_path = os.path.join(tmp, "plans.db")
+            target = sqlite3.connect(copy_path)
+            try:
+                with self._pool.read() as conn:
+                    conn.backup(target)
+            finally:
+                target.close()
+            
+            # Retention attiva sulla copia, così anche archive_mod_log esegue le sue query
+            copy = ModerationDatabase(copy_path, retention={"archive_path": os.path.join(tmp, "archive.db")})
+            try:
+                statements = capture_statements(copy, copy._pool)
+                with copy._pool.read() as conn:
+                    return find_plan_regressions(conn, statements)
+            finally:
+                copy.close()
     
     # ===== WARNS =====
     
     def add_warn(self, user_id: int, moderator_id: int, guild_id: int, reason: Optional[str] = None) -> int:
         """Aggiunge un warn e ritorna l'ID"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO warns (user_id, moderator_id, guild_id, reason)
-            VALUES (?, ?, ?, ?)
-        """, (user_id, moderator_id, guild_id, reason))
-        
-        warn_id = cursor.lastrowid
-        
-        # Log nell'audit
-        self._add_log(cursor, "WARN", user_id, moderator_id, guild_id, 
-                     f"Warn #{warn_id}: {reason or 'Nessun motivo'}")
+        with self._pool.write() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                INSERT INTO warns (user_id, moderator_id, guild_id, reason, timestamp)
+                VALUES (?, ?, ?, ?, ?)
+            """, (user_id, moderator_id, guild_id, reason, now_ms()))
+            
+            warn_id = cursor.lastrowid
+            
+            # Log nell'audit
+            self._add_log(cursor, "WARN", user_id, moderator_id, guild_id, 
+                         f"Warn #{warn_id}: {reason or 'Nessun motivo'}")
+            
+            # Write-through sotto lock del writer (invalidato se il commit fallisce)
+            self._adjust_warn_cache(guild_id, user_id, +1)
         
-        conn.commit()
-        conn.close()
         return warn_id
     
     def remove_warn(self, warn_id: Optional[int] = None, user_id: Optional[int] = None, 
                     guild_id: Optional[int] = None) -> bool:
         """Rimuove un warn specifico o l'ultimo warn di un utente"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        if warn_id:
-            cursor.execute("DELETE FROM warns WHERE id = ?", (warn_id,))
-        elif user_id and guild_id:
-            # Rimuovi l'ultimo warn
-            cursor.execute("""
-                DELETE FROM warns WHERE id = (
-                    SELECT id FROM warns 
-                    WHERE user_id = ? AND guild_id = ?
-                    ORDER BY timestamp DESC LIMIT 1
-                )
-            """, (user_id, guild_id))
-        else:
-            conn.close()
+        if not warn_id and not (user_id and guild_id):
             return False
         
-        removed = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
+        with self._pool.write() as conn:
+            cursor = conn.cursor()
+            
+            if warn_id:
+                # Serve sapere di chi era il warn per aggiornare la cache
+                row = cursor.execute("SELECT user_id, guild_id FROM warns WHERE id = ?", (warn_id,)).fetchone()
+                if row is None:
+                    return False
+                user_id, guild_id = row["user_id"], row["guild_id"]
+                cursor.execute("DELETE FROM warns WHERE id = ?", (warn_id,))
+            else:
+                # Rimuovi l'ultimo warn
+                cursor.execute("""
+                    DELETE FROM warns WHERE id = (
+                        SELECT id FROM warns 
+                        WHERE user_id = ? AND guild_id = ?
+                        ORDER BY timestamp DESC LIMIT 1
+                    )
+                """, (user_id, guild_id))
+            
+            removed = cursor.rowcount > 0
+            if removed:
+                self._adjust_warn_cache(guild_id, user_id, -1)
+        
         return removed
     
     def get_user_warns(self, user_id: int, guild_id: int) -> List[Dict]:
         """Ottiene tutti i warn di un utente"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT * FROM warns 
-            WHERE user_id = ? AND guild_id = ?
-            ORDER BY timestamp DESC
-        """, (user_id, guild_id))
-        
-        warns = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return warns
+        with self._pool.read() as conn:
+            cursor = conn.execute("""
+                SELECT * FROM warns 
+                WHERE user_id = ? AND guild_id = ?
+                ORDER BY timestamp DESC
+            """, (user_id, guild_id))
+            
+            return [dict(row) for row in cursor.fetchall()]
     
     def get_warn_count(self, user_id: int, guild_id: int) -> int:
-        """Conta i warn di un utente"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        """Conta i warn di un utente (servito dalla cache quando possibile)"""
+        if self._warn_cache is not None:
+            count = self._warn_cache.get(guild_id, user_id)
+            if count is not None:
+                return count
+            
+            # Miss: carica sotto il lock del writer, così nessuna scrittura
+            # può intercalarsi tra la COUNT e l'inserimento in cache
+            with self._pool.serialized() as conn:
+                count = self._count_warns(conn, user_id, guild_id)
+                self._warn_cache.put(guild_id, user_id, count)
+            return count
         
-        cursor.execute("""
+        with self._pool.read() as conn:
+            return self._count_warns(conn, user_id, guild_id)
+    
+    def _count_warns(self, conn: sqlite3.Connection, user_id: int, guild_id: int) -> int:
+        cursor = conn.execute("""
             SELECT COUNT(*) as count FROM warns 
             WHERE user_id = ? AND guild_id = ?
         """, (user_id, guild_id))
         
-        count = cursor.fetchone()['count']
-        conn.close()
-        return count
+        return cursor.fetchone()['count']
+    
+    def _adjust_warn_cache(self, guild_id: int, user_id: int, delta: int):
+        """Aggiorna la cache dentro la transazione; se il commit fallisce la chiave viene scartata"""
+        if self._warn_cache is None:
+            return
+        self._warn_cache.adjust(guild_id, user_id, delta)
+        self._pool.on_rollback(lambda: self._warn_cache.invalidate(guild_id, user_id))
+    
+    def get_warn_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Statistiche hit/miss della cache dei conteggi warn (None se disabilitata)"""
+        if self._warn_cache is None:
+            return None
+        return self._warn_cache.stats()
     
     # ===== BANS =====
     
     def add_ban(self, user_id: int, moderator_id: int, guild_id: int, 
                 reason: Optional[str] = None, duration: Optional[int] = None) -> int:
         """Aggiunge un ban (duration in secondi, None = permanente)"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        expires_at = None
-        if duration:
-            expires_at = datetime.now() + timedelta(seconds=duration)
-        
-        cursor.execute("""
-            INSERT INTO bans (user_id, moderator_id, guild_id, reason, duration, expires_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (user_id, moderator_id, guild_id, reason, duration, expires_at))
+        timestamp = now_ms()
+        expires_at = timestamp + duration * 1000 if duration else None
         
-        ban_id = cursor.lastrowid
-        
-        # Log
-        ban_type = "temporaneo" if duration else "permanente"
-        self._add_log(cursor, "BAN", user_id, moderator_id, guild_id,
-                     f"Ban {ban_type}: {reason or 'Nessun motivo'}")
+        with self._pool.write() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                INSERT INTO bans (user_id, moderator_id, guild_id, reason, duration, expires_at, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, moderator_id, guild_id, reason, duration, expires_at, timestamp))
+            
+            ban_id = cursor.lastrowid
+            
+            # Log
+            ban_type = "temporaneo" if duration else "permanente"
+            self._add_log(cursor, "BAN", user_id, moderator_id, guild_id,
+                         f"Ban {ban_type}: {reason or 'Nessun motivo'}")
         
-        conn.commit()
-        conn.close()
+        if expires_at is not None:
+            self._notify_expiry("ban", ban_id, expires_at)
         return ban_id
     
     def remove_ban(self, user_id: int, guild_id: int) -> bool:
         """Rimuove un ban (setta active = 0)"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE bans SET active = 0 
-            WHERE user_id = ? AND guild_id = ? AND active = 1
-        """, (user_id, guild_id))
-        
-        removed = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
-        return removed
+        with self._pool.write() as conn:
+            cursor = conn.execute("""
+                UPDATE bans SET active = 0 
+                WHERE user_id = ? AND guild_id = ? AND active = 1
+            """, (user_id, guild_id))
+            
+            return cursor.rowcount > 0
     
     def get_active_bans(self, guild_id: Optional[int] = None) -> List[Dict]:
         """Ottiene tutti i ban attivi (opzionalmente filtrati per guild)"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
+        with self._pool.read() as conn:
+            if guild_id:
+                cursor = conn.execute("""
+                    SELECT * FROM bans 
+                    WHERE guild_id = ? AND active = 1
+                    ORDER BY timestamp DESC
+                """, (guild_id,))
+            else:
+                cursor = conn.execute("""
+                    SELECT * FROM bans 
+                    WHERE active = 1
+                    ORDER BY timestamp DESC
+                """)
+            
+            return [dict(row) for row in cursor.fetchall()]
+    
+    # ===== BULK =====
+    
+    # Limite di variabili per IN (...) ben sotto SQLITE_MAX_VARIABLE_NUMBER
+    BULK_CHUNK = 500
+    
+    def _add_punishments_bulk(self, kind: str, user_ids: List[int], moderator_id: int, guild_id: int,
+                              reason: Optional[str], duration: Optional[int]) -> List[int]:
+        """Insert di ban/mute multipli + log in una sola transazione, ritorna gli id nello stesso ordine"""
+        user_ids = list(dict.fromkeys(user_ids))  # Rimuove i duplicati mantenendo l'ordine
+        if not user_ids:
+            return []
         
-        if guild_id:
-            cursor.execute("""
-                SELECT * FROM bans 
-                WHERE guild_id = ? AND active = 1
-                ORDER BY timestamp DESC
-            """, (guild_id,))
-        else:
-            cursor.execute("""
-                SELECT * FROM bans 
-                WHERE active = 1
-                ORDER BY timestamp DESC
-            """)
+        table = self.EXPIRY_TABLES[kind]
+        timestamp = now_ms()
+        expires_at = timestamp + duration * 1000 if duration else None
+        
+        with self._pool.write() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(f"""
+                INSERT INTO {table} (user_id, moderator_id, guild_id, reason, duration, expires_at, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, [(user_id, moderator_id, guild_id, reason, duration, expires_at, timestamp)
+                  for user_id in user_ids])
+            
+            # AUTOINCREMENT + writer esclusivo: gli id della transazione sono consecutivi
+            last_id = cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+            ids = list(range(last_id - len(user_ids) + 1, last_id + 1))
+            
+            # Log
+            punishment_type = "temporaneo" if duration else "permanente"
+            details = f"{kind.capitalize()} {punishment_type}: {reason or 'Nessun motivo'}"
+            self._add_logs(cursor, [
+                (kind.upper(), user_id, moderator_id, guild_id, details) for user_id in user_ids
+            ])
+        
+        if expires_at is not None:
+            for punishment_id in ids:
+                self._notify_expiry(kind, punishment_id, expires_at)
+        return ids
+    
+    def _remove_punishments_bulk(self, kind: str, user_ids: List[int], guild_id: int) -> List[int]:
+        """Disattiva ban/mute attivi di più utenti in una transazione, ritorna gli utenti interessati"""
+        table = self.EXPIRY_TABLES[kind]
+        user_ids = list(dict.fromkeys(user_ids))
+        removed = []
+        
+        with self._pool.write() as conn:
+            for start in range(0, len(user_ids), self.BULK_CHUNK):
+                chunk = user_ids[start:start + self.BULK_CHUNK]
+                placeholders = ", ".join("?" * len(chunk))
+                cursor = conn.execute(f"""
+                    SELECT DISTINCT user_id FROM {table}
+                    WHERE guild_id = ? AND user_id IN ({placeholders}) AND active = 1
+                """, (guild_id, *chunk))
+                found = [row["user_id"] for row in cursor]
+                if not found:
+                    continue
+                conn.execute(f"""
+                    UPDATE {table} SET active = 0 
+                    WHERE guild_id = ? AND user_id IN ({', '.join('?' * len(found))}) AND active = 1
+                """, (guild_id, *found))
+                removed += found
         
-        bans = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return bans
+        return removed
+    
+    def add_bans_bulk(self, user_ids: List[int], moderator_id: int, guild_id: int,
+                      reason: Optional[str] = None, duration: Optional[int] = None) -> List[int]:
+        """Ban di più utenti in una transazione (es. raid); ritorna gli id dei ban"""
+        return self._add_punishments_bulk("ban", user_ids, moderator_id, guild_id, reason, duration)
+    
+    def remove_bans_bulk(self, user_ids: List[int], guild_id: int) -> List[int]:
+        """Revoca i ban attivi di più utenti; ritorna gli user_id effettivamente sbannati"""
+        return self._remove_punishments_bulk("ban", user_ids, guild_id)
+    
+    def add_mutes_bulk(self, user_ids: List[int], moderator_id: int, guild_id: int,
+                       reason: Optional[str] = None, duration: Optional[int] = None) -> List[int]:
+        """Mute di più utenti in una transazione; ritorna gli id dei mute"""
+        return self._add_punishments_bulk("mute", user_ids, moderator_id, guild_id, reason, duration)
+    
+    def remove_mutes_bulk(self, user_ids: List[int], guild_id: int) -> List[int]:
+        """Revoca i mute attivi di più utenti; ritorna gli user_id effettivamente smutati"""
+        return self._remove_punishments_bulk("mute", user_ids, guild_id)
     
     # ===== MUTES =====
     
     def add_mute(self, user_id: int, moderator_id: int, guild_id: int,
                  reason: Optional[str] = None, duration: Optional[int] = None) -> int:
         """Aggiunge un mute (duration in secondi, None = permanente)"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        expires_at = None
-        if duration:
-            expires_at = datetime.now() + timedelta(seconds=duration)
+        timestamp = now_ms()
+        expires_at = timestamp + duration * 1000 if duration else None
         
-        cursor.execute("""
-            INSERT INTO mutes (user_id, moderator_id, guild_id, reason, duration, expires_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (user_id, moderator_id, guild_id, reason, duration, expires_at))
-        
-        mute_id = cursor.lastrowid
-        
-        # Log
-        mute_type = "temporaneo" if duration else "permanente"
-        self._add_log(cursor, "MUTE", user_id, moderator_id, guild_id,
-                     f"Mute {mute_type}: {reason or 'Nessun motivo'}")
+        with self._pool.write() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                INSERT INTO mutes (user_id, moderator_id, guild_id, reason, duration, expires_at, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, moderator_id, guild_id, reason, duration, expires_at, timestamp))
+            
+            mute_id = cursor.lastrowid
+            
+            # Log
+            mute_type = "temporaneo" if duration else "permanente"
+            self._add_log(cursor, "MUTE", user_id, moderator_id, guild_id,
+                         f"Mute {mute_type}: {reason or 'Nessun motivo'}")
         
-        conn.commit()
-        conn.close()
+        if expires_at is not None:
+            self._notify_expiry("mute", mute_id, expires_at)
         return mute_id
     
     def remove_mute(self, user_id: int, guild_id: int) -> bool:
         """Rimuove un mute (setta active = 0)"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            UPDATE mutes SET active = 0 
-            WHERE user_id = ? AND guild_id = ? AND active = 1
-        """, (user_id, guild_id))
-        
-        removed = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
-        return removed
+        with self._pool.write() as conn:
+            cursor = conn.execute("""
+                UPDATE mutes SET active = 0 
+                WHERE user_id = ? AND guild_id = ? AND active = 1
+            """, (user_id, guild_id))
+            
+            return cursor.rowcount > 0
     
     def get_active_mutes(self, guild_id: Optional[int] = None) -> List[Dict]:
         """Ottiene tutti i mute attivi"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        if guild_id:
-            cursor.execute("""
-                SELECT * FROM mutes 
-                WHERE guild_id = ? AND active = 1
-                ORDER BY timestamp DESC
-            """, (guild_id,))
-        else:
-            cursor.execute("""
-                SELECT * FROM mutes 
-                WHERE active = 1
-                ORDER BY timestamp DESC
-            """)
-        
-        mutes = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return mutes
+        with self._pool.read() as conn:
+            if guild_id:
+                cursor = conn.execute("""
+                    SELECT * FROM mutes 
+                    WHERE guild_id = ? AND active = 1
+                    ORDER BY timestamp DESC
+                """, (guild_id,))
+            else:
+                cursor = conn.execute("""
+                    SELECT * FROM mutes 
+                    WHERE active = 1
+                    ORDER BY timestamp DESC
+                """)
+            
+            return [dict(row) for row in cursor.fetchall()]
     
     # ===== KICKS =====
     
     def add_kick(self, user_id: int, moderator_id: int, guild_id: int, 
                  reason: Optional[str] = None) -> int:
         """Aggiunge un kick"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            INSERT INTO kicks (user_id, moderator_id, guild_id, reason)
-            VALUES (?, ?, ?, ?)
-        """, (user_id, moderator_id, guild_id, reason))
-        
-        kick_id = cursor.lastrowid
-        
-        # Log
-        self._add_log(cursor, "KICK", user_id, moderator_id, guild_id,
-                     f"Kick: {reason or 'Nessun motivo'}")
+        with self._pool.write() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                INSERT INTO kicks (user_id, moderator_id, guild_id, reason, timestamp)
+                VALUES (?, ?, ?, ?, ?)
+            """, (user_id, moderator_id, guild_id, reason, now_ms()))
+            
+            kick_id = cursor.lastrowid
+            
+            # Log
+            self._add_log(cursor, "KICK", user_id, moderator_id, guild_id,
+                         f"Kick: {reason or 'Nessun motivo'}")
         
-        conn.commit()
-        conn.close()
         return kick_id
     
     # ===== UTILITIES =====
     
+    _LOG_INSERT = """
+        INSERT INTO mod_log (action_type, user_id, moderator_id, guild_id, details, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """
+    
     def _add_log(self, cursor: sqlite3.Cursor, action_type: str, user_id: int, 
                  moderator_id: int, guild_id: int, details: str):
         """Aggiunge un entry nel log di moderazione"""
-        cursor.execute("""
-            INSERT INTO mod_log (action_type, user_id, moderator_id, guild_id, details)
-            VALUES (?, ?, ?, ?, ?)
-        """, (action_type, user_id, moderator_id, guild_id, details))
+        # Timestamp esplicito: con il write-behind la riga viene scritta più tardi dal flusher
+        params = (action_type, user_id, moderator_id, guild_id, details, now_ms())
+        if self._write_behind is not None:
+            entry_id = self._write_behind.enqueue(cursor.connection, self._LOG_INSERT, params)
+            if entry_id is not None:
+                # Se l'azione va in rollback l'audit in coda non deve essere scritto
+                self._pool.on_rollback(lambda: self._write_behind.discard(entry_id))
+            return
+        
+        cursor.execute(self._LOG_INSERT, params)
+    
+    def _add_logs(self, cursor: sqlite3.Cursor, entries: List[Tuple[str, int, int, int, str]]):
+        """Versione multipla di _add_log: (action_type, user_id, moderator_id, guild_id, details)"""
+        if self._write_behind is not None:
+            for entry in entries:
+                self._add_log(cursor, *entry)
+            return
+        
+        timestamp = now_ms()
+        cursor.executemany(self._LOG_INSERT, [entry + (timestamp,) for entry in entries])
+    
+    def get_mod_log(self, guild_id: int, user_id: Optional[int] = None, limit: int = 50,
+                    include_archive: bool = True) -> List[Dict]:
+        """Log di moderazione (più recenti prima), completato dall'archivio se necessario"""
+        self.flush_audit_log()
+        
+        query = "SELECT * FROM mod_log WHERE guild_id = ?"
+        params: List[Any] = [guild_id]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        query += " ORDER BY timestamp DESC LIMIT ?"
+        params.append(limit)
+        
+        with self._pool.read() as conn:
+            entries = [dict(row) for row in conn.execute(query, params)]
+        
+        # Le righe archiviate sono sempre più vecchie di quelle ancora nel DB principale
+        if include_archive and self._archiver is not None and len(entries) < limit:
+            entries += self._archiver.get_archived_log(
+                guild_id, user_id, before=entries[-1]["timestamp"] if entries else None,
+                limit=limit - len(entries))
+        return entries
+    
+    def archive_mod_log(self) -> Optional[Dict[str, Any]]:
+        """Esegue subito un giro di retention (None se la retention è disabilitata)"""
+        if self._archiver is None:
+            return None
+        self.flush_audit_log()
+        return self._archiver.run()
+    
+    def get_retention_stats(self) -> Optional[Dict[str, Any]]:
+        """Stato dell'archivio di mod_log (None se la retention è disabilitata)"""
+        if self._archiver is None:
+            return None
+        return self._archiver.stats()
+    
+    def backup_now(self, **options) -> Dict[str, Any]:
+        """
+        Esegue subito un backup online (anche se i backup periodici sono spenti).
+        Le opzioni sovrascrivono quelle configurate (backup_dir, keep_backups, compress, ...).
+        """
+        self.flush_audit_log()
+        manager = self._backups
+        if manager is None or options:
+            settings = {}
+            if manager is not None:
+                settings = {
+                    "backup_dir": manager.backup_dir,
+                    "keep_backups": manager.keep_backups,
+                    "compress": manager.compress,
+                    "pages_per_step": manager.pages_per_step,
+                }
+            settings.update(options)
+            manager = BackupManager(self.db_path, **settings)
+        return manager.backup_now()
+    
+    def get_backup_stats(self) -> Optional[Dict[str, Any]]:
+        """Durata e dimensione degli ultimi backup (None se i backup periodici sono spenti)"""
+        if self._backups is None:
+            return None
+        return self._backups.stats()
+    
+    def flush_audit_log(self) -> int:
+        """Scrive subito gli audit in coda (no-op senza write-behind)"""
+        if self._write_behind is None:
+            return 0
+        return self._write_behind.flush()
+    
+    def get_write_behind_stats(self) -> Optional[Dict[str, Any]]:
+        """Metriche della coda write-behind (None se disabilitata)"""
+        if self._write_behind is None:
+            return None
+        return self._write_behind.stats()
     
     def cleanup_expired(self) -> Dict[str, int]:
         """Rimuove ban e mute scaduti, ritorna conteggi"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        now = datetime.now()
-        
-        # Conta ban scaduti
-        cursor.execute("""
-            SELECT COUNT(*) as count FROM bans 
-            WHERE active = 1 AND expires_at IS NOT NULL AND expires_at <= ?
-        """, (now,))
-        expired_bans = cursor.fetchone()['count']
-        
-        # Rimuovi ban scaduti
-        cursor.execute("""
-            UPDATE bans SET active = 0 
-            WHERE active = 1 AND expires_at IS NOT NULL AND expires_at <= ?
-        """, (now,))
-        
-        # Conta mute scaduti
-        cursor.execute("""
-            SELECT COUNT(*) as count FROM mutes 
-            WHERE active = 1 AND expires_at IS NOT NULL AND expires_at <= ?
-        """, (now,))
-        expired_mutes = cursor.fetchone()['count']
-        
-        # Rimuovi mute scaduti
-        cursor.execute("""
-            UPDATE mutes SET active = 0 
-            WHERE active = 1 AND expires_at IS NOT NULL AND expires_at <= ?
-        """, (now,))
-        
-        conn.commit()
-        conn.close()
+        now = now_ms()
+        
+        with self._pool.write() as conn:
+            cursor = conn.cursor()
+            
+            # Conta ban scaduti
+            cursor.execute("""
+                SELECT COUNT(*) as count FROM bans 
+                WHERE active = 1 AND expires_at IS NOT NULL AND expires_at <= ?
+            """, (now,))
+            expired_bans = cursor.fetchone()['count']
+            
+            # Rimuovi ban scaduti
+            cursor.execute("""
+                UPDATE bans SET active = 0 
+                WHERE active = 1 AND expires_at IS NOT NULL AND expires_at <= ?
+            """, (now,))
+            
+            # Conta mute scaduti
+            cursor.execute("""
+                SELECT COUNT(*) as count FROM mutes 
+                WHERE active = 1 AND expires_at IS NOT NULL AND expires_at <= ?
+            """, (now,))
+            expired_mutes = cursor.fetchone()['count']
+            
+            # Rimuovi mute scaduti
+            cursor.execute("""
+                UPDATE mutes SET active = 0 
+                WHERE active = 1 AND expires_at IS NOT NULL AND expires_at <= ?
+            """, (now,))
         
         return {"bans": expired_bans, "mutes": expired_mutes}
     
+    # ===== SCADENZE =====
+    
+    def get_pending_expirations(self) -> List[Dict]:
+        """Ban e mute attivi con scadenza (solo l'indice parziale idx_*_expiry, niente scan)"""
+        with self._pool.read() as conn:
+            pending = []
+            for kind, table in self.EXPIRY_TABLES.items():
+                cursor = conn.execute(f"""
+                    SELECT id, expires_at FROM {table} 
+                    WHERE active = 1 AND expires_at IS NOT NULL
+                    ORDER BY expires_at
+                """)
+                pending += [{"kind": kind, "id": row["id"], "expires_at": row["expires_at"]}
+                            for row in cursor]
+            return pending
+    
+    def expire_punishments(self, items: List[Tuple[str, int]]) -> List[Tuple[str, Dict]]:
+        """
+        Disattiva esattamente le punizioni indicate (kind, id), per primary key.
+        Ritorna solo quelle effettivamente disattivate: le già revocate e quelle non ancora
+        scadute (es. id notificato per errore) vengono saltate.
+        """
+        lifted = []
+        now = now_ms()
+        with self._pool.write() as conn:
+            for kind, punishment_id in items:
+                table = self.EXPIRY_TABLES[kind]
+                cursor = conn.execute(f"""
+                    UPDATE {table} SET active = 0 
+                    WHERE id = ? AND active = 1 AND expires_at IS NOT NULL AND expires_at <= ?
+                """, (punishment_id, now))
+                if cursor.rowcount > 0:
+                    row = conn.execute(f"SELECT * FROM {table} WHERE id = ?", (punishment_id,)).fetchone()
+                    lifted.append((kind, dict(row)))
+        return lifted
+    
+    def get_active_expiries(self, items: List[Tuple[str, int]]) -> Dict[Tuple[str, int], int]:
+        """expires_at delle punizioni (kind, id) ancora attive con scadenza (es. saltate da expire_punishments)"""
+        expiries = {}
+        with self._pool.read() as conn:
+            for kind, punishment_id in items:
+                row = conn.execute(f"""
+                    SELECT expires_at FROM {self.EXPIRY_TABLES[kind]}
+                    WHERE id = ? AND active = 1 AND expires_at IS NOT NULL
+                """, (punishment_id,)).fetchone()
+                if row is not None:
+                    expiries[(kind, punishment_id)] = row["expires_at"]
+        return expiries
+    
     def get_user_history(self, user_id: int, guild_id: int) -> Dict[str, Any]:
         """Ottiene tutto lo storico di moderazione di un utente"""
-        return {
-            "warns": self.get_user_warns(user_id, guild_id),
-            "bans": self._get_user_bans(user_id, guild_id),
-            "mutes": self._get_user_mutes(user_id, guild_id),
-            "kicks": self._get_user_kicks(user_id, guild_id)
-        }
+        # Una sola connessione per tutte e quattro le tabelle
+        with self._pool.read() as conn:
+            return {
+                table: [dict(row) for row in conn.execute(f"""
+                    SELECT * FROM {table} 
+                    WHERE user_id = ? AND guild_id = ?
+                    ORDER BY timestamp DESC
+                """, (user_id, guild_id))]
+                for table in ("warns", "bans", "mutes", "kicks")
+            }
     
-    def _get_user_bans(self, user_id: int, guild_id: int) -> List[Dict]:
-        """Ottiene tutti i ban di un utente"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
+    def _history_page_query(self, user_id: int, guild_id: int, limit: int = 10,
+                            cursor: Optional[str] = None,
+                            types: Optional[List[str]] = None) -> tuple:
+        """Costruisce la query UNION ALL paginata (keyset su timestamp, id, tipo)"""
+        selected = [t for t in (types or self.HISTORY_TYPES) if t in self.HISTORY_TYPES]
+        if not selected:
+            raise ValueError(f"Tipi non validi: {types}. Validi: {', '.join(self.HISTORY_TYPES)}")
         
-        cursor.execute("""
-            SELECT * FROM bans 
-            WHERE user_id = ? AND guild_id = ?
-            ORDER BY timestamp DESC
-        """, (user_id, guild_id))
+        after = json.loads(cursor) if cursor else None
+        branches = []
+        params: List[Any] = []
+        
+        for type_name in selected:
+            table, rank = self.HISTORY_TYPES[type_name]
+            has_expiry = table in ("bans", "mutes")
+            sql = f"""
+                SELECT '{type_name}' AS type, {rank} AS type_rank, id, moderator_id, reason,
+                       {'duration, expires_at, active' if has_expiry else 'NULL AS duration, NULL AS expires_at, NULL AS active'}, timestamp
+                FROM {table}
+                WHERE guild_id = ? AND user_id = ?"""
+            params += [guild_id, user_id]
+            if after:
+                # timestamp <= ? abilita il range sull'indice, la row value rende esatto il keyset
+                sql += f" AND timestamp <= ? AND (timestamp, id, {rank}) < (?, ?, ?)"
+                params += [after[0], after[0], after[1], after[2]]
+            branches.append(sql)
         
-        bans = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return bans
+        # Ogni ramo è già ordinato dall'indice: SQLite fa un MERGE senza sort e si ferma al LIMIT
+        query = (
+            "\nUNION ALL\n".join(branches)
+            + "\nORDER BY timestamp DESC, id DESC, type_rank DESC LIMIT ?"
+        )
+        params.append(max(1, min(limit, self.MAX_HISTORY_PAGE)) + 1)
+        return query, tuple(params)
     
-    def _get_user_mutes(self, user_id: int, guild_id: int) -> List[Dict]:
-        """Ottiene tutti i mute di un utente"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
+    def get_user_history_page(self, user_id: int, guild_id: int, limit: int = 10,
+                              cursor: Optional[str] = None,
+                              types: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Storico unificato e paginato di un utente (una sola query).
         
-        cursor.execute("""
-            SELECT * FROM mutes 
-            WHERE user_id = ? AND guild_id = ?
-            ORDER BY timestamp DESC
-        """, (user_id, guild_id))
+        Args:
+            limit: Righe per pagina (max MAX_HISTORY_PAGE)
+            cursor: Valore 'next_cursor' della pagina precedente (None = prima pagina)
+            types: Filtra per tipo ("warn", "ban", "mute", "kick"); None = tutti
         
-        mutes = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return mutes
+        Returns:
+            {"items": [...], "next_cursor": str | None}
+        """
+        query, params = self._history_page_query(user_id, guild_id, limit, cursor, types)
+        with self._pool.read() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return self._history_page_result(rows, limit)
     
-    def _get_user_kicks(self, user_id: int, guild_id: int) -> List[Dict]:
-        """Ottiene tutti i kick di un utente"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
+    # ===== RICERCA =====
+    
+    @staticmethod
+    def _fts_query(text: str) -> str:
+        """Converte il testo dello staff in una query FTS5 sicura (parole in AND, "frasi", prefisso*)"""
+        terms = []
+        for phrase, word in re.findall(r'"([^"]+)"|(\S+)', text):
+            term = phrase or word.replace('"', "")
+            prefix = not phrase and term.endswith("*")
+            term = term.rstrip("*")
+            if term:
+                terms.append('"' + term + '"' + ("*" if prefix else ""))
+        return " ".join(terms)
+    
+    def search_actions(self, guild_id: int, query: str, limit: int = 25,
+                       types: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Ricerca full-text su motivi (warn, ban, mute, kick) e dettagli del mod_log.
         
-        cursor.execute("""
-            SELECT * FROM kicks 
-            WHERE user_id = ? AND guild_id = ?
-            ORDER BY timestamp DESC
-        """, (user_id, guild_id))
+        Args:
+            query: Parole da cercare (tutte obbligatorie); "frase esatta" e prefisso* supportati
+            limit: Numero massimo di risultati (max MAX_SEARCH_RESULTS)
+            types: Filtra per tipo ("warn", "ban", "mute", "kick", "log"); None = tutti
+        
+        Returns:
+            Righe originali ordinate per rilevanza (bm25), con "type", "score" e "snippet"
+        """
+        terms = self._fts_query(query)
+        if not terms:
+            return []
+        selected = self._search_types(types)
+        limit = max(1, min(limit, self.MAX_SEARCH_RESULTS))
+        
+        # Le righe di mod_log in coda non sono ancora indicizzate
+        self.flush_audit_log()
         
-        kicks = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return kicks
+        # Il filtro per guild è un termine del MATCH: l'indice restituisce solo le righe della guild
+        match = f'guild_id : "{int(guild_id)}" AND body : ({terms})'
+        sql = """
+            SELECT kind, source_id, rank AS score,
+                   snippet(action_search, 0, '**', '**', '…', 16) AS snippet
+            FROM action_search
+            WHERE action_search MATCH ?"""
+        params: List[Any] = [match]
+        if types:
+            sql += f" AND kind IN ({', '.join('?' * len(selected))})"
+            params += selected
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+        
+        with self._pool.read() as conn:
+            hits = conn.execute(sql, params).fetchall()
+            
+            # Carica le righe originali con una query per tabella (lookup per chiave primaria)
+            ids_by_kind: Dict[str, List[int]] = {}
+            for hit in hits:
+                ids_by_kind.setdefault(hit["kind"], []).append(hit["source_id"])
+            rows: Dict[Tuple[str, int], Dict] = {}
+            for kind, ids in ids_by_kind.items():
+                cursor = conn.execute(
+                    f"SELECT * FROM {self.SEARCH_SOURCES[kind]} WHERE id IN ({', '.join('?' * len(ids))})",
+                    ids
+                )
+                for row in cursor:
+                    rows[(kind, row["id"])] = dict(row)
+        
+        results = []
+        for hit in hits:
+            row = rows.get((hit["kind"], hit["source_id"]))
+            if row is None:
+                continue  # Cancellata tra le due query
+            row.update(type=hit["kind"], score=hit["score"], snippet=hit["snippet"])
+            results.append(row)
+        return results
+    
+    # ===== STATISTICHE =====
+    
+    def get_guild_stats(self, guild_id: int, since: Any = None, top_moderators: int = 10) -> Dict[str, Any]:
+        """
+        Statistiche di una guild dai rollup giornalieri (mai dalle tabelle grezze).
+        
+        Args:
+            since: Inizio del periodo (ms epoch, datetime o ISO); arrotondato al giorno UTC.
+                None = tutto lo storico
+            top_moderators: Quanti moderatori includere nella classifica
+        
+        Returns:
+            {"totals": {azione: n}, "by_day": [{"day", "counts"}], "top_moderators": [...]}
+        """
+        first_day = to_epoch_ms(since) // DAY_MS if since is not None else 0
+        
+        # Gli audit ancora in coda non sono ancora stati contati
+        self.flush_audit_log()
+        
+        with self._pool.read() as conn:
+            daily = conn.execute("""
+                SELECT day, action_type, count FROM mod_stats_daily
+                WHERE guild_id = ? AND day >= ?
+                ORDER BY day
+            """, (guild_id, first_day)).fetchall()
+            moderators = conn.execute("""
+                SELECT moderator_id, action_type, SUM(count) AS count FROM mod_stats_moderators
+                WHERE guild_id = ? AND day >= ?
+                GROUP BY moderator_id, action_type
+            """, (guild_id, first_day)).fetchall()
+        
+        return self._guild_stats_result(guild_id, first_day if since is not None else None,
+                                        daily, moderators, top_moderators)
+    
+    # ===== EXPORT / IMPORT =====
+    
+    def export_guild(self, guild_id: int, fp: TextIO, format: str = "jsonl",
+                     include_archive: bool = True, chunk_size: int = 1000) -> Dict[str, int]:
+        """
+        Esporta in streaming tutto lo storico di una guild (memoria costante).
+        
+        Args:
+            fp: File di testo aperto in scrittura
+            format: "jsonl" (una riga JSON per record, con intestazione) o "csv"
+            include_archive: Include le righe di mod_log spostate nell'archivio
+            chunk_size: Righe lette per fetchmany
+        
+        Returns:
+            Righe esportate per tabella
+        """
+        writer = ExportWriter(fp, format, guild_id)
+        self.flush_audit_log()
+        
+        with self._pool.read() as conn:
+            # Una transazione di lettura: snapshot coerente tra le tabelle (WAL non blocca il writer)
+            own_transaction = not conn.in_transaction
+            if own_transaction:
+                conn.execute("BEGIN")
+            try:
+                for table in EXPORT_TABLES:
+                    query = f"SELECT {', '.join(TABLE_COLUMNS[table])} FROM {table} WHERE guild_id = ?"
+                    for rows in stream_query(conn, query, (guild_id,), chunk_size):
+                        writer.write_rows(table, rows)
+            finally:
+                if own_transaction:
+                    conn.execute("COMMIT")
+        
+        if include_archive and self._archiver is not None:
+            for rows in self._archiver.iter_guild(guild_id, chunk_size):
+                writer.write_rows("mod_log", rows)
+        return writer.counts
+    
+    def import_stream(self, fp: TextIO, format: Optional[str] = None, batch_size: int = 1000,
+                      keep_ids: bool = False) -> Dict[str, int]:
+        """
+        Importa un export (JSONL o CSV, rilevato dalla prima riga) a batch.
+        
+        Args:
+            fp: File di testo aperto in lettura
+            batch_size: Righe per transazione (il writer non resta bloccato per tutto l'import)
+            keep_ids: Mantiene gli id originali (le righe già presenti vengono saltate);
+                di default gli id vengono riassegnati, per unire storici di host diversi
+        
+        Returns:
+            Righe inserite per tabella
+        """
+        counts: Dict[str, int] = {}
+        buffers: Dict[str, List[Dict[str, Any]]] = {table: [] for table in TABLE_COLUMNS}
+        
+        for table, row in iter_import_rows(fp, format):
+            buffers[table].append(row)
+            if len(buffers[table]) >= batch_size:
+                counts[table] = counts.get(table, 0) + self._import_batch(table, buffers[table], keep_ids)
+                buffers[table] = []
+        
+        for table, rows in buffers.items():
+            if rows:
+                counts[table] = counts.get(table, 0) + self._import_batch(table, rows, keep_ids)
+        return counts
+    
+    def _import_batch(self, table: str, rows: List[Dict[str, Any]], keep_ids: bool = False) -> int:
+        """Inserisce un batch di righe importate in una transazione, ritorna le righe inserite"""
+        # executemany richiede le stesse colonne: raggruppa per insieme di chiavi
+        groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        for row in rows:
+            columns = tuple(key for key in TABLE_COLUMNS[table] if key in row and (keep_ids or key != "id"))
+            groups.setdefault(columns, []).append(row)
+        
+        inserted = 0
+        expiries = []
+        with self._pool.write() as conn:
+            for columns, group in groups.items():
+                # Con keep_ids le righe con id già presente vengono ignorate dall'INSERT:
+                # vanno escluse anche dalle notifiche, l'id appartiene a un'altra punizione
+                skipped_ids = set()
+                if keep_ids and "id" in columns and table in ("bans", "mutes"):
+                    skipped_ids = self._existing_ids(conn, table, [row["id"] for row in group])
+                
+                cursor = conn.executemany(f"""
+                    INSERT {'OR IGNORE ' if keep_ids else ''}INTO {table} ({', '.join(columns)})
+                    VALUES ({', '.join('?' * len(columns))})
+                """, [tuple(row[key] for key in columns) for row in group])
+                inserted += cursor.rowcount
+                
+                if table in ("bans", "mutes") and "expires_at" in columns:
+                    if keep_ids and "id" in columns:
+                        ids = []
+                        for row in group:
+                            # Anche i duplicati nello stesso batch: vince solo la prima riga
+                            ids.append(None if row["id"] in skipped_ids else row["id"])
+                            skipped_ids.add(row["id"])
+                    else:
+                        # Stesso principio di _add_punishments_bulk: id consecutivi
+                        last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                        ids = list(range(last_id - len(group) + 1, last_id + 1))
+                    expiries += [
+                        (punishment_id, row["expires_at"]) for punishment_id, row in zip(ids, group)
+                        if punishment_id is not None and row.get("expires_at") is not None
+                        and row.get("active", 1)
+                    ]
+            
+            if table == "warns" and self._warn_cache is not None:
+                for guild_id in {row["guild_id"] for row in rows}:
+                    self._warn_cache.invalidate(guild_id)
+        
+        kind = {"bans": "ban", "mutes": "mute"}.get(table)
+        for punishment_id, expires_at in expiries:
+            self._notify_expiry(kind, punishment_id, expires_at)
+        return inserted
+    
+    @staticmethod
+    def _existing_ids(conn: sqlite3.Connection, table: str, ids: List[int]) -> set:
+        """Id già presenti in tabella (a blocchi, sotto il limite di parametri di SQLite)"""
+        existing = set()
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            cursor = conn.execute(
+                f"SELECT id FROM {table} WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+            existing.update(row["id"] for row in cursor)
+        return existing
+    
+    def _get_user_bans(self, user_id: int, guild_id: int) -> List[Dict]:
+        """Ottiene tutti i ban di un utente"""
+        with self._pool.read() as conn:
+            cursor = conn.execute("""
+                SELECT * FROM bans 
+                WHERE user_id = ? AND guild_id = ?
+                ORDER BY timestamp DESC
+            """, (user_id, guild_id))
+            
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def _get_user_mutes(self, user_id: int, guild_id: int) -> List[Dict]:
+        """Ottiene tutti i mute di un utente"""
+        with self._pool.read() as conn:
+            cursor = conn.execute("""
+                SELECT * FROM mutes 
+                WHERE user_id = ? AND guild_id = ?
+                ORDER BY timestamp DESC
+            """, (user_id, guild_id))
+            
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def _get_user_kicks(self, user_id: int, guild_id: int) -> List[Dict]:
+        """Ottiene tutti i kick di un utente"""
+        with self._pool.read() as conn:
+            cursor = conn.execute("""
+                SELECT * FROM kicks 
+                WHERE user_id = ? AND guild_id = ?
+                ORDER BY timestamp DESC
+            """, (user_id, guild_id))
+            
+            return [dict(row) for row in cursor.fetchall()]
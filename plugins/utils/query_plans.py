@@ -0,0 +1,147 @@
+"""
+Controllo regressioni dei query plan per il database di moderazione
+Esegue i metodi reali di ModerationDatabase su una copia usa e getta del database, cattura
+l'SQL effettivo con sqlite3.set_trace_callback e ne fa EXPLAIN QUERY PLAN: segnala full
+table scan e sort temporanei. Nessuna lista di query da tenere allineata a mano.
+
+Uso:
+    python -m plugins.utils.query_plans [data/moderation.db]
+
+Senza argomenti parte da un database nuovo (schema e migrazioni correnti); con un percorso
+lavora su una copia, così i piani usano anche le statistiche (sqlite_stat1) del database reale.
+Esce con codice 1 se almeno una query fa un full table scan o un sort temporaneo (utile in CI).
+"""
+
+import io
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+from typing import Any, Callable, Dict, List, Tuple
+
+# Guild sintetica usata dal workload
+GUILD_ID = 1
+USER_ID = 1001
+MODERATOR_ID = 2002
+RAID = [3001, 3002, 3003]
+
+# Metodi critici con argomenti realistici, in ordine (prima le scritture che popolano la copia)
+WORKLOAD: List[Tuple[str, Callable[[Any], Any]]] = [
+    ("add_warn", lambda db: db.add_warn(USER_ID, MODERATOR_ID, GUILD_ID, "spam")),
+    ("add_ban", lambda db: db.add_ban(USER_ID, MODERATOR_ID, GUILD_ID, "raid", duration=3600)),
+    ("add_mute", lambda db: db.add_mute(USER_ID, MODERATOR_ID, GUILD_ID, "caps", duration=3600)),
+    ("add_kick", lambda db: db.add_kick(USER_ID, MODERATOR_ID, GUILD_ID, "bye")),
+    ("add_bans_bulk", lambda db: db.add_bans_bulk(RAID, MODERATOR_ID, GUILD_ID, "raid")),
+    ("add_mutes_bulk", lambda db: db.add_mutes_bulk(RAID, MODERATOR_ID, GUILD_ID, duration=60)),
+    ("get_user_warns", lambda db: db.get_user_warns(USER_ID, GUILD_ID)),
+    ("get_warn_count", lambda db: db.get_warn_count(USER_ID, GUILD_ID)),
+    ("get_active_bans", lambda db: db.get_active_bans(GUILD_ID)),
+    ("get_active_bans_all", lambda db: db.get_active_bans()),
+    ("get_active_mutes", lambda db: db.get_active_mutes(GUILD_ID)),
+    ("get_active_mutes_all", lambda db: db.get_active_mutes()),
+    ("get_pending_expirations", lambda db: db.get_pending_expirations()),
+    ("expire_punishments", lambda db: db.expire_punishments([("ban", 1), ("mute", 1)])),
+    ("cleanup_expired", lambda db: db.cleanup_expired()),
+    ("get_mod_log", lambda db: db.get_mod_log(GUILD_ID)),
+    ("get_mod_log_user", lambda db: db.get_mod_log(GUILD_ID, user_id=USER_ID)),
+    ("get_user_history", lambda db: db.get_user_history(USER_ID, GUILD_ID)),
+    ("get_user_history_page", lambda db: db.get_user_history_page(USER_ID, GUILD_ID, limit=1)),
+    ("get_user_history_page_cursor", lambda db: db.get_user_history_page(
+        USER_ID, GUILD_ID, limit=1,
+        cursor=db.get_user_history_page(USER_ID, GUILD_ID, limit=1)["next_cursor"])),
+    ("search_actions", lambda db: db.search_actions(GUILD_ID, "raid")),
+    ("get_guild_stats", lambda db: db.get_guild_stats(GUILD_ID, since=0)),
+    ("export_guild", lambda db: db.export_guild(GUILD_ID, io.StringIO())),
+    ("archive_mod_log", lambda db: db.archive_mod_log()),
+    ("remove_bans_bulk", lambda db: db.remove_bans_bulk(RAID, GUILD_ID)),
+    ("remove_mutes_bulk", lambda db: db.remove_mutes_bulk(RAID, GUILD_ID)),
+    ("remove_warn", lambda db: db.remove_warn(user_id=USER_ID, guild_id=GUILD_ID)),
+    ("remove_ban", lambda db: db.remove_ban(USER_ID, GUILD_ID)),
+    ("remove_mute", lambda db: db.remove_mute(USER_ID, GUILD_ID)),
+]
+
+# Istruzioni con un query plan (niente BEGIN/COMMIT/PRAGMA né righe "-- TRIGGER")
+_EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "INSERT", "REPLACE", "WITH")
+
+# "SCAN warns" senza indice = full table scan
+_FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)$")
+_TEMP_SORT = "USE TEMP B-TREE FOR ORDER BY"
+
+
+def capture_statements(db, pool) -> Dict[str, List[str]]:
+    """
+    Esegue WORKLOAD su db (una copia: scrive!) e ritorna l'SQL eseguito da ogni metodo,
+    con i parametri già sostituiti. pool è il ConnectionManager di db.
+    """
+    captured: Dict[str, List[str]] = {}
+    current = {"name": None}
+    owner = threading.get_ident()
+
+    def trace(statement: str):
+        # Solo il thread del workload: i thread di servizio (flusher, archivio) hanno il loro SQL
+        if threading.get_ident() != owner or current["name"] is None:
+            return
+        if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+            return
+        statements = captured.setdefault(current["name"], [])
+        if statement not in statements:
+            statements.append(statement)
+
+    pool.set_trace_callback(trace)
+    try:
+        for name, call in WORKLOAD:
+            current["name"] = name
+            call(db)
+    finally:
+        current["name"] = None
+        pool.set_trace_callback(None)
+    return captured
+
+
+def explain(conn: sqlite3.Connection, query: str, params: tuple = ()) -> List[str]:
+    """Ritorna le righe 'detail' di EXPLAIN QUERY PLAN per una query"""
+    rows = conn.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+    return [row[3] for row in rows]
+
+
+def find_plan_regressions(conn: sqlite3.Connection,
+                          statements: Dict[str, List[str]]) -> List[Dict[str, str]]:
+    """Ritorna le istruzioni che fanno full scan o ordinano con una B-tree temporanea"""
+    regressions = []
+    for name, queries in statements.items():
+        for query in queries:
+            for detail in explain(conn, query):
+                if _FULL_SCAN.match(detail):
+                    problem = "full table scan"
+                elif detail == _TEMP_SORT:
+                    problem = "temp b-tree sort"
+                else:
+                    continue
+                regressions.append({"query": name, "problem": problem, "plan": detail, "sql": query})
+    return regressions
+
+
+def main(argv: List[str]) -> int:
+    from plugins.utils.mod_database import ModerationDatabase
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = ModerationDatabase(argv[0] if argv else os.path.join(tmp, "moderation.db"))
+        try:
+            regressions = db.check_query_plans()
+        finally:
+            db.close()
+
+    if not regressions:
+        print(f"✅ [ModDB] {len(WORKLOAD)} metodi critici: nessun full scan")
+        return 0
+
+    for item in regressions:
+        sql = " ".join(item["sql"].split())
+        print(f"❌ [ModDB] {item['query']}: {item['problem']} ({item['plan']})\n    {sql}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
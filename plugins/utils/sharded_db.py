@@ -0,0 +1,458 @@
+"""
+Storage partizionato per il database di moderazione
+Un file SQLite per guild (o uno di N file scelti per hash) dietro un router con cache limitata di handle aperti
+"""
+
+import asyncio
+import functools
+import glob
+import heapq
+import inspect
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from plugins.utils.data_transfer import iter_import_rows
+from plugins.utils.mod_database import ModerationDatabase
+from plugins.utils.storage import ModerationStorage
+
+# Id di una punizione in modalità partizionata: (shard, id locale al file)
+ShardKey = Tuple[str, int]
+
+
+class ShardRouter:
+    """
+    Mappa guild -> file SQLite e tiene aperti al massimo max_open shard.
+
+    mode="guild": un file per guild (guild_<id>.db)
+    mode="hash":  shards file fissi (shard_<n>.db), guild assegnata con crc32
+
+    Ogni shard è un ModerationDatabase completo (writer, reader, migrazioni),
+    quindi un raid su una guild blocca solo il writer del suo file. Gli shard
+    in uso sono protetti da un contatore: l'LRU chiude solo quelli inattivi.
+    """
+
+    _GUILD_FILE = re.compile(r"^guild_(\d+)\.db$")
+
+    def __init__(self, directory: str, factory: Callable[[str], ModerationDatabase],
+                 mode: str = "guild", shards: int = 16, max_open: int = 64):
+        if mode not in ("guild", "hash"):
+            raise ValueError(f"Modalità di storage non valida: {mode} (guild, hash)")
+        self.directory = directory
+        self.factory = factory
+        self.mode = mode
+        self.shards = max(1, shards)
+        self.max_open = max(1, max_open)
+
+        os.makedirs(directory, exist_ok=True)
+        self._open: "OrderedDict[str, ModerationDatabase]" = OrderedDict()
+        self._in_use: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._evicted = 0
+
+    def shard_for(self, guild_id: int) -> str:
+        """Nome dello shard (senza estensione) che contiene la guild"""
+        if self.mode == "guild":
+            return f"guild_{int(guild_id)}"
+        return f"shard_{zlib.crc32(str(int(guild_id)).encode()) % self.shards:03d}"
+
+    def all_shards(self) -> List[str]:
+        """Shard esistenti su disco (per le query cross-guild)"""
+        if self.mode == "hash":
+            return [f"shard_{n:03d}" for n in range(self.shards)]
+        names = (os.path.basename(path) for path in glob.glob(os.path.join(self.directory, "guild_*.db")))
+        return sorted(name[:-3] for name in names if self._GUILD_FILE.match(name))
+
+    def _path(self, shard: str) -> str:
+        return os.path.join(self.directory, f"{shard}.db")
+
+    @contextmanager
+    def use(self, shard: str) -> Iterator[ModerationDatabase]:
+        """Presta lo shard (aprendolo se necessario); non viene chiuso finché è in uso"""
+        with self._lock:
+            db = self._open.get(shard)
+            if db is not None:
+                self._open.move_to_end(shard)
+            self._in_use[shard] = self._in_use.get(shard, 0) + 1
+
+        if db is None:
+            try:
+                db = self._open_shard(shard)
+            except BaseException:
+                with self._lock:
+                    self._release(shard)
+                raise
+
+        try:
+            yield db
+        finally:
+            with self._lock:
+                self._release(shard)
+            self._evict()
+
+    def _open_shard(self, shard: str) -> ModerationDatabase:
+        # Apertura fuori dal lock globale (migrazioni incluse), poi doppio controllo
+        db = self.factory(self._path(shard))
+        with self._lock:
+            existing = self._open.get(shard)
+            if existing is None:
+                self._open[shard] = db
+                self._opened += 1
+                return db
+        db.close()
+        return existing
+
+    def _release(self, shard: str):
+        count = self._in_use.get(shard, 0) - 1
+        if count > 0:
+            self._in_use[shard] = count
+        else:
+            self._in_use.pop(shard, None)
+
+    def _evict(self):
+        """Chiude gli shard inattivi meno usati oltre max_open"""
+        to_close = []
+        with self._lock:
+            excess = len(self._open) - self.max_open
+            for shard in list(self._open):
+                if excess <= 0:
+                    break
+                if shard not in self._in_use:
+                    to_close.append(self._open.pop(shard))
+                    excess -= 1
+            self._evicted += len(to_close)
+        for db in to_close:
+            db.close()
+
+    @contextmanager
+    def for_guild(self, guild_id: int) -> Iterator[ModerationDatabase]:
+        with self.use(self.shard_for(guild_id)) as db:
+            yield db
+
+    def open_shards(self) -> List[ModerationDatabase]:
+        with self._lock:
+            return list(self._open.values())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "open": len(self._open),
+                "max_open": self.max_open,
+                "in_use": sum(self._in_use.values()),
+                "opened": self._opened,
+                "evicted": self._evicted,
+            }
+
+    def close(self):
+        with self._lock:
+            shards, self._open = list(self._open.values()), OrderedDict()
+        for db in shards:
+            db.close()
+
+
+class ShardedModerationDatabase:
+    """
+    Stessa interfaccia di ModerationDatabase su storage partizionato per guild.
+
+    I metodi con guild_id vengono instradati allo shard della guild (con lo
+    stesso signature del metodo originale). Le query senza guild
+    (get_active_bans(None), cleanup_expired, scadenze, ...) vengono eseguite
+    su ogni shard e unite; manutenzione e statistiche ritornano un dict
+    {shard: risultato}. Gli id delle punizioni sono locali al file: per le
+    scadenze il database usa chiavi (shard, id), trasparenti per ExpiryScheduler.
+
+    Usage:
+        db = ShardedModerationDatabase("data/moderation", mode="hash", shards=16)
+        db.add_ban(user_id, moderator_id, guild_id, "Raid")
+        bans = db.get_active_bans()  # fan-out su tutti gli shard
+    """
+
+    def __init__(self, directory: str = "data/moderation", mode: str = "guild", shards: int = 16,
+                 max_open: int = 64, **shard_options):
+        """
+        Args:
+            directory: Cartella dei file degli shard
+            mode: "guild" (un file per guild) o "hash" (shards file)
+            max_open: Massimo di shard aperti contemporaneamente (LRU)
+            shard_options: Opzioni passate a ogni ModerationDatabase (write_behind,
+                warn_cache_size, backup, retention, max_readers)
+        """
+        self.directory = directory
+        self._expiry_listeners: List[Callable[[str, Any, Any], None]] = []
+        self._shard_options = dict(shard_options)
+        self._shard_options.setdefault("max_readers", 2)
+        self.router = ShardRouter(directory, self._open_shard, mode, shards, max_open)
+
+    def _open_shard(self, path: str) -> ModerationDatabase:
+        options = dict(self._shard_options)
+        shard = os.path.splitext(os.path.basename(path))[0]
+        if options.get("backup") is not None:
+            backup = dict(options["backup"])
+            backup["backup_dir"] = os.path.join(
+                backup.get("backup_dir") or os.path.join(self.directory, "backups"), shard)
+            options["backup"] = backup
+        if options.get("retention") is not None:
+            retention = dict(options["retention"])
+            retention["archive_path"] = os.path.join(self.directory, "archive", f"{shard}_archive.db")
+            options["retention"] = retention
+
+        db = ModerationDatabase(path, **options)
+        db.add_expiry_listener(
+            lambda kind, punishment_id, expires_at: self._notify_expiry(kind, (shard, punishment_id), expires_at)
+        )
+        return db
+
+    # ===== ROUTING PER GUILD =====
+
+    def __getattr__(self, name: str):
+        method = getattr(ModerationDatabase, name, None)
+        if name.startswith("_") or not callable(method):
+            raise AttributeError(name)
+        signature = inspect.signature(method)
+        if "guild_id" not in signature.parameters:
+            raise AttributeError(f"{name} non è disponibile in modalità partizionata")
+
+        def routed(*args, **kwargs):
+            bound = signature.bind(None, *args, **kwargs)
+            guild_id = bound.arguments.get("guild_id")
+            if guild_id is None:
+                raise ValueError(f"{name} richiede guild_id in modalità partizionata")
+            with self.router.for_guild(guild_id) as db:
+                return getattr(db, name)(*args, **kwargs)
+
+        routed.__name__ = name
+        routed.__doc__ = method.__doc__
+        return routed
+
+    def remove_warn(self, warn_id: Optional[int] = None, user_id: Optional[int] = None,
+                    guild_id: Optional[int] = None) -> bool:
+        """Rimuove un warn; senza guild_id l'id viene cercato su tutti gli shard"""
+        if guild_id:
+            with self.router.for_guild(guild_id) as db:
+                return db.remove_warn(warn_id, user_id, guild_id)
+        if not warn_id:
+            return False
+        return any(self._fan_out(lambda db: db.remove_warn(warn_id)))
+
+    # ===== FAN-OUT =====
+
+    def _fan_out(self, fn: Callable[[ModerationDatabase], Any]) -> Iterator[Any]:
+        """Esegue fn su ogni shard esistente, uno alla volta (rispetta max_open)"""
+        for shard in self.router.all_shards():
+            with self.router.use(shard) as db:
+                yield fn(db)
+
+    def _merge_by_timestamp(self, results: Iterator[List[Dict]]) -> List[Dict]:
+        # Ogni shard ritorna già ORDER BY timestamp DESC: basta un merge
+        return list(heapq.merge(*results, key=lambda row: row["timestamp"], reverse=True))
+
+    def get_active_bans(self, guild_id: Optional[int] = None) -> List[Dict]:
+        """Ban attivi di una guild, o di tutte le guild (fan-out + merge)"""
+        if guild_id:
+            with self.router.for_guild(guild_id) as db:
+                return db.get_active_bans(guild_id)
+        return self._merge_by_timestamp(self._fan_out(lambda db: db.get_active_bans()))
+
+    def get_active_mutes(self, guild_id: Optional[int] = None) -> List[Dict]:
+        """Mute attivi di una guild, o di tutte le guild (fan-out + merge)"""
+        if guild_id:
+            with self.router.for_guild(guild_id) as db:
+                return db.get_active_mutes(guild_id)
+        return self._merge_by_timestamp(self._fan_out(lambda db: db.get_active_mutes()))
+
+    def cleanup_expired(self) -> Dict[str, int]:
+        """Rimuove ban e mute scaduti su tutti gli shard"""
+        totals = {"bans": 0, "mutes": 0}
+        for result in self._fan_out(lambda db: db.cleanup_expired()):
+            for key in totals:
+                totals[key] += result[key]
+        return totals
+
+    def import_stream(self, fp: TextIO, format: Optional[str] = None, batch_size: int = 1000,
+                      keep_ids: bool = False) -> Dict[str, int]:
+        """Come ModerationDatabase.import_stream, con le righe smistate nello shard della loro guild"""
+        counts: Dict[str, int] = {}
+        buffers: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+
+        def flush(shard: str, table: str):
+            rows = buffers.pop((shard, table))
+            with self.router.use(shard) as db:
+                counts[table] = counts.get(table, 0) + db._import_batch(table, rows, keep_ids)
+
+        for table, row in iter_import_rows(fp, format):
+            key = (self.router.shard_for(row["guild_id"]), table)
+            buffers.setdefault(key, []).append(row)
+            if len(buffers[key]) >= batch_size:
+                flush(*key)
+
+        for key in list(buffers):
+            flush(*key)
+        return counts
+
+    # ===== SCADENZE =====
+
+    def add_expiry_listener(self, callback: Callable[[str, Any, Any], None]):
+        """Come ModerationDatabase.add_expiry_listener, con id (shard, id)"""
+        if callback not in self._expiry_listeners:
+            self._expiry_listeners.append(callback)
+
+    def remove_expiry_listener(self, callback: Callable[[str, Any, Any], None]):
+        if callback in self._expiry_listeners:
+            self._expiry_listeners.remove(callback)
+
+    def _notify_expiry(self, kind: str, key: ShardKey, expires_at: Any):
+        for callback in list(self._expiry_listeners):
+            try:
+                callback(kind, key, expires_at)
+            except Exception as e:
+                print(f"❌ [ModDB] Errore listener scadenze: {e}")
+
+    def get_pending_expirations(self) -> List[Dict]:
+        """Scadenze attive di tutti gli shard, con id (shard, id)"""
+        pending = []
+        for shard in self.router.all_shards():
+            with self.router.use(shard) as db:
+                pending += [dict(row, id=(shard, row["id"])) for row in db.get_pending_expirations()]
+        pending.sort(key=lambda row: row["expires_at"])
+        return pending
+
+    def expire_punishments(self, items: List[Tuple[str, ShardKey]]) -> List[Tuple[str, Dict]]:
+        """Disattiva le punizioni (kind, (shard, id)), raggruppate per shard"""
+        by_shard: Dict[str, List[Tuple[str, int]]] = {}
+        for kind, (shard, punishment_id) in items:
+            by_shard.setdefault(shard, []).append((kind, punishment_id))
+        lifted = []
+        for shard, shard_items in by_shard.items():
+            with self.router.use(shard) as db:
+                lifted += db.expire_punishments(shard_items)
+        return lifted
+
+    def get_active_expiries(self, items: List[Tuple[str, ShardKey]]) -> Dict[Tuple[str, ShardKey], int]:
+        """Come ModerationDatabase.get_active_expiries, con id (shard, id)"""
+        by_shard: Dict[str, List[Tuple[str, int]]] = {}
+        for kind, (shard, punishment_id) in items:
+            by_shard.setdefault(shard, []).append((kind, punishment_id))
+        expiries = {}
+        for shard, shard_items in by_shard.items():
+            with self.router.use(shard) as db:
+                for (kind, punishment_id), expires_at in db.get_active_expiries(shard_items).items():
+                    expiries[(kind, (shard, punishment_id))] = expires_at
+        return expiries
+
+    # ===== MANUTENZIONE =====
+
+    @staticmethod
+    def _shard_name(db: ModerationDatabase) -> str:
+        return os.path.splitext(os.path.basename(db.db_path))[0]
+
+    def _per_shard(self, fn: Callable[[ModerationDatabase], Any]) -> Dict[str, Any]:
+        """fn su ogni shard esistente, risultati per nome dello shard"""
+        results = {}
+        for shard in self.router.all_shards():
+            with self.router.use(shard) as db:
+                results[shard] = fn(db)
+        return results
+
+    def _open_stats(self, enabled: bool, fn: Callable[[ModerationDatabase], Any]) -> Optional[Dict[str, Any]]:
+        """Statistiche in memoria degli shard aperti (None se la funzione è disattivata)"""
+        if not enabled:
+            return None
+        return {self._shard_name(db): fn(db) for db in self.router.open_shards()}
+
+    def flush_audit_log(self) -> int:
+        """Svuota le code write-behind degli shard aperti"""
+        return sum(db.flush_audit_log() for db in self.router.open_shards())
+
+    def archive_mod_log(self) -> Optional[Dict[str, Any]]:
+        """Un giro di retention su ogni shard (None se la retention è disabilitata)"""
+        if self._shard_options.get("retention") is None:
+            return None
+        return self._per_shard(lambda db: db.archive_mod_log())
+
+    def backup_now(self, **options) -> Dict[str, Any]:
+        """Backup online di ogni shard, uno alla volta (stesse opzioni di ModerationDatabase.backup_now)"""
+        return self._per_shard(lambda db: db.backup_now(**options))
+
+    def get_write_behind_stats(self) -> Optional[Dict[str, Any]]:
+        return self._open_stats(self._shard_options.get("write_behind") is not None,
+                                lambda db: db.get_write_behind_stats())
+
+    def get_warn_cache_stats(self) -> Optional[Dict[str, Any]]:
+        return self._open_stats(bool(self._shard_options.get("warn_cache_size", 50000)),
+                                lambda db: db.get_warn_cache_stats())
+
+    def get_backup_stats(self) -> Optional[Dict[str, Any]]:
+        return self._open_stats(self._shard_options.get("backup") is not None,
+                                lambda db: db.get_backup_stats())
+
+    def get_retention_stats(self) -> Optional[Dict[str, Any]]:
+        return self._open_stats(self._shard_options.get("retention") is not None,
+                                lambda db: db.get_retention_stats())
+
+    def check_query_plans(self) -> List[Dict[str, str]]:
+        """Controllo dei query plan su uno shard (schema e indici sono identici)"""
+        shards = self.router.all_shards()
+        if not shards:
+            return []
+        with self.router.use(shards[0]) as db:
+            return db.check_query_plans()
+
+    def get_shard_stats(self) -> Dict[str, Any]:
+        """Stato del router (shard aperti, aperture, chiusure LRU)"""
+        stats = self.router.stats()
+        stats["shards_on_disk"] = len(self.router.all_shards())
+        return stats
+
+    def as_async(self) -> "AsyncShardedModerationDatabase":
+        """Versione asyncio: ogni metodo (instradato o fan-out) gira in un thread"""
+        if getattr(self, "_async_db", None) is None:
+            self._async_db = AsyncShardedModerationDatabase(self)
+        return self._async_db
+
+    def close(self):
+        """Chiude tutti gli shard aperti"""
+        self.router.close()
+
+
+class AsyncShardedModerationDatabase:
+    """
+    Shim asyncio per lo storage partizionato.
+
+    AsyncModerationDatabase usa una connessione aiosqlite per file e non conosce il
+    router: qui ogni metodo pubblico diventa una coroutine eseguita con asyncio.to_thread,
+    come fa il fallback di AsyncModerationDatabase per i metodi non migrati.
+
+    Usage:
+        adb = sharded_db.as_async()
+        count = await adb.get_warn_count(user_id, guild_id)
+    """
+
+    def __init__(self, sync_db: ShardedModerationDatabase):
+        self.sync = sync_db
+
+    async def close(self, close_sync: bool = False):
+        if close_sync:
+            await asyncio.to_thread(self.sync.close)
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        attr = getattr(self.sync, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            return await asyncio.to_thread(attr, *args, **kwargs)
+
+        return wrapper
+
+
+# Implementa l'interfaccia per delega (__getattr__), non per ereditarietà
+ModerationStorage.register(ShardedModerationDatabase)
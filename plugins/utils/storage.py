@@ -0,0 +1,385 @@
+"""
+Interfaccia astratta dello storage di moderazione
+ModerationDatabase (SQLite) è l'implementazione di default; PostgresModerationStorage condivide lo stato tra più processi
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, TextIO, Tuple
+
+from plugins.utils.migrations import DAY_MS, FTS_SOURCES
+
+ExpiryListener = Callable[[str, Any, Any], None]
+
+
+class ModerationStorage(ABC):
+    """
+    Operazioni che ogni backend deve fornire ai plugin.
+
+    Convenzioni comuni a tutti i backend:
+    - timestamp ed expires_at sono interi in millisecondi epoch (UTC)
+    - le righe ritornate sono dict con gli stessi nomi di colonna
+
+    Gli id delle punizioni passati ai listener sono opachi: vanno solo
+    ripassati a expire_punishments e get_active_expiries.
+
+    Le funzioni accessorie (ricerca full-text, statistiche, export/import)
+    sono opzionali: i backend che non le supportano sollevano NotImplementedError.
+    """
+
+    # Tipo punizione con scadenza -> tabella
+    EXPIRY_TABLES = {"ban": "bans", "mute": "mutes"}
+
+    # Tipo azione -> (tabella, rank usato come terza chiave dell'ordinamento)
+    HISTORY_TYPES = {"kick": ("kicks", 1), "mute": ("mutes", 2), "ban": ("bans", 3), "warn": ("warns", 4)}
+    MAX_HISTORY_PAGE = 100
+
+    # Tipo per search_actions -> tabella
+    SEARCH_SOURCES = {kind: table for kind, table, _column, _code in FTS_SOURCES}
+    MAX_SEARCH_RESULTS = 100
+
+    # ===== WARNS =====
+
+    @abstractmethod
+    def add_warn(self, user_id: int, moderator_id: int, guild_id: int, reason: Optional[str] = None) -> int:
+        ...
+
+    @abstractmethod
+    def remove_warn(self, warn_id: Optional[int] = None, user_id: Optional[int] = None,
+                    guild_id: Optional[int] = None) -> bool:
+        ...
+
+    @abstractmethod
+    def get_user_warns(self, user_id: int, guild_id: int) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def get_warn_count(self, user_id: int, guild_id: int) -> int:
+        ...
+
+    # ===== BANS / MUTES / KICKS =====
+
+    @abstractmethod
+    def add_ban(self, user_id: int, moderator_id: int, guild_id: int,
+                reason: Optional[str] = None, duration: Optional[int] = None) -> int:
+        ...
+
+    @abstractmethod
+    def remove_ban(self, user_id: int, guild_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    def get_active_bans(self, guild_id: Optional[int] = None) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def add_mute(self, user_id: int, moderator_id: int, guild_id: int,
+                 reason: Optional[str] = None, duration: Optional[int] = None) -> int:
+        ...
+
+    @abstractmethod
+    def remove_mute(self, user_id: int, guild_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    def get_active_mutes(self, guild_id: Optional[int] = None) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def add_kick(self, user_id: int, moderator_id: int, guild_id: int,
+                 reason: Optional[str] = None) -> int:
+        ...
+
+    @abstractmethod
+    def add_bans_bulk(self, user_ids: Iterable[int], moderator_id: int, guild_id: int,
+                      reason: Optional[str] = None, duration: Optional[int] = None) -> List[int]:
+        ...
+
+    @abstractmethod
+    def remove_bans_bulk(self, user_ids: Iterable[int], guild_id: int) -> List[int]:
+        ...
+
+    @abstractmethod
+    def add_mutes_bulk(self, user_ids: Iterable[int], moderator_id: int, guild_id: int,
+                       reason: Optional[str] = None, duration: Optional[int] = None) -> List[int]:
+        ...
+
+    @abstractmethod
+    def remove_mutes_bulk(self, user_ids: Iterable[int], guild_id: int) -> List[int]:
+        ...
+
+    # ===== LOG E STORICO =====
+
+    @abstractmethod
+    def get_mod_log(self, guild_id: int, user_id: Optional[int] = None, limit: int = 50,
+                    include_archive: bool = True) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def get_user_history(self, user_id: int, guild_id: int) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def get_user_history_page(self, user_id: int, guild_id: int, limit: int = 10,
+                              cursor: Optional[str] = None,
+                              types: Optional[List[str]] = None) -> Dict[str, Any]:
+        ...
+
+    def _history_page_result(self, rows: List[Sequence[Any]], limit: int) -> Dict[str, Any]:
+        """Converte le righe della pagina e calcola il cursore successivo (formato comune ai backend)"""
+        limit = max(1, min(limit, self.MAX_HISTORY_PAGE))
+        items = []
+        for row in rows[:limit]:
+            item = dict(zip(
+                ("type", "type_rank", "id", "moderator_id", "reason", "duration",
+                 "expires_at", "active", "timestamp"),
+                tuple(row)
+            ))
+            items.append(item)
+
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            next_cursor = json.dumps([last["timestamp"], last["id"], last["type_rank"]])
+
+        for item in items:
+            del item["type_rank"]
+        return {"items": items, "next_cursor": next_cursor}
+
+    # ===== SCADENZE =====
+
+    @abstractmethod
+    def cleanup_expired(self) -> Dict[str, int]:
+        ...
+
+    # I backend inizializzano self._expiry_listeners = [] nel costruttore
+    _expiry_listeners: List[ExpiryListener]
+
+    def add_expiry_listener(self, callback: ExpiryListener):
+        """Registra una callback (kind, id, expires_at) chiamata dopo ogni ban/mute temporaneo"""
+        if callback not in self._expiry_listeners:
+            self._expiry_listeners.append(callback)
+
+    def remove_expiry_listener(self, callback: ExpiryListener):
+        """Rimuove una callback registrata con add_expiry_listener"""
+        if callback in self._expiry_listeners:
+            self._expiry_listeners.remove(callback)
+
+    def _notify_expiry(self, kind: str, punishment_id: Any, expires_at: Any):
+        for callback in list(self._expiry_listeners):
+            try:
+                callback(kind, punishment_id, expires_at)
+            except Exception as e:
+                print(f"❌ [ModDB] Errore listener scadenze: {e}")
+
+    @abstractmethod
+    def get_pending_expirations(self) -> List[Dict]:
+        ...
+
+    @abstractmethod
+    def expire_punishments(self, items: List[Tuple[str, Any]]) -> List[Tuple[str, Dict]]:
+        ...
+
+    @abstractmethod
+    def get_active_expiries(self, items: List[Tuple[str, Any]]) -> Dict[Tuple[str, Any], int]:
+        """expires_at delle punizioni (kind, id) ancora attive con scadenza; le altre non compaiono"""
+        ...
+
+    # ===== OPZIONALI =====
+
+    def search_actions(self, guild_id: int, query: str, limit: int = 25,
+                       types: Optional[List[str]] = None) -> List[Dict]:
+        raise NotImplementedError(f"{type(self).__name__} non supporta la ricerca full-text")
+
+    def _search_types(self, types: Optional[List[str]]) -> List[str]:
+        """Tipi richiesti a search_actions, validati (None = tutti)"""
+        selected = set(types or self.SEARCH_SOURCES)
+        if not selected <= set(self.SEARCH_SOURCES):
+            raise ValueError(f"Tipi non validi: {types}. Validi: {', '.join(self.SEARCH_SOURCES)}")
+        return sorted(selected)
+
+    def get_guild_stats(self, guild_id: int, since: Any = None, top_moderators: int = 10) -> Dict[str, Any]:
+        raise NotImplementedError(f"{type(self).__name__} non supporta le statistiche")
+
+    def _guild_stats_result(self, guild_id: int, first_day: Optional[int], daily: Iterable[Sequence[Any]],
+                            moderators: Iterable[Sequence[Any]], top_moderators: int) -> Dict[str, Any]:
+        """
+        Formato comune di get_guild_stats.
+        daily: righe (day, action_type, count); moderators: righe (moderator_id, action_type, count)
+        """
+        totals: Dict[str, int] = {}
+        by_day: Dict[int, Dict[str, int]] = {}
+        for day, action_type, count in daily:
+            totals[action_type] = totals.get(action_type, 0) + count
+            by_day.setdefault(day, {})[action_type] = count
+
+        per_moderator: Dict[int, Dict[str, int]] = {}
+        for moderator_id, action_type, count in moderators:
+            per_moderator.setdefault(moderator_id, {})[action_type] = count
+        ranking = sorted(per_moderator.items(), key=lambda item: sum(item[1].values()), reverse=True)
+
+        return {
+            "guild_id": guild_id,
+            "since": first_day * DAY_MS if first_day is not None else None,
+            "totals": totals,
+            "by_day": [
+                {
+                    "day": datetime.fromtimestamp(day * DAY_MS / 1000, tz=timezone.utc).strftime("%Y-%m-%d"),
+                    "counts": counts,
+                }
+                for day, counts in sorted(by_day.items())
+            ],
+            "top_moderators": [
+                {"moderator_id": moderator_id, "total": sum(actions.values()), "actions": actions}
+                for moderator_id, actions in ranking[:top_moderators]
+            ],
+        }
+
+    def export_guild(self, guild_id: int, fp: TextIO, format: str = "jsonl",
+                     include_archive: bool = True, chunk_size: int = 1000) -> Dict[str, int]:
+        raise NotImplementedError(f"{type(self).__name__} non supporta l'export")
+
+    def import_stream(self, fp: TextIO, format: Optional[str] = None, batch_size: int = 1000,
+                      keep_ids: bool = False) -> Dict[str, int]:
+        raise NotImplementedError(f"{type(self).__name__} non supporta l'import")
+
+    def flush_audit_log(self) -> int:
+        return 0
+
+    def check_query_plans(self) -> List[Dict[str, str]]:
+        return []
+
+    @abstractmethod
+    def close(self):
+        ...
+
+
+def check_storage(db: ModerationStorage, guild_id: Optional[int] = None) -> List[str]:
+    """
+    Verifica di conformità di un backend: stesse operazioni, stessi risultati.
+    Scrive dati in una guild sintetica (nuova a ogni esecuzione): da usare su un database usa e getta.
+    Ritorna la lista dei controlli falliti (vuota = tutto ok).
+    """
+    failures: List[str] = []
+    guild_id = guild_id or 9 * 10 ** 17 + time.time_ns() // 1000
+
+    def expect(name: str, condition: bool):
+        if not condition:
+            failures.append(name)
+
+    notified: List[Tuple[str, Any, Any]] = []
+    listener = lambda kind, key, expires_at: notified.append((kind, key, expires_at))  # noqa: E731
+    db.add_expiry_listener(listener)
+    try:
+        user, moderator = 1001, 2002
+        first = db.add_warn(user, moderator, guild_id, "spam")
+        db.add_warn(user, moderator, guild_id, "flood")
+        expect("get_warn_count dopo add_warn", db.get_warn_count(user, guild_id) == 2)
+        expect("get_user_warns ordinati", [w["reason"] for w in db.get_user_warns(user, guild_id)] == ["flood", "spam"])
+        expect("remove_warn per id", db.remove_warn(warn_id=first))
+        expect("remove_warn ultimo", db.remove_warn(user_id=user, guild_id=guild_id))
+        expect("remove_warn senza warn", not db.remove_warn(user_id=user, guild_id=guild_id))
+        expect("get_warn_count dopo remove", db.get_warn_count(user, guild_id) == 0)
+
+        ban_id = db.add_ban(user, moderator, guild_id, "raid", duration=3600)
+        expect("listener su ban temporaneo", len(notified) == 1 and notified[0][0] == "ban")
+        bans = db.get_active_bans(guild_id)
+        expect("get_active_bans", len(bans) == 1 and bans[0]["active"] == 1
+               and bans[0]["expires_at"] - bans[0]["timestamp"] == 3600 * 1000)
+        expect("get_pending_expirations", any(p["kind"] == "ban" for p in db.get_pending_expirations()))
+        expect("expire_punishments non scaduto", db.expire_punishments([("ban", notified[0][1])]) == [])
+        expect("get_active_expiries", db.get_active_expiries([("ban", notified[0][1])])
+               == {("ban", notified[0][1]): notified[0][2]})
+        expect("remove_ban", db.remove_ban(user, guild_id))
+
+        db.add_ban(user + 1, moderator, guild_id, "raid", duration=1)
+        time.sleep(1.05)
+        lifted = db.expire_punishments([("ban", notified[1][1])])
+        expect("expire_punishments", len(lifted) == 1 and lifted[0][1]["user_id"] == user + 1)
+        expect("expire_punishments idempotente", db.expire_punishments([("ban", notified[1][1])]) == [])
+        expect("remove_ban già scaduto", not db.remove_ban(user + 1, guild_id))
+        expect("get_active_expiries dopo la scadenza", db.get_active_expiries([("ban", notified[1][1])]) == {})
+
+        db.add_mute(user, moderator, guild_id, "caps")
+        expect("remove_mute", db.remove_mute(user, guild_id))
+        expect("get_active_mutes vuoto", db.get_active_mutes(guild_id) == [])
+
+        raid = [3001, 3002, 3003, 3002]
+        ids = db.add_bans_bulk(raid, moderator, guild_id, "raid")
+        expect("add_bans_bulk id distinti", len(ids) == 3 and len(set(ids)) == 3)
+        expect("remove_bans_bulk", sorted(db.remove_bans_bulk([3003, 3001, 4000], guild_id)) == [3001, 3003])
+        muted = db.add_mutes_bulk([3001, 3002], moderator, guild_id, duration=60)
+        expect("add_mutes_bulk", len(muted) == 2)
+        expect("remove_mutes_bulk", db.remove_mutes_bulk([3002], guild_id) == [3002])
+
+        db.add_kick(user, moderator, guild_id, "bye")
+        db.flush_audit_log()
+        log = db.get_mod_log(guild_id, user_id=user)
+        expect("get_mod_log", [entry["action_type"] for entry in log][:3] == ["KICK", "MUTE", "BAN"])
+
+        history = db.get_user_history(user, guild_id)
+        expect("get_user_history", {t: len(rows) for t, rows in history.items()}
+               == {"warns": 0, "bans": 1, "mutes": 1, "kicks": 1})
+        page = db.get_user_history_page(user, guild_id, limit=2)
+        rest = db.get_user_history_page(user, guild_id, limit=2, cursor=page["next_cursor"])
+        expect("get_user_history_page", len(page["items"]) == 2 and page["next_cursor"] is not None
+               and len(rest["items"]) == 1 and rest["next_cursor"] is None
+               and page["items"][0]["type"] == "kick")
+
+        hits = db.search_actions(guild_id, "cap*")
+        expect("search_actions prefisso", sorted(hit["type"] for hit in hits) == ["log", "mute"]
+               and all(hit["user_id"] == user and "**caps**" in hit["snippet"] for hit in hits))
+        expect("search_actions per tipo", {hit["type"] for hit in db.search_actions(guild_id, "raid", types=["ban"])}
+               == {"ban"})
+        expect("search_actions senza risultati", db.search_actions(guild_id, "inesistente") == [])
+        try:
+            db.search_actions(guild_id, "raid", types=["nope"])
+            expect("search_actions tipo non valido", False)
+        except ValueError:
+            pass
+
+        stats = db.get_guild_stats(guild_id)
+        expect("get_guild_stats", stats["totals"].get("KICK") == 1 and stats["totals"].get("MUTE", 0) >= 3
+               and sum(day["counts"].get("KICK", 0) for day in stats["by_day"]) == 1
+               and stats["top_moderators"][0]["moderator_id"] == moderator
+               and stats["top_moderators"][0]["total"] == sum(stats["totals"].values()))
+
+        db.add_ban(5001, moderator, guild_id, "short", duration=1)
+        time.sleep(1.1)
+        expect("cleanup_expired", db.cleanup_expired().get("bans", 0) >= 1)
+    finally:
+        db.remove_expiry_listener(listener)
+    return failures
+
+
+def main(argv: List[str]) -> int:
+    """python -m plugins.utils.storage [percorso.db | postgresql://...] (default: SQLite temporaneo)"""
+    target = argv[0] if argv else None
+    with tempfile.TemporaryDirectory() as tmp:
+        if target and target.startswith(("postgresql://", "postgres://")):
+            from plugins.utils.pg_storage import PostgresModerationStorage
+            db: ModerationStorage = PostgresModerationStorage(target)
+        else:
+            from plugins.utils.mod_database import ModerationDatabase
+            db = ModerationDatabase(target or os.path.join(tmp, "moderation.db"))
+
+        try:
+            failures = check_storage(db)
+        finally:
+            db.close()
+
+    if not failures:
+        print(f"✅ [ModDB] {type(db).__name__}: interfaccia conforme")
+        return 0
+    for name in failures:
+        print(f"❌ [ModDB] {type(db).__name__}: {name}")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
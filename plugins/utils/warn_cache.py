@@ -0,0 +1,83 @@
+"""
+Cache LRU dei conteggi warn per (guild_id, user_id)
+Mantenuta esatta in write-through da ModerationDatabase
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+Key = Tuple[int, int]  # (guild_id, user_id)
+
+
+class WarnCountCache:
+    """
+    Cache LRU limitata dei conteggi warn.
+
+    Non interroga mai il database: il chiamante la popola sui miss e la
+    aggiorna ad ogni add/remove mentre tiene il lock del writer, così i
+    valori restano esatti anche con più thread.
+    """
+
+    # Stima per entry: nodo OrderedDict + tupla chiave + 2 int grandi + int conteggio
+    APPROX_ENTRY_BYTES = 100 + sys.getsizeof((0, 0)) + 2 * sys.getsizeof(2 ** 62) + sys.getsizeof(0)
+
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max(1, max_entries)
+        self._data: "OrderedDict[Key, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, guild_id: int, user_id: int) -> Optional[int]:
+        key = (guild_id, user_id)
+        with self._lock:
+            count = self._data.get(key)
+            if count is None:
+                self._misses += 1
+                return None
+            self._data.move_to_end(key)
+            self._hits += 1
+            return count
+
+    def put(self, guild_id: int, user_id: int, count: int):
+        key = (guild_id, user_id)
+        with self._lock:
+            self._data[key] = count
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def adjust(self, guild_id: int, user_id: int, delta: int):
+        """Write-through: aggiorna il conteggio solo se già in cache"""
+        key = (guild_id, user_id)
+        with self._lock:
+            if key in self._data:
+                self._data[key] = max(0, self._data[key] + delta)
+
+    def invalidate(self, guild_id: Optional[int] = None, user_id: Optional[int] = None):
+        """Rimuove una chiave, tutte le chiavi di una guild, o svuota la cache"""
+        with self._lock:
+            if guild_id is None:
+                self._data.clear()
+            elif user_id is not None:
+                self._data.pop((guild_id, user_id), None)
+            else:
+                for key in [k for k in self._data if k[0] == guild_id]:
+                    del self._data[key]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "approx_bytes": len(self._data) * self.APPROX_ENTRY_BYTES,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,184 @@
+"""
+Coda write-behind per gli insert di audit del database di moderazione
+Raggruppa gli insert in un'unica transazione ogni N ms o M righe
+"""
+
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Set, Tuple
+
+from plugins.utils.db_pool import ConnectionManager
+
+
+class WriteBehindQueue:
+    """
+    Coda in memoria limitata + thread flusher.
+
+    enqueue() non tocca il disco: le righe vengono scritte dal flusher con
+    executemany in una sola transazione, ogni flush_interval_ms oppure appena
+    la coda raggiunge flush_max_rows. Se la coda è piena la riga viene scritta
+    subito dal chiamante (nessuna perdita, nessun blocco). close() svuota la coda.
+
+    Le righe accodate dentro una transazione che poi fallisce vanno scartate con
+    discard() (hook on_rollback del pool): il flusher le filtra dopo aver preso il
+    writer, quindi anche se le ha già estratte dalla coda non finiscono nel database.
+    """
+
+    def __init__(self, pool: ConnectionManager, flush_interval_ms: int = 50,
+                 flush_max_rows: int = 500, max_queue: int = 10000):
+        self.pool = pool
+        self.flush_interval = max(1, flush_interval_ms) / 1000
+        self.flush_max_rows = max(1, flush_max_rows)
+        self.max_queue = max(self.flush_max_rows, max_queue)
+
+        self._queue: Deque[Tuple[int, str, Tuple[Any, ...]]] = deque()
+        self._sequence = 0
+        self._discarded: Set[int] = set()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # Un flush alla volta (thread o close/flush manuale)
+        self._closed = False
+
+        # Metriche
+        self._enqueued = 0
+        self._flushed_rows = 0
+        self._flushes = 0
+        self._overflow_writes = 0
+        self._discarded_rows = 0
+        self._peak_depth = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+        self._errors = 0
+
+        self._thread = threading.Thread(target=self._run, name="mod-db-write-behind", daemon=True)
+        self._thread.start()
+
+    def enqueue(self, conn: sqlite3.Connection, sql: str, params: Tuple[Any, ...]) -> Optional[int]:
+        """
+        Accoda un insert. conn è la connessione writer della transazione corrente:
+        viene usata solo se la coda è piena (scrittura immediata come fallback).
+
+        Returns:
+            Id della riga in coda da passare a discard(), None se scritta subito su conn
+            (in quel caso la annulla già il rollback della transazione)
+        """
+        entry_id = self.try_enqueue(sql, params)
+        if entry_id is None:
+            conn.execute(sql, params)
+        return entry_id
+
+    def try_enqueue(self, sql: str, params: Tuple[Any, ...]) -> Optional[int]:
+        """Come enqueue() ma senza fallback: None se la coda è piena, la riga la scrive il chiamante"""
+        with self._cond:
+            if self._closed or len(self._queue) >= self.max_queue:
+                self._overflow_writes += 1
+                return None
+            self._sequence += 1
+            self._queue.append((self._sequence, sql, params))
+            self._enqueued += 1
+            depth = len(self._queue)
+            if depth > self._peak_depth:
+                self._peak_depth = depth
+            if depth >= self.flush_max_rows:
+                self._cond.notify()
+            return self._sequence
+
+    def discard(self, entry_id: int):
+        """Scarta una riga accodata da una transazione annullata (in coda o già estratta dal flusher)"""
+        with self._cond:
+            self._discarded.add(entry_id)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._queue and not self._closed:
+                    self._cond.wait(self.flush_interval)
+                elif len(self._queue) < self.flush_max_rows and not self._closed:
+                    # Aspetta di riempire il batch, ma non oltre l'intervallo
+                    self._cond.wait(self.flush_interval)
+                if self._closed and not self._queue:
+                    return
+            try:
+                self.flush()
+            except sqlite3.ProgrammingError:
+                return  # Pool chiuso
+            except sqlite3.Error as e:
+                self._errors += 1
+                print(f"❌ [ModDB] Errore flush write-behind: {e}")
+                time.sleep(self.flush_interval)
+
+    def flush(self) -> int:
+        """Scrive subito tutte le righe in coda (un batch per transazione). Ritorna le righe scritte."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._cond:
+                    if not self._queue:
+                        break
+                    count = min(len(self._queue), self.flush_max_rows)
+                    batch = [self._queue.popleft() for _ in range(count)]
+
+                started = time.perf_counter()
+                try:
+                    with self.pool.write() as conn:
+                        # Col writer in mano le transazioni degli altri thread sono chiuse: i rollback sono già noti
+                        batch = self._drop_discarded(batch)
+
+                        # Raggruppa per statement: un executemany per tipo di insert
+                        grouped: Dict[str, list] = {}
+                        for _entry_id, sql, params in batch:
+                            grouped.setdefault(sql, []).append(params)
+                        for sql, rows in grouped.items():
+                            conn.executemany(sql, rows)
+                except BaseException:
+                    # Rimette il batch in testa: verrà ritentato al prossimo flush
+                    with self._cond:
+                        self._queue.extendleft(reversed(batch))
+                    raise
+                elapsed_ms = (time.perf_counter() - started) * 1000
+
+                self._flushes += 1
+                self._flushed_rows += len(batch)
+                self._last_flush_ms = elapsed_ms
+                self._total_flush_ms += elapsed_ms
+                self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+                written += len(batch)
+        return written
+
+    def _drop_discarded(self, batch):
+        with self._cond:
+            if not self._discarded:
+                return batch
+            kept = [entry for entry in batch if entry[0] not in self._discarded]
+            self._discarded.difference_update(entry[0] for entry in batch)
+            self._discarded_rows += len(batch) - len(kept)
+            return kept
+
+    def stats(self) -> Dict[str, Any]:
+        """Metriche: profondità coda e latenza dei flush"""
+        return {
+            "queue_depth": len(self._queue),
+            "peak_queue_depth": self._peak_depth,
+            "max_queue": self.max_queue,
+            "enqueued": self._enqueued,
+            "flushed_rows": self._flushed_rows,
+            "flushes": self._flushes,
+            "overflow_writes": self._overflow_writes,
+            "discarded_rows": self._discarded_rows,
+            "errors": self._errors,
+            "last_flush_ms": round(self._last_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self._flushes, 3) if self._flushes else 0.0,
+            "max_flush_ms": round(self._max_flush_ms, 3),
+        }
+
+    def close(self, timeout: float = 10.0):
+        """Ferma il flusher e scrive tutto ciò che è ancora in coda (durabilità allo shutdown)"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        self.flush()
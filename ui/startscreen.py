@@ -1,7 +1,6 @@
 import customtkinter as ctk
 import threading
 import time
-import psutil
 from datetime import datetime
 import sys
 import queue
@@ -145,8 +144,7 @@ class BotDashboard(ctk.CTk):
         self.main_frame.grid_rowconfigure(2, weight=1) # Log espandibile
         self.setup_main_content()
         
-        # Start Loop
-        self.update_stats()
+        # Start Loop (CPU/RAM arrivano dal sampler del bot tramite la queue)
         self.check_queue()
         self.protocol("WM_DELETE_WINDOW", self.on_close)
         
@@ -340,13 +338,11 @@ class BotDashboard(ctk.CTk):
             else:
                 self.add_plugin_row(name, status)
 
-    def update_stats(self):
-        if self.stop_event.is_set(): return
-        cpu = psutil.cpu_percent()
-        ram = psutil.virtual_memory().percent
+    def update_system_stats(self, sample):
+        if not sample: return
+        cpu, ram = sample["cpu"], sample["ram"]
         self.card_cpu.update_value(f"{cpu}%", cpu/100)
         self.card_ram.update_value(f"{ram}%", ram/100)
-        self.after(1000, self.update_stats)
 
     def check_queue(self):
         try:
@@ -354,6 +350,7 @@ class BotDashboard(ctk.CTk):
                 msg_type, data = self.bot_queue.get_nowait()
                 if msg_type == "log": self.append_log(data)
                 elif msg_type == "stats": self.update_bot_stats(data)
+                elif msg_type == "system": self.update_system_stats(data)
                 elif msg_type == "info": self.update_bot_info(data)
                 elif msg_type == "plugins_status": self.update_plugins_view(data)
                 elif msg_type == "status":
@@ -0,0 +1,401 @@
+"""
+🧩 CLUSTER LAUNCHER
+Esegue il bot su più processi: ogni cluster possiede un intervallo di shard.
+Il launcher comunica con i cluster su un canale IPC locale (TCP, una riga JSON per messaggio)
+per raccogliere statistiche aggregate e coordinare i riavvii (uno alla volta, mai tutti insieme).
+
+Messaggi cluster -> launcher: hello, ready, stats, cluster_stats (richiesta), restart_all
+Messaggi launcher -> cluster: welcome, cluster_stats (risposta), shutdown
+"""
+
+import asyncio
+import json
+import os
+import secrets
+import signal
+import sys
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+import requests
+
+from utils.language_manager import get_text
+
+DISCORD_GATEWAY_BOT = "https://discord.com/api/v10/gateway/bot"
+
+# Variabili d'ambiente passate ai processi figli
+ENV_IPC_HOST = "CLUSTER_IPC_HOST"
+ENV_IPC_PORT = "CLUSTER_IPC_PORT"
+ENV_IPC_SECRET = "CLUSTER_IPC_SECRET"
+
+
+class Colors:
+    RESET = "\033[0m"
+    BOLD = "\033[1m"
+    GREEN = "\033[92m"
+    YELLOW = "\033[93m"
+    CYAN = "\033[96m"
+    RED = "\033[91m"
+
+
+def plan_clusters(shard_count: int, clusters: int) -> List[List[int]]:
+    """Divide gli shard in intervalli contigui, il più possibile uguali (mai cluster vuoti)"""
+    clusters = max(1, min(clusters, shard_count))
+    base, extra = divmod(shard_count, clusters)
+    plan, start = [], 0
+    for index in range(clusters):
+        size = base + (1 if index < extra else 0)
+        plan.append(list(range(start, start + size)))
+        start += size
+    return plan
+
+
+def fetch_recommended_shards(token: str) -> int:
+    """Numero di shard consigliato da Discord"""
+    response = requests.get(DISCORD_GATEWAY_BOT, headers={"Authorization": f"Bot {token}"}, timeout=10)
+    response.raise_for_status()
+    return int(response.json()["shards"])
+
+
+async def _send(writer: asyncio.StreamWriter, message: Dict[str, Any]):
+    writer.write((json.dumps(message) + "\n").encode())
+    await writer.drain()
+
+
+class ClusterProcess:
+    """Stato di un cluster visto dal launcher"""
+
+    def __init__(self, cluster_id: int, shard_ids: List[int]):
+        self.cluster_id = cluster_id
+        self.shard_ids = shard_ids
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.ready = asyncio.Event()
+        self.stats: Dict[str, Any] = {}
+        self.restarts = 0
+        self.expected_exit = False
+
+
+class ClusterLauncher:
+    """
+    Avvia e sorveglia i processi cluster.
+
+    - Gli shard (numero consigliato da Discord o fisso in config) vengono divisi in N cluster
+    - I cluster partono uno alla volta: il successivo solo quando il precedente è ready
+      (gli IDENTIFY non superano il rate limit del gateway)
+    - Un cluster che termina inaspettatamente viene riavviato con backoff
+    - restart_all (da IPC o SIGHUP) riavvia i cluster in sequenza: il bot resta sempre online
+    """
+
+    def __init__(self, config: Dict[str, Any], script_path: str):
+        sharding = config.get("sharding", {})
+        self.token = config.get("token")
+        self.script_path = script_path
+        self.shard_count_setting = str(sharding.get("shard_count", "auto"))
+        self.clusters_setting = int(sharding.get("clusters", 0)) or os.cpu_count() or 1
+        self.host = sharding.get("ipc_host", "127.0.0.1")
+        self.port = int(sharding.get("ipc_port", 8765))
+        self.ready_timeout = float(sharding.get("ready_timeout", 120))
+        self.secret = secrets.token_hex(16)
+
+        self.shard_count = 0
+        self.clusters: Dict[int, ClusterProcess] = {}
+        self._stopping = False
+        self._restart_lock = asyncio.Lock()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: Set[asyncio.Task] = set()
+
+    # ===== AVVIO =====
+
+    async def _resolve_shard_count(self) -> int:
+        if self.shard_count_setting.isdigit() and int(self.shard_count_setting) > 0:
+            return int(self.shard_count_setting)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, fetch_recommended_shards, self.token)
+
+    async def run(self):
+        """Avvia IPC e cluster, poi resta in attesa fino allo shutdown"""
+        self.shard_count = await self._resolve_shard_count()
+        plan = plan_clusters(self.shard_count, self.clusters_setting)
+        self.clusters = {index: ClusterProcess(index, shard_ids) for index, shard_ids in enumerate(plan)}
+
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        print(f"{Colors.CYAN}{Colors.BOLD}🧩 {get_text('cluster.launcher.started', shards=self.shard_count, clusters=len(plan), host=self.host, port=self.port)}{Colors.RESET}")
+
+        self._install_signal_handlers()
+
+        for cluster in self.clusters.values():
+            if self._stopping:
+                break
+            await self._start_cluster(cluster)
+            await self._wait_ready(cluster)
+
+        while not self._stopping:
+            await asyncio.sleep(1)
+
+    async def _start_cluster(self, cluster: ClusterProcess):
+        cluster.ready.clear()
+        cluster.expected_exit = False
+        env = dict(os.environ, **{
+            ENV_IPC_HOST: self.host,
+            ENV_IPC_PORT: str(self.port),
+            ENV_IPC_SECRET: self.secret,
+        })
+        cluster.process = await asyncio.create_subprocess_exec(
+            sys.executable, self.script_path,
+            "--cluster-id", str(cluster.cluster_id),
+            "--shard-ids", ",".join(map(str, cluster.shard_ids)),
+            "--shard-count", str(self.shard_count),
+            env=env,
+        )
+        print(f"🚀 {get_text('cluster.launcher.spawned', id=cluster.cluster_id, first=cluster.shard_ids[0], last=cluster.shard_ids[-1], pid=cluster.process.pid)}")
+        asyncio.create_task(self._watch(cluster, cluster.process))
+
+    async def _wait_ready(self, cluster: ClusterProcess):
+        try:
+            await asyncio.wait_for(cluster.ready.wait(), timeout=self.ready_timeout)
+        except asyncio.TimeoutError:
+            print(f"{Colors.YELLOW}⚠️  {get_text('cluster.launcher.ready_timeout', id=cluster.cluster_id, seconds=int(self.ready_timeout))}{Colors.RESET}")
+
+    async def _watch(self, cluster: ClusterProcess, process: asyncio.subprocess.Process):
+        """Riavvia il cluster se termina da solo (crash), con backoff esponenziale"""
+        code = await process.wait()
+        if self._stopping or cluster.expected_exit or cluster.process is not process:
+            return
+        cluster.restarts += 1
+        delay = min(60, 5 * 2 ** min(cluster.restarts - 1, 4))
+        print(f"{Colors.RED}❌ {get_text('cluster.launcher.crashed', id=cluster.cluster_id, code=code, seconds=delay)}{Colors.RESET}")
+        await asyncio.sleep(delay)
+        # Nel frattempo un riavvio a rotazione può averlo già rimpiazzato
+        if not self._stopping and cluster.process is process:
+            await self._start_cluster(cluster)
+
+    # ===== RIAVVII E SHUTDOWN =====
+
+    async def _stop_cluster(self, cluster: ClusterProcess, timeout: float = 30):
+        """Chiede al cluster di chiudersi in modo pulito, poi termina il processo se non basta"""
+        process = cluster.process
+        if process is None or process.returncode is not None:
+            return
+        cluster.expected_exit = True
+        if cluster.writer is not None:
+            try:
+                await _send(cluster.writer, {"op": "shutdown"})
+            except (ConnectionError, RuntimeError):
+                pass
+        try:
+            await asyncio.wait_for(process.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            process.terminate()
+            await process.wait()
+
+    async def restart_all(self):
+        """Riavvio a rotazione: un cluster alla volta, il successivo quando il precedente è di nuovo ready"""
+        if self._restart_lock.locked():
+            return
+        async with self._restart_lock:
+            print(f"🔄 {get_text('cluster.launcher.rolling_restart', clusters=len(self.clusters))}")
+            for cluster in self.clusters.values():
+                if self._stopping:
+                    return
+                await self._stop_cluster(cluster)
+                await self._start_cluster(cluster)
+                await self._wait_ready(cluster)
+            print(f"✅ {get_text('cluster.launcher.rolling_restart_done')}")
+
+    async def shutdown(self):
+        if self._stopping:
+            return
+        self._stopping = True
+        print(f"⏹️  {get_text('cluster.launcher.stopping')}")
+        await asyncio.gather(*(self._stop_cluster(cluster) for cluster in self.clusters.values()))
+        if self._server is not None:
+            self._server.close()
+        # I processi sono chiusi: le connessioni IPC terminano con EOF
+        if self._connections:
+            await asyncio.wait(self._connections, timeout=5)
+
+    def _install_signal_handlers(self):
+        loop = asyncio.get_running_loop()
+        handlers = {"SIGINT": self.shutdown, "SIGTERM": self.shutdown, "SIGHUP": self.restart_all}
+        for name, handler in handlers.items():
+            sig = getattr(signal, name, None)
+            if sig is None:
+                continue
+            try:
+                loop.add_signal_handler(sig, lambda handler=handler: asyncio.create_task(handler()))
+            except NotImplementedError:  # Windows: solo Ctrl+C tramite KeyboardInterrupt
+                pass
+
+    # ===== IPC =====
+
+    def aggregate_stats(self) -> Dict[str, Any]:
+        """Somma le statistiche dell'ultimo report di ogni cluster"""
+        totals: Dict[str, Any] = {
+            "clusters": len(self.clusters),
+            "clusters_ready": sum(1 for cluster in self.clusters.values() if cluster.ready.is_set()),
+            "shard_count": self.shard_count,
+            "guilds": 0, "users": 0, "commands_executed": 0, "messages_seen": 0, "errors": 0,
+            "latencies": {},
+        }
+        for cluster in self.clusters.values():
+            stats = cluster.stats
+            for key in ("guilds", "users", "commands_executed", "messages_seen", "errors"):
+                totals[key] += int(stats.get(key, 0))
+            totals["latencies"].update(stats.get("latencies", {}))
+        return totals
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        cluster: Optional[ClusterProcess] = None
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            hello = json.loads(await reader.readline() or b"{}")
+            if hello.get("op") != "hello" or not secrets.compare_digest(str(hello.get("secret", "")), self.secret):
+                return
+            cluster = self.clusters.get(int(hello.get("cluster_id", -1)))
+            if cluster is None:
+                return
+            cluster.writer = writer
+            await _send(writer, {"op": "welcome", "shard_count": self.shard_count})
+
+            async for line in reader:
+                message = json.loads(line)
+                op = message.get("op")
+                if op == "ready":
+                    cluster.ready.set()
+                    print(f"{Colors.GREEN}✅ {get_text('cluster.launcher.ready', id=cluster.cluster_id)}{Colors.RESET}")
+                elif op == "stats":
+                    cluster.stats = message.get("data", {})
+                elif op == "cluster_stats":
+                    await _send(writer, {"op": "cluster_stats", "nonce": message.get("nonce"),
+                                         "data": self.aggregate_stats()})
+                elif op == "restart_all":
+                    asyncio.create_task(self.restart_all())
+        except (ConnectionError, json.JSONDecodeError, ValueError):
+            pass
+        finally:
+            if cluster is not None and cluster.writer is writer:
+                cluster.writer = None
+            writer.close()
+            self._connections.discard(task)
+
+
+class ClusterClient:
+    """
+    Lato bot del canale IPC (un'istanza per processo cluster).
+
+    Usage:
+        client = ClusterClient.from_env(cluster_id, stats_provider, on_shutdown)
+        asyncio.create_task(client.run())
+        await client.mark_ready()
+        totals = await client.get_cluster_stats()
+    """
+
+    def __init__(self, cluster_id: int, host: str, port: int, secret: str,
+                 stats_provider: Callable[[], Dict[str, Any]],
+                 on_shutdown: Callable[[], Awaitable[None]],
+                 stats_interval: float = 30):
+        self.cluster_id = cluster_id
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.stats_provider = stats_provider
+        self.on_shutdown = on_shutdown
+        self.stats_interval = stats_interval
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._connected = asyncio.Event()
+        self._ready = False
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._nonce = 0
+
+    @classmethod
+    def from_env(cls, cluster_id: int, stats_provider: Callable[[], Dict[str, Any]],
+                 on_shutdown: Callable[[], Awaitable[None]], stats_interval: float = 30) -> Optional["ClusterClient"]:
+        """Client configurato dal launcher tramite variabili d'ambiente (None se avviato a mano)"""
+        if ENV_IPC_SECRET not in os.environ:
+            return None
+        return cls(cluster_id, os.environ.get(ENV_IPC_HOST, "127.0.0.1"), int(os.environ[ENV_IPC_PORT]),
+                   os.environ[ENV_IPC_SECRET], stats_provider, on_shutdown, stats_interval)
+
+    async def run(self):
+        """Mantiene la connessione col launcher (riconnessione automatica) e invia le statistiche"""
+        while True:
+            try:
+                reader, self._writer = await asyncio.open_connection(self.host, self.port)
+                await _send(self._writer, {"op": "hello", "cluster_id": self.cluster_id, "secret": self.secret})
+                if self._ready:
+                    await _send(self._writer, {"op": "ready"})
+                self._connected.set()
+                sender = asyncio.create_task(self._send_stats_forever())
+                try:
+                    async for line in reader:
+                        await self._dispatch(json.loads(line))
+                finally:
+                    sender.cancel()
+            except (ConnectionError, OSError, json.JSONDecodeError):
+                pass
+            self._connected.clear()
+            self._writer = None
+            await asyncio.sleep(5)
+
+    async def _dispatch(self, message: Dict[str, Any]):
+        op = message.get("op")
+        if op == "shutdown":
+            await self.on_shutdown()
+        elif op == "cluster_stats":
+            future = self._pending.pop(message.get("nonce"), None)
+            if future is not None and not future.done():
+                future.set_result(message.get("data", {}))
+
+    async def _send_stats_forever(self):
+        while True:
+            await self.send({"op": "stats", "data": self.stats_provider()})
+            await asyncio.sleep(self.stats_interval)
+
+    async def send(self, message: Dict[str, Any]) -> bool:
+        if self._writer is None:
+            return False
+        try:
+            await _send(self._writer, message)
+            return True
+        except (ConnectionError, RuntimeError):
+            return False
+
+    async def mark_ready(self):
+        """Segnala al launcher che gli shard di questo cluster sono connessi"""
+        self._ready = True
+        await self.send({"op": "ready"})
+
+    async def get_cluster_stats(self, timeout: float = 5) -> Optional[Dict[str, Any]]:
+        """Statistiche aggregate di tutti i cluster (None se il launcher non risponde)"""
+        self._nonce += 1
+        nonce = self._nonce
+        future = asyncio.get_running_loop().create_future()
+        self._pending[nonce] = future
+        if not await self.send({"op": "cluster_stats", "nonce": nonce}):
+            self._pending.pop(nonce, None)
+            return None
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(nonce, None)
+            return None
+
+    async def request_restart_all(self) -> bool:
+        """Chiede al launcher un riavvio a rotazione di tutti i cluster"""
+        return await self.send({"op": "restart_all"})
+
+
+def parse_cluster_args(argv: List[str]) -> Optional[Dict[str, Any]]:
+    """Argomenti passati dal launcher a bot.py (--cluster-id, --shard-ids, --shard-count)"""
+    if "--cluster-id" not in argv:
+        return None
+
+    def value(flag: str) -> str:
+        return argv[argv.index(flag) + 1]
+
+    return {
+        "cluster_id": int(value("--cluster-id")),
+        "shard_ids": [int(shard) for shard in value("--shard-ids").split(",")],
+        "shard_count": int(value("--shard-count")),
+    }
@@ -0,0 +1,105 @@
+"""
+Profilo intents e cache del bot
+Calcola gli intents minimi (base da config/config.json + quelli dichiarati dai plugin abilitati)
+e le opzioni di cache di discord.py (MemberCacheFlags, chunk_guilds_at_startup, max_messages)
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+import discord
+
+from utils.language_manager import get_text
+
+# Quanto serve al core: lista server, comandi con prefisso in guild e DM
+DEFAULT_INTENTS = ["guilds", "guild_messages", "dm_messages", "message_content"]
+
+# Intents da abilitare anche nel Developer Portal
+PRIVILEGED_INTENTS = {"members", "presences", "message_content"}
+
+DEFAULT_MAX_MESSAGES = 1000
+
+
+def _valid_intent(name: str) -> bool:
+    return name in discord.Intents.VALID_FLAGS
+
+
+def build_intents(names: Iterable[str]) -> discord.Intents:
+    """Intents con solo i flag indicati (i nomi sconosciuti vengono ignorati con un avviso)"""
+    intents = discord.Intents.none()
+    for name in names:
+        if _valid_intent(name):
+            setattr(intents, name, True)
+        else:
+            print(f"⚠️  {get_text('bot.intents.unknown', name=name)}")
+    return intents
+
+
+def build_member_cache_flags(value: Any, intents: discord.Intents) -> discord.MemberCacheFlags:
+    """
+    MemberCacheFlags dalla config: "from_intents", "none", "all" o lista di flag ("voice", "joined").
+    I flag non supportati dagli intents scelti vengono tolti (discord.py altrimenti rifiuta l'avvio).
+    """
+    allowed = discord.MemberCacheFlags.from_intents(intents)
+    if value in (None, "from_intents"):
+        return allowed
+    if value == "none":
+        return discord.MemberCacheFlags.none()
+
+    flags = discord.MemberCacheFlags.all() if value == "all" else discord.MemberCacheFlags.none()
+    if isinstance(value, list):
+        for name in value:
+            if name in discord.MemberCacheFlags.VALID_FLAGS:
+                setattr(flags, name, True)
+            else:
+                print(f"⚠️  {get_text('bot.intents.unknown_cache_flag', name=name)}")
+
+    dropped = [name for name, enabled in flags if enabled and not getattr(allowed, name)]
+    if dropped:
+        print(f"⚠️  {get_text('bot.intents.cache_flags_dropped', flags=', '.join(dropped))}")
+        for name in dropped:
+            setattr(flags, name, False)
+    return flags
+
+
+def resolve_bot_options(config: Dict[str, Any],
+                        plugin_intents: Optional[Dict[str, List[str]]] = None) -> Dict[str, Any]:
+    """
+    Argomenti per commands.Bot (intents, member_cache_flags, chunk_guilds_at_startup, max_messages).
+
+    Args:
+        config: config/config.json; sezioni "intents" e "cache" opzionali
+        plugin_intents: Intents richiesti da ogni plugin abilitato (PluginLoader.collect_required_intents)
+    """
+    intents_config = config.get("intents", {})
+    cache_config = config.get("cache", {})
+
+    # profile "all" = comportamento precedente (Intents.all), utile per diagnosticare un plugin
+    if intents_config.get("profile", "minimal") == "all":
+        intents = discord.Intents.all()
+    else:
+        names: Set[str] = set(intents_config.get("base", DEFAULT_INTENTS))
+        names.update(intents_config.get("extra", []))
+        for required in (plugin_intents or {}).values():
+            names.update(required)
+        intents = build_intents(sorted(names))
+
+    # Il chunking all'avvio richiede l'intent members (e scarica tutti i membri di ogni guild)
+    chunk = bool(cache_config.get("chunk_guilds_at_startup", False)) and intents.members
+
+    max_messages = int(cache_config.get("max_messages", DEFAULT_MAX_MESSAGES))
+
+    return {
+        "intents": intents,
+        "member_cache_flags": build_member_cache_flags(cache_config.get("member_cache_flags"), intents),
+        "chunk_guilds_at_startup": chunk,
+        "max_messages": max_messages if max_messages > 0 else None,  # 0 = nessuna cache messaggi
+    }
+
+
+def describe_intents(intents: discord.Intents) -> Dict[str, List[str]]:
+    """Intents attivi, separando quelli privilegiati (per il log di avvio)"""
+    enabled = [name for name, value in intents if value]
+    return {
+        "enabled": enabled,
+        "privileged": [name for name in enabled if name in PRIVILEGED_INTENTS],
+    }
@@ -0,0 +1,210 @@
+"""
+⏱️ COMMAND LATENCY
+Istogrammi di latenza a memoria fissa (bucket logaritmici stile HDR) per comando e per plugin.
+
+Ogni istogramma copre 1µs - 1h con errore relativo massimo 1/2^SUB_BUCKET_BITS (~3%):
+la memoria non cresce col numero di esecuzioni, a differenza della vecchia lista di tempi.
+"""
+
+import math
+import time
+from array import array
+from typing import Any, Dict, Iterable, Optional
+
+# 2^SUB_BUCKET_BITS sotto-bucket lineari per ogni potenza di 2
+SUB_BUCKET_BITS = 5
+# Valore massimo registrabile (i valori oltre finiscono nell'ultimo bucket, max resta esatto)
+MAX_TRACKABLE_US = 3600 * 1_000_000
+
+PERCENTILES = (50, 95, 99)
+
+# Chiave extras dell'interaction con l'istante di inizio
+_INTERACTION_START = "latency_start"
+
+
+class LatencyHistogram:
+    """
+    Istogramma log-lineare di durate in microsecondi.
+
+    I valori sotto 2^bits hanno un bucket ciascuno; oltre, ogni potenza di 2 è divisa
+    in 2^bits bucket uguali. Il numero di bucket è fisso, _index(max_value) + 1 (886 con i default).
+    """
+
+    __slots__ = ("bits", "sub_buckets", "max_value", "counts", "count", "total", "min", "max")
+
+    def __init__(self, bits: int = SUB_BUCKET_BITS, max_value: int = MAX_TRACKABLE_US):
+        self.bits = bits
+        self.sub_buckets = 1 << bits
+        self.max_value = max_value
+        self.counts = array("Q", bytes(8 * (self._index(max_value) + 1)))
+        self.count = 0
+        self.total = 0
+        self.min = 0
+        self.max = 0
+
+    def _index(self, value: int) -> int:
+        if value < self.sub_buckets:
+            return value
+        shift = value.bit_length() - 1 - self.bits
+        return (shift + 1) * self.sub_buckets + (value >> shift) - self.sub_buckets
+
+    def _bucket_midpoint(self, index: int) -> int:
+        if index < self.sub_buckets:
+            return index
+        shift = index // self.sub_buckets - 1
+        mantissa = index % self.sub_buckets + self.sub_buckets
+        return (mantissa << shift) + ((1 << shift) >> 1)
+
+    def record(self, value_us: int):
+        value_us = max(0, int(value_us))
+        self.counts[self._index(min(value_us, self.max_value))] += 1
+        if self.count == 0 or value_us < self.min:
+            self.min = value_us
+        if value_us > self.max:
+            self.max = value_us
+        self.count += 1
+        self.total += value_us
+
+    def merge(self, other: "LatencyHistogram"):
+        """Somma un altro istogramma con la stessa configurazione"""
+        if other.count == 0:
+            return
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.min = other.min if self.count == 0 else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, percent: float) -> int:
+        """Valore (µs) sotto cui cade percent% delle misure"""
+        if self.count == 0:
+            return 0
+        rank = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(max(self._bucket_midpoint(index), self.min), self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        """count, mean, min, max e percentili in millisecondi"""
+        result = {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count / 1000, 3) if self.count else 0.0,
+            "min_ms": round(self.min / 1000, 3),
+            "max_ms": round(self.max / 1000, 3),
+        }
+        for percent in PERCENTILES:
+            result[f"p{percent}_ms"] = round(self.percentile(percent) / 1000, 3)
+        return result
+
+    def reset(self):
+        self.counts = array("Q", bytes(8 * len(self.counts)))
+        self.count = self.total = self.min = self.max = 0
+
+
+class CommandLatencyTracker:
+    """
+    Latenze dei comandi text e slash, un istogramma per comando.
+
+    I comandi slash (e gli hybrid invocati come slash) usano la chiave "/nome",
+    quelli text il qualified_name. Il plugin è ricavato dal modulo del comando
+    (plugins.<nome>...), tutto il resto conta come "core".
+
+    Usage:
+        tracker = CommandLatencyTracker()
+        bot.before_invoke(...) -> tracker.start(ctx)
+        bot.after_invoke(...)  -> tracker.stop(ctx)
+        tracker.command_stats("ban")
+        tracker.plugin_stats("moderation")
+    """
+
+    def __init__(self, plugins_package: str = "plugins"):
+        self.plugins_package = plugins_package
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.plugins: Dict[str, str] = {}
+        self.failures: Dict[str, int] = {}
+
+    def _plugin_of(self, command) -> str:
+        module = getattr(command, "module", None) or ""
+        parts = module.split(".")
+        if len(parts) > 1 and parts[0] == self.plugins_package:
+            return parts[1]
+        return "core"
+
+    def record(self, key: str, plugin: str, elapsed: float, failed: bool = False):
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram()
+            self.plugins[key] = plugin
+        histogram.record(elapsed * 1_000_000)
+        if failed:
+            self.failures[key] = self.failures.get(key, 0) + 1
+
+    # ===== HOOK COMANDI TEXT (before_invoke / after_invoke) =====
+
+    def start(self, ctx):
+        ctx.latency_start = time.perf_counter()
+
+    def stop(self, ctx):
+        start = getattr(ctx, "latency_start", None)
+        # Hybrid invocato come slash: lo misura già l'hook delle interaction
+        if start is None or ctx.interaction is not None or ctx.command is None:
+            return
+        self.record(ctx.command.qualified_name, self._plugin_of(ctx.command),
+                    time.perf_counter() - start, failed=ctx.command_failed)
+
+    # ===== HOOK APP COMMAND (tree.interaction_check / completion / error) =====
+
+    def start_interaction(self, interaction):
+        interaction.extras[_INTERACTION_START] = time.perf_counter()
+
+    def stop_interaction(self, interaction, command=None, failed: bool = False):
+        start = interaction.extras.pop(_INTERACTION_START, None)
+        command = command or interaction.command
+        if start is None or command is None:
+            return
+        self.record(f"/{command.qualified_name}", self._plugin_of(command),
+                    time.perf_counter() - start, failed=failed)
+
+    # ===== QUERY =====
+
+    def command_stats(self, key: str) -> Optional[Dict[str, Any]]:
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            return None
+        return {"plugin": self.plugins[key], "failures": self.failures.get(key, 0), **histogram.summary()}
+
+    def _merged(self, keys: Iterable[str]) -> LatencyHistogram:
+        merged = LatencyHistogram()
+        for key in keys:
+            merged.merge(self.histograms[key])
+        return merged
+
+    def plugin_stats(self, plugin: str) -> Optional[Dict[str, Any]]:
+        keys = [key for key, owner in self.plugins.items() if owner == plugin]
+        if not keys:
+            return None
+        return {
+            "commands": len(keys),
+            "failures": sum(self.failures.get(key, 0) for key in keys),
+            **self._merged(keys).summary(),
+        }
+
+    def overall_stats(self) -> Dict[str, Any]:
+        return self._merged(list(self.histograms)).summary()
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Statistiche di tutti i comandi e di tutti i plugin"""
+        return {
+            "commands": {key: self.command_stats(key) for key in sorted(self.histograms)},
+            "plugins": {plugin: self.plugin_stats(plugin) for plugin in sorted(set(self.plugins.values()))},
+        }
+
+    def reset(self):
+        self.histograms.clear()
+        self.plugins.clear()
+        self.failures.clear()
@@ -5,6 +5,7 @@ import os
 import importlib
 import sys
 from pathlib import Path
+from typing import Dict, List, Optional
 
 
 from utils.config_validator import ConfigValidator
@@ -14,7 +15,8 @@ from utils.language_manager import get_text
 class PluginLoader:
     """Gestisce il caricamento dinamico dei plugin con auto-discovery"""
     
-    def __init__(self, bot: commands.Bot):
+    def __init__(self, bot: Optional[commands.Bot] = None):
+        # bot può essere assegnato dopo: gli intents vanno calcolati prima di creare il Bot
         self.bot = bot
         self.plugins_dir = "plugins"
         self.config_path = os.path.join("config", "plugins.json")
@@ -93,6 +95,35 @@ class PluginLoader:
         
         return updated
     
+    def _cog_class_name(self, plugin_name: str) -> str:
+        """Naming convention: plugin_name -> PluginNameCog"""
+        return ''.join(word.capitalize() for word in plugin_name.split('_')) + 'Cog'
+    
+    def collect_required_intents(self) -> Dict[str, List[str]]:
+        """
+        Intents dichiarati dai plugin abilitati (REQUIRED_INTENTS a livello di modulo o di Cog).
+        Va chiamato prima di creare il Bot: gli intents non si possono cambiare dopo la connessione.
+        I plugin che non si importano vengono saltati qui e segnalati da load_plugins.
+        """
+        self.load_plugins_config()
+        required = {}
+        
+        for plugin_name in self.discover_plugins():
+            # I plugin nuovi verranno aggiunti abilitati da update_plugins_config
+            if not self.plugins_config.get(plugin_name, True):
+                continue
+            try:
+                module = importlib.import_module(f'{self.plugins_dir}.{plugin_name}')
+            except Exception:
+                continue
+            
+            cog_class = getattr(module, self._cog_class_name(plugin_name), None)
+            intents = getattr(module, "REQUIRED_INTENTS", None) or getattr(cog_class, "REQUIRED_INTENTS", None)
+            if intents:
+                required[plugin_name] = list(intents)
+        
+        return required
+    
     async def load_plugins(self):
         """
         Carica tutti i plugin abilitati
@@ -140,7 +171,7 @@ class PluginLoader:
                     module = importlib.import_module(f'{self.plugins_dir}.{plugin_name}')
                     
                     # Cerca la classe Cog (naming convention: PluginNameCog)
-                    class_name = ''.join(word.capitalize() for word in plugin_name.split('_')) + 'Cog'
+                    class_name = self._cog_class_name(plugin_name)
                     
                     if hasattr(module, class_name):
                         cog_class = getattr(module, class_name)
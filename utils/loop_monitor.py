@@ -0,0 +1,253 @@
+"""
+🩺 LOOP MONITOR
+Salute dell'event loop: misura continua del lag di scheduling e rilevamento dei blocchi.
+
+Un task sul loop batte un heartbeat ogni interval; un thread watchdog controlla che il battito
+arrivi. Se il loop resta fermo oltre la soglia, il watchdog cattura lo stack del thread del loop
+mentre è ancora bloccato: coroutine responsabile, frame e plugin/cog a cui appartengono
+finiscono in un ring buffer consultabile (comando owner "loophealth").
+
+Con asyncio_debug attivo si abilita anche il debug di asyncio (loop.slow_callback_duration)
+e i suoi avvisi "Executing ... took" vengono salvati nello stesso buffer.
+"""
+
+import asyncio
+import inspect
+import logging
+import re
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from discord.ext import commands
+
+from utils.language_manager import get_text
+
+# Frame di stack salvati per ogni blocco (i più interni)
+STACK_LIMIT = 20
+
+# Coroutine e posizione negli avvisi "Executing <Task ...> took" del debug di asyncio
+_ASYNCIO_CORO = re.compile(r"coro=<([\w.<>]+)\(")
+_ASYNCIO_LOCATION = re.compile(r"running at (.+?):\d+>")
+
+
+class _AsyncioSlowCallbackHandler(logging.Handler):
+    """Inoltra al monitor gli avvisi di callback lente del debug di asyncio"""
+
+    def __init__(self, monitor: "LoopMonitor"):
+        super().__init__(logging.WARNING)
+        self.monitor = monitor
+
+    def emit(self, record: logging.LogRecord):
+        if isinstance(record.msg, str) and record.msg.startswith("Executing"):
+            self.monitor._record_asyncio_warning(record)
+
+
+class LoopMonitor:
+    """
+    Lag del loop e blocchi con attribuzione a coroutine/plugin.
+
+    Usage:
+        monitor = LoopMonitor.from_config(config)
+        monitor.start()                 # dentro il loop (start_background_tasks)
+        monitor.last, monitor.max       # lag in secondi
+        monitor.stalls(limit=10)        # ultimi blocchi, dal più recente
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.25, history: int = 50,
+                 asyncio_debug: bool = False, plugins_package: str = "plugins"):
+        """
+        Args:
+            interval: Periodo dell'heartbeat (secondi)
+            threshold: Blocco minimo da registrare (secondi)
+            history: Blocchi conservati nel ring buffer
+            asyncio_debug: Attiva anche loop.set_debug con slow_callback_duration = threshold
+            plugins_package: Package dei plugin, per attribuire i frame (plugins.<nome>)
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.asyncio_debug = asyncio_debug
+        self.plugins_package = plugins_package
+        self.last = 0.0
+        self.max = 0.0
+        self.stall_count = 0
+        self._stalls: deque = deque(maxlen=max(1, history))
+        self._lock = threading.Lock()
+        self._open_stall: Optional[Dict[str, Any]] = None
+        self._last_beat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+        self._log_handler: Optional[_AsyncioSlowCallbackHandler] = None
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["LoopMonitor"]:
+        """Monitor dalla sezione "loop_monitor" di config.json (None se disabilitato)"""
+        monitor = config.get("loop_monitor", {})
+        if not monitor.get("enabled", True):
+            return None
+        return cls(
+            interval=int(monitor.get("interval_ms", 100)) / 1000,
+            threshold=int(monitor.get("slow_threshold_ms", 250)) / 1000,
+            history=int(monitor.get("history", 50)),
+            asyncio_debug=bool(monitor.get("asyncio_debug", False)),
+        )
+
+    # ===== CICLO DI VITA =====
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Avvia heartbeat e watchdog (va chiamato dal thread dell'event loop)"""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._task = self._loop.create_task(self._heartbeat())
+
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+        if self.asyncio_debug:
+            self._loop.set_debug(True)
+            self._loop.slow_callback_duration = self.threshold
+            self._log_handler = _AsyncioSlowCallbackHandler(self)
+            logging.getLogger("asyncio").addHandler(self._log_handler)
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(1.0)
+            self._watchdog = None
+        if self._log_handler is not None:
+            logging.getLogger("asyncio").removeHandler(self._log_handler)
+            self._log_handler = None
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.set_debug(False)
+
+    # ===== LAG (sul loop) =====
+
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, loop.time() - expected)
+            self.max = max(self.max, self.last)
+            now = time.monotonic()
+            with self._lock:
+                stall, self._open_stall = self._open_stall, None
+                self._last_beat = now
+            if stall is not None:
+                stall["duration_ms"] = round(self.last * 1000, 1)
+                stall["ongoing"] = False
+                print(f"🐢 {get_text('bot.loop_monitor.stall', duration=stall['duration_ms'], coroutine=stall['coroutine'] or '?', plugin=stall['plugin'] or 'core')}")
+
+    def take_max(self) -> float:
+        """Lag massimo dall'ultima lettura (poi azzerato), come LoopLagProbe"""
+        value, self.max = self.max, self.last
+        return value
+
+    # ===== WATCHDOG (thread dedicato) =====
+
+    def _watch(self):
+        limit = self.interval + self.threshold
+        while not self._stop.wait(min(self.interval, self.threshold) / 2):
+            with self._lock:
+                if self._open_stall is not None or time.monotonic() - self._last_beat < limit:
+                    continue
+                blocked_for = time.monotonic() - self._last_beat - self.interval
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stall = self._describe(frame, blocked_for)
+            del frame
+            with self._lock:
+                # Il loop potrebbe essere ripartito mentre leggevamo lo stack
+                if time.monotonic() - self._last_beat < limit:
+                    continue
+                self._open_stall = stall
+            self._stalls.append(stall)
+            self.stall_count += 1
+
+    def _describe(self, frame, blocked_for: float) -> Dict[str, Any]:
+        """Coroutine, plugin e cog del frame bloccato (dal più interno verso l'esterno)"""
+        coroutine = plugin = cog = None
+        current = frame
+        while current is not None:
+            code = current.f_code
+            module = current.f_globals.get("__name__", "")
+            if coroutine is None and code.co_flags & inspect.CO_COROUTINE:
+                coroutine = f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+            parts = module.split(".")
+            if plugin is None and len(parts) > 1 and parts[0] == self.plugins_package and parts[1] != "utils":
+                plugin = parts[1]
+            if cog is None:
+                owner = current.f_locals.get("self") if code.co_argcount else None
+                if isinstance(owner, commands.Cog):
+                    cog = owner.qualified_name
+            current = current.f_back
+
+        return {
+            "timestamp": time.time(),
+            "source": "watchdog",
+            "duration_ms": round(blocked_for * 1000, 1),
+            "ongoing": True,
+            "coroutine": coroutine,
+            "plugin": plugin,
+            "cog": cog,
+            "stack": traceback.format_list(traceback.extract_stack(frame)[-STACK_LIMIT:]),
+        }
+
+    def _record_asyncio_warning(self, record: logging.LogRecord):
+        # "Executing <Task ... coro=<Cog.handler() running at /path/plugins/x.py:42>> took 0.300 seconds"
+        message = record.getMessage()
+        duration = record.args[1] if isinstance(record.args, tuple) and len(record.args) > 1 else 0.0
+        coroutine = _ASYNCIO_CORO.search(message)
+        location = _ASYNCIO_LOCATION.search(message)
+        plugin = None
+        if location:
+            parts = location.group(1).replace("\\", "/").split("/")
+            if self.plugins_package in parts[:-1]:
+                index = len(parts) - 1 - parts[::-1].index(self.plugins_package)
+                name = parts[index + 1].rsplit(".py", 1)[0] if index + 1 < len(parts) else None
+                plugin = name if name != "utils" else None
+        self._stalls.append({
+            "timestamp": record.created,
+            "source": "asyncio",
+            "duration_ms": round(float(duration) * 1000, 1),
+            "ongoing": False,
+            "coroutine": coroutine.group(1) if coroutine else None,
+            "plugin": plugin,
+            "cog": None,
+            "stack": [message],
+        })
+        self.stall_count += 1
+
+    # ===== QUERY =====
+
+    def stalls(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Blocchi registrati, dal più recente"""
+        items = list(self._stalls)[::-1]
+        return items[:limit] if limit else items
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "lag_ms": round(self.last * 1000, 2),
+            "max_lag_ms": round(self.max * 1000, 2),
+            "stalls": self.stall_count,
+            "threshold_ms": round(self.threshold * 1000),
+            "asyncio_debug": self.asyncio_debug,
+        }
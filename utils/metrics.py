@@ -0,0 +1,277 @@
+"""
+📡 METRICS EXPORTER
+Endpoint HTTP opzionale in formato Prometheus/OpenMetrics (text 0.0.4), servito da aiohttp
+sullo stesso event loop del bot. Esporta contatori del bot, latenze dei comandi, lag del loop,
+latenza del gateway, stato dei plugin, risorse del processo e tempi del database.
+
+Config (config/config.json):
+    "metrics": {"enabled": false, "host": "127.0.0.1", "port": "9108", "path": "/metrics"}
+In modalità cluster ogni processo usa port + cluster_id.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from aiohttp import web
+
+from utils.language_manager import get_text
+
+PREFIX = "discord_bot"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Stati possibili in PluginLoader.plugin_status (esportati tutti, 1 = stato corrente)
+PLUGIN_STATES = ("active", "disabled", "error")
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class MetricsWriter:
+    """Accumula righe in formato testo Prometheus, un'intestazione HELP/TYPE per famiglia"""
+
+    def __init__(self):
+        self.lines: List[str] = []
+        self._families = set()
+
+    def family(self, name: str, kind: str, help_text: str):
+        if name in self._families:
+            return
+        self._families.add(name)
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+
+    def sample(self, name: str, value: float, labels: Optional[Dict[str, Any]] = None):
+        if labels:
+            rendered = ",".join(f'{key}="{_escape(label)}"' for key, label in labels.items())
+            self.lines.append(f"{name}{{{rendered}}} {_format_value(value)}")
+        else:
+            self.lines.append(f"{name} {_format_value(value)}")
+
+    def metric(self, name: str, kind: str, help_text: str, value: float,
+               labels: Optional[Dict[str, Any]] = None):
+        self.family(name, kind, help_text)
+        self.sample(name, value, labels)
+
+    def histogram(self, name: str, help_text: str, bounds: Iterable[float], buckets: List[int],
+                  total: float, count: int, labels: Optional[Dict[str, Any]] = None):
+        """buckets non cumulativi (l'ultimo è +Inf), come li producono i contatori del pool DB"""
+        self.family(name, "histogram", help_text)
+        labels = labels or {}
+        cumulative = 0
+        for bound, bucket in zip(list(bounds) + [float("inf")], buckets):
+            cumulative += bucket
+            self.sample(f"{name}_bucket", cumulative, {**labels, "le": _format_value(float(bound))})
+        self.sample(f"{name}_sum", total, labels)
+        self.sample(f"{name}_count", count, labels)
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+class LoopLagProbe:
+    """Misura il ritardo di scheduling del loop: quanto in ritardo si sveglia uno sleep(interval)"""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.last = 0.0
+        self.max = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, loop.time() - expected)
+            self.max = max(self.max, self.last)
+
+    def take_max(self) -> float:
+        """Lag massimo dall'ultima lettura (poi azzerato)"""
+        value, self.max = self.max, self.last
+        return value
+
+
+def _db_timings() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Tempi del pool SQLite, se il modulo del database è stato caricato da un plugin"""
+    try:
+        from plugins.utils import db_pool
+    except ImportError:
+        return {}
+    return db_pool.timing_stats()
+
+
+class MetricsExporter:
+    """
+    Server aiohttp che rende le metriche di un DiscordBot ad ogni scrape.
+
+    Usage:
+        exporter = MetricsExporter.from_config(discord_bot)
+        if exporter:
+            await exporter.start()
+        ...
+        await exporter.stop()
+    """
+
+    def __init__(self, discord_bot, host: str = "127.0.0.1", port: int = 9108,
+                 path: str = "/metrics", lag_probe: Optional[LoopLagProbe] = None):
+        self.discord_bot = discord_bot
+        self.host = host
+        self.port = port
+        self.path = path
+        # Probe propria solo se il bot non ha già un monitor del loop (che avvia da sé)
+        self._owns_probe = lag_probe is None
+        self.lag_probe = lag_probe or LoopLagProbe()
+        self._runner: Optional[web.AppRunner] = None
+
+    @classmethod
+    def from_config(cls, discord_bot) -> Optional["MetricsExporter"]:
+        """Exporter dalla sezione "metrics" della config (None se disabilitato)"""
+        metrics = discord_bot.config.get("metrics", {})
+        if not metrics.get("enabled", False):
+            return None
+        port = int(metrics.get("port", 9108))
+        # In modalità cluster ogni processo ascolta su port + cluster_id
+        if discord_bot.cluster_info is not None:
+            port += discord_bot.cluster_info["cluster_id"]
+        return cls(
+            discord_bot,
+            host=metrics.get("host", "127.0.0.1"),
+            port=port,
+            path=metrics.get("path", "/metrics"),
+            lag_probe=discord_bot.loop_monitor,
+        )
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get(self.path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        if self._owns_probe:
+            self.lag_probe.start()
+        print(f"📡 {get_text('bot.metrics.started', host=self.host, port=self.port, path=self.path)}")
+
+    async def stop(self):
+        if self._owns_probe:
+            self.lag_probe.stop()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    # ===== RACCOLTA =====
+
+    def render(self) -> str:
+        writer = MetricsWriter()
+        self._collect_bot(writer)
+        self._collect_commands(writer)
+        self._collect_plugins(writer)
+        self._collect_process(writer)
+        self._collect_database(writer)
+        return writer.render()
+
+    def _collect_bot(self, writer: MetricsWriter):
+        discord_bot = self.discord_bot
+        bot = discord_bot.bot
+        for key, value in discord_bot.stats.items():
+            if key == "start_time":
+                writer.metric(f"{PREFIX}_start_time_seconds", "gauge",
+                              "Avvio del bot (unix time)", value.timestamp())
+                writer.metric(f"{PREFIX}_uptime_seconds", "gauge",
+                              "Secondi dall'avvio", time.time() - value.timestamp())
+            elif isinstance(value, (int, float)):
+                writer.metric(f"{PREFIX}_{key}_total", "counter", f"Contatore {key} di DiscordBot.stats", value)
+
+        population = discord_bot.population
+        writer.metric(f"{PREFIX}_guilds", "gauge", "Server in cui si trova il bot", population.guild_count)
+        writer.metric(f"{PREFIX}_members", "gauge", "Membri totali (somma per server)", population.member_count)
+        writer.metric(f"{PREFIX}_users", "gauge", "Utenti unici (o membri totali se la cache è incompleta)",
+                      population.user_count)
+
+        writer.family(f"{PREFIX}_gateway_latency_seconds", "gauge", "Latenza heartbeat del gateway per shard")
+        latencies: List[Tuple[Optional[int], float]] = getattr(bot, "latencies", None) or [(None, bot.latency)]
+        for shard_id, latency in latencies:
+            if latency == latency and latency != float("inf"):  # nan/inf prima della connessione
+                writer.sample(f"{PREFIX}_gateway_latency_seconds", latency,
+                              {"shard": shard_id if shard_id is not None else 0})
+
+        writer.metric(f"{PREFIX}_event_loop_lag_seconds", "gauge",
+                      "Ritardo di scheduling del loop all'ultima misura", self.lag_probe.last)
+        writer.metric(f"{PREFIX}_event_loop_lag_max_seconds", "gauge",
+                      "Ritardo massimo del loop dall'ultimo scrape", self.lag_probe.take_max())
+        if hasattr(self.lag_probe, "stall_count"):
+            writer.metric(f"{PREFIX}_event_loop_stalls_total", "counter",
+                          "Blocchi del loop oltre la soglia del monitor", self.lag_probe.stall_count)
+
+    def _collect_commands(self, writer: MetricsWriter):
+        tracker = self.discord_bot.command_latency
+        name = f"{PREFIX}_command_latency_seconds"
+        writer.family(name, "summary", "Latenza dei comandi (istogramma HDR, quantili stimati)")
+        for command in sorted(tracker.histograms):
+            histogram = tracker.histograms[command]
+            labels = {"command": command, "plugin": tracker.plugins[command]}
+            for quantile in (0.5, 0.95, 0.99):
+                writer.sample(name, histogram.percentile(quantile * 100) / 1_000_000,
+                              {**labels, "quantile": quantile})
+            writer.sample(f"{name}_sum", histogram.total / 1_000_000, labels)
+            writer.sample(f"{name}_count", histogram.count, labels)
+
+        writer.family(f"{PREFIX}_command_failures_total", "counter", "Esecuzioni fallite per comando")
+        for command, failures in sorted(tracker.failures.items()):
+            writer.sample(f"{PREFIX}_command_failures_total", failures,
+                          {"command": command, "plugin": tracker.plugins[command]})
+
+    def _collect_plugins(self, writer: MetricsWriter):
+        name = f"{PREFIX}_plugin_status"
+        writer.family(name, "gauge", "Stato di caricamento dei plugin (1 = stato corrente)")
+        for plugin, status in sorted(self.discord_bot.loader.plugin_status.items()):
+            for state in PLUGIN_STATES:
+                writer.sample(name, 1 if status == state else 0, {"plugin": plugin, "status": state})
+
+    def _collect_process(self, writer: MetricsWriter):
+        sample = self.discord_bot.system_metrics.snapshot()
+        if not sample:
+            return
+        writer.metric("process_resident_memory_bytes", "gauge", "Memoria residente del processo", sample["rss"])
+        writer.metric("process_open_fds", "gauge", "File descriptor aperti", sample["fds"])
+        writer.metric(f"{PREFIX}_process_threads", "gauge", "Thread del processo", sample["threads"])
+        writer.metric(f"{PREFIX}_process_cpu_percent", "gauge", "CPU usata dal processo", sample["cpu_process"])
+        writer.metric(f"{PREFIX}_system_cpu_percent", "gauge", "CPU di sistema", sample["cpu"])
+        writer.metric(f"{PREFIX}_system_memory_percent", "gauge", "RAM di sistema usata", sample["ram"])
+
+    def _collect_database(self, writer: MetricsWriter):
+        timings = _db_timings()
+        if not timings:
+            return
+        from plugins.utils.db_pool import TIMING_BUCKETS
+        # Una famiglia alla volta: il formato richiede che i campioni di una metrica siano contigui
+        families = (
+            ("wait", f"{PREFIX}_db_wait_seconds", "Attesa per ottenere una connessione SQLite"),
+            ("held", f"{PREFIX}_db_transaction_seconds", "Durata d'uso della connessione SQLite"),
+        )
+        for field, name, help_text in families:
+            for db_path, modes in sorted(timings.items()):
+                for mode, data in sorted(modes.items()):
+                    writer.histogram(name, help_text, TIMING_BUCKETS, data[f"{field}_buckets"],
+                                     data[f"{field}_sum"], data["count"], {"db": db_path, "mode": mode})
@@ -0,0 +1,230 @@
+"""
+👥 POPULATION TRACKER
+Conteggi di server, membri e utenti unici mantenuti in modo incrementale dagli eventi
+(on_member_join/remove, on_guild_join/remove): le statistiche rispondono in O(1)
+invece di scorrere tutta la cache dei membri con len(set(bot.get_all_members())).
+
+Utenti unici:
+- "exact": contatore per utente (in quanti server lo vediamo), memoria O(utenti)
+- "hll":   HyperLogLog, memoria fissa (2^precision byte), errore ~1.04/sqrt(2^precision);
+           non supporta le rimozioni, quindi conta gli utenti visti dall'ultima ricostruzione
+"""
+
+import asyncio
+import math
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional
+
+# Membri processati prima di cedere il controllo all'event loop durante una ricostruzione
+REBUILD_BATCH = 5000
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(value: int) -> int:
+    """splitmix64: gli id Discord sono snowflake crescenti, serve un hash ben distribuito"""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+class HyperLogLog:
+    """HyperLogLog con stima mantenuta in modo incrementale (count() è O(1))"""
+
+    def __init__(self, precision: int = 14):
+        if not 4 <= precision <= 18:
+            raise ValueError(f"precision deve essere tra 4 e 18, non {precision}")
+        self.precision = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+        self._alpha = 0.7213 / (1 + 1.079 / self.m)
+        # Somma di 2^-registro e registri a zero, aggiornati a ogni modifica
+        self._inverse_sum = float(self.m)
+        self._zeros = self.m
+
+    def add(self, item: int):
+        hashed = _mix64(item)
+        index = hashed >> (64 - self.precision)
+        remaining = (hashed << self.precision) & _MASK64
+        rank = 64 - self.precision + 1 if remaining == 0 else (64 - remaining.bit_length()) + 1
+        current = self.registers[index]
+        if rank > current:
+            if current == 0:
+                self._zeros -= 1
+            self._inverse_sum += 2.0 ** -rank - 2.0 ** -current
+            self.registers[index] = rank
+
+    def count(self) -> int:
+        estimate = self._alpha * self.m * self.m / self._inverse_sum
+        if estimate <= 2.5 * self.m and self._zeros:
+            # Linear counting per cardinalità piccole
+            estimate = self.m * math.log(self.m / self._zeros)
+        return int(round(estimate))
+
+    def clear(self):
+        self.registers = bytearray(self.m)
+        self._inverse_sum = float(self.m)
+        self._zeros = self.m
+
+
+class PopulationTracker:
+    """
+    Server, membri e utenti unici del bot, aggiornati dagli eventi.
+
+    Il totale membri usa guild.member_count (disponibile anche senza intent members).
+    Gli utenti unici richiedono la lista membri in cache: finché anche un solo server
+    non è completo (guild.chunked) user_count ripiega sul totale membri.
+
+    Usage:
+        tracker = PopulationTracker(mode="exact")
+        await tracker.rebuild(bot.guilds)      # on_ready, a blocchi senza bloccare il loop
+        tracker.member_join(member)            # on_member_join
+        tracker.snapshot()                     # O(1)
+    """
+
+    def __init__(self, mode: str = "exact", hll_precision: int = 14):
+        if mode not in ("exact", "hll"):
+            raise ValueError(f"Modalità non valida: {mode} (exact, hll)")
+        self.mode = mode
+        self._member_counts: Dict[int, int] = {}
+        self._total_members = 0
+        self._user_refs: Counter = Counter()
+        self._hll: Optional[HyperLogLog] = HyperLogLog(hll_precision) if mode == "hll" else None
+        self._unchunked: set = set()
+        # Durante rebuild(): server non ancora letti (i loro eventi sono già nella lista membri)
+        self._pending: Optional[set] = None
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "PopulationTracker":
+        """Opzioni dalla sezione "population" di config.json"""
+        population = config.get("population", {})
+        return cls(
+            mode=population.get("mode", "exact"),
+            hll_precision=int(population.get("hll_precision", 14)),
+        )
+
+    # ===== CONTEGGI (O(1)) =====
+
+    @property
+    def guild_count(self) -> int:
+        return len(self._member_counts)
+
+    @property
+    def member_count(self) -> int:
+        """Somma dei membri di tutti i server (lo stesso utente conta una volta per server)"""
+        return self._total_members
+
+    @property
+    def unique_users_reliable(self) -> bool:
+        """True se tutti i server hanno la lista membri completa in cache"""
+        return self._pending is None and not self._unchunked and bool(self._member_counts)
+
+    @property
+    def unique_users(self) -> int:
+        if self._hll is not None:
+            return self._hll.count()
+        return len(self._user_refs)
+
+    @property
+    def user_count(self) -> int:
+        """Utenti unici se affidabili, altrimenti il totale membri"""
+        return self.unique_users if self.unique_users_reliable else self._total_members
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "guilds": self.guild_count,
+            "members": self._total_members,
+            "unique_users": self.unique_users,
+            "unique_users_reliable": self.unique_users_reliable,
+            "users": self.user_count,
+            "mode": self.mode,
+        }
+
+    # ===== EVENTI =====
+
+    def _set_guild_count(self, guild_id: int, count: int):
+        self._total_members += count - self._member_counts.get(guild_id, 0)
+        self._member_counts[guild_id] = count
+
+    def _add_user(self, user_id: int):
+        if self._hll is not None:
+            self._hll.add(user_id)
+        else:
+            self._user_refs[user_id] += 1
+
+    def _remove_user(self, user_id: int):
+        if self._hll is not None:
+            return  # HyperLogLog non supporta le rimozioni
+        refs = self._user_refs.get(user_id, 0)
+        if refs <= 1:
+            self._user_refs.pop(user_id, None)
+        else:
+            self._user_refs[user_id] = refs - 1
+
+    def _is_pending(self, guild_id: int) -> bool:
+        return self._pending is not None and guild_id in self._pending
+
+    def member_join(self, member):
+        guild = member.guild
+        self._set_guild_count(guild.id, self._member_counts.get(guild.id, 0) + 1)
+        if not self._is_pending(guild.id):
+            self._add_user(member.id)
+
+    def member_remove(self, member):
+        guild = member.guild
+        self._set_guild_count(guild.id, max(0, self._member_counts.get(guild.id, 0) - 1))
+        if not self._is_pending(guild.id):
+            self._remove_user(member.id)
+
+    async def guild_join(self, guild):
+        self._set_guild_count(guild.id, guild.member_count or 0)
+        await self._add_guild_members(guild)
+
+    async def guild_remove(self, guild):
+        self._total_members -= self._member_counts.pop(guild.id, 0)
+        self._unchunked.discard(guild.id)
+        if self._is_pending(guild.id):
+            self._pending.discard(guild.id)  # rebuild() non lo leggerà più
+            return
+        members = list(guild.members)
+        for start in range(0, len(members), REBUILD_BATCH):
+            for member in members[start:start + REBUILD_BATCH]:
+                self._remove_user(member.id)
+            await asyncio.sleep(0)
+
+    async def _add_guild_members(self, guild):
+        if not guild.chunked:
+            self._unchunked.add(guild.id)
+        # Da qui in poi gli eventi del server vanno applicati: la lista è già stata letta
+        members = list(guild.members)
+        for start in range(0, len(members), REBUILD_BATCH):
+            for member in members[start:start + REBUILD_BATCH]:
+                self._add_user(member.id)
+            await asyncio.sleep(0)
+
+    async def rebuild(self, guilds: Iterable):
+        """
+        Ricalcola tutto dalla cache (on_ready): i conteggi per server subito,
+        gli utenti unici a blocchi di REBUILD_BATCH membri cedendo il loop tra un blocco e l'altro.
+        """
+        guilds = list(guilds)
+        self._member_counts = {}
+        self._total_members = 0
+        for guild in guilds:
+            self._set_guild_count(guild.id, guild.member_count or 0)
+
+        self._user_refs = Counter()
+        self._unchunked = set()
+        if self._hll is not None:
+            self._hll.clear()
+
+        self._pending = {guild.id for guild in guilds}
+        try:
+            for guild in guilds:
+                if guild.id not in self._pending:
+                    continue  # Uscito durante la ricostruzione
+                self._pending.discard(guild.id)
+                await self._add_guild_members(guild)
+        finally:
+            self._pending = None
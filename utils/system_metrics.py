@@ -0,0 +1,125 @@
+"""
+📈 SYSTEM METRICS SAMPLER
+Campiona CPU, RAM, file descriptor e thread del processo su un thread dedicato a intervallo fisso.
+Gli ultimi campioni restano in un ring buffer; snapshot() non blocca e non usa lock,
+quindi è sicuro chiamarlo dall'event loop (on_ready, stats_logger) e dalla UI.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import psutil
+
+DEFAULT_INTERVAL = 5.0
+DEFAULT_HISTORY = 60
+
+
+class SystemMetricsSampler:
+    """
+    Thread daemon che raccoglie metriche di sistema e del processo.
+
+    Ogni campione è un dict nuovo che non viene più modificato: il thread lo aggiunge
+    al deque e poi sostituisce il riferimento a _latest. In CPython entrambe le operazioni
+    sono atomiche, per cui chi legge vede sempre un campione completo senza lock.
+
+    Usage:
+        sampler = SystemMetricsSampler(interval=5, history=60)
+        sampler.start()
+        sampler.snapshot()      # ultimo campione
+        sampler.history()       # campioni recenti, dal più vecchio
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, history: int = DEFAULT_HISTORY):
+        self.interval = max(0.5, float(interval))
+        self._samples: deque = deque(maxlen=max(1, int(history)))
+        self._latest: Optional[Dict[str, Any]] = None
+        self._process = psutil.Process(os.getpid())
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "SystemMetricsSampler":
+        """Opzioni dalla sezione "system_metrics" di config.json"""
+        metrics = config.get("system_metrics", {})
+        return cls(
+            interval=float(metrics.get("interval", DEFAULT_INTERVAL)),
+            history=int(metrics.get("history", DEFAULT_HISTORY)),
+        )
+
+    # ===== CICLO DI VITA =====
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        # Primo campione subito: cpu_percent(None) parte da zero, il valore reale arriva al giro dopo
+        self._prime()
+        self._thread = threading.Thread(target=self._run, name="system-metrics", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _prime(self):
+        psutil.cpu_percent(interval=None)
+        self._process.cpu_percent(interval=None)
+        self._record(self._sample())
+
+    def _run(self):
+        # wait() fa da timer: stop() interrompe subito l'attesa
+        while not self._stop.wait(self.interval):
+            try:
+                self._record(self._sample())
+            except Exception as e:
+                print(f"⚠️  System metrics: {e}")
+
+    def _record(self, sample: Dict[str, Any]):
+        self._samples.append(sample)
+        self._latest = sample
+
+    # ===== CAMPIONAMENTO (solo sul thread del sampler) =====
+
+    def _sample(self) -> Dict[str, Any]:
+        memory = psutil.virtual_memory()
+        process = self._process
+        with process.oneshot():
+            rss = process.memory_info().rss
+            threads = process.num_threads()
+            cpu_process = process.cpu_percent(interval=None)
+            if hasattr(process, "num_fds"):
+                fds = process.num_fds()
+            else:
+                fds = process.num_handles()  # Windows
+        return {
+            "timestamp": time.time(),
+            "cpu": psutil.cpu_percent(interval=None),
+            "cpu_process": cpu_process,
+            "ram": memory.percent,
+            "ram_used": memory.used,
+            "ram_total": memory.total,
+            "rss": rss,
+            "fds": fds,
+            "threads": threads,
+            "processes": len(psutil.pids()),
+        }
+
+    # ===== LETTURA (qualsiasi thread) =====
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Ultimo campione (dict vuoto se il sampler non è mai partito)"""
+        latest = self._latest
+        return dict(latest) if latest is not None else {}
+
+    def history(self) -> List[Dict[str, Any]]:
+        """Campioni nel ring buffer, dal più vecchio al più recente"""
+        return list(self._samples)